@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Measure the import time of the spavro modules and check it against a
+budget. Command line tools and short lived processes pay it on every run.
+
+Every module is imported in a new interpreter and the time of the import
+itself is taken (interpreter startup isn't counted), the best of --runs
+runs. The first run of each module is a warm up that also writes the
+bytecode caches.
+
+    python benchmark/import_time.py [--runs N] [--scale X]
+
+Exits with status 1 when a module is over its budget, --scale multiplies
+the budgets for slow machines.'''
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+# milliseconds, on top of six and json. Set from a baseline of best of 10
+# runs on python 3.11: spavro.schema 0.8ms, spavro.io 6.6ms,
+# spavro.datafile 7.7ms and spavro.ipc 10.3ms (9.0ms, 10.6ms and 13.1ms
+# before the imports of the extension were deferred) with ~25% headroom.
+budgets = {
+    'spavro.schema': 2,
+    'spavro.io': 8,
+    'spavro.datafile': 10,
+    'spavro.ipc': 13,
+}
+
+# the libraries spavro needs are imported first, they aren't part of what
+# spavro can change
+measure = '''
+import sys, time, json, six
+start = time.time()
+import {module}
+print((time.time() - start) * 1000)
+'''
+
+
+def import_time(module, runs):
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    times = []
+    for _ in range(runs + 1):
+        output = subprocess.check_output([sys.executable, '-c', measure.format(module=module)], env=env)
+        times.append(float(output))
+    return min(times[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--scale', type=float, default=1.0)
+    args = parser.parse_args()
+    over_budget = False
+    for module in sorted(budgets, key=budgets.get):
+        took = import_time(module, args.runs)
+        budget = budgets[module] * args.scale
+        status = 'ok' if took <= budget else 'OVER BUDGET'
+        over_budget = over_budget or took > budget
+        print('{:<18} {:6.1f}ms  budget {:6.1f}ms  {}'.format(module, took, budget, status))
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
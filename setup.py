@@ -4,6 +4,7 @@ try:
     from setuptools import setup
 except ImportError:
     from distutils.core import setup
+import re
 from sys import version_info
 from distutils.extension import Extension
 
@@ -23,6 +24,10 @@ extensions = [Extension("spavro.fast_binary", sources=["src/spavro/fast_binary"
 if USE_CYTHON:
     extensions = cythonize(extensions)
 
+# the version is kept in spavro/__init__.py, read without importing the package
+with open("src/spavro/__init__.py", "r") as initfile:
+    version = re.search(r"^__version__ = '([^']+)'", initfile.read(), re.M).group(1)
+
 try:
     with open("README.md", "r") as readmefile:
         readme_data = readmefile.read()
@@ -31,7 +36,7 @@ except IOError:
 
 setup(
   name='spavro',
-  version='1.1.22',
+  version=version,
   packages=['spavro'],
   package_dir={'': 'src'},
   # scripts=["./scripts/avro"],
@@ -16,3 +16,5 @@
 
 __all__ = ['schema', 'io', 'datafile', 'protocol', 'ipc']
 
+__version__ = '1.1.22'
+
@@ -0,0 +1,362 @@
+# Copyright (C) 2018 Pluralsight LLC
+'''Generate schema specialized reader source code.
+
+Where fast_binary builds a tree of closures calling each other, this module
+writes the Cython source of one flat function per record schema, with the
+field reads inlined, enum symbols and defaults bound as constants and no
+per-field indirection. The source is compiled with Cython (which has to be
+installed) and cached on disk.
+
+The source is a cdef class whose methods decode straight from the buffer of
+the BytesIO with the C helpers in cython_prelude, other file objects are
+read with the closure reader. Parts of a schema the generator doesn't
+specialize (converted logical types) are read with the closure reader for
+that part.'''
+
+import hashlib
+import os
+
+from spavro.fast_binary import get_reader, get_type, get_fullname, default_value
+
+
+# the C helpers of the Cython source, they read from the buffer at pos and
+# move pos past the value
+cython_prelude = '''
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+from libc.string cimport memcpy
+
+
+cdef inline Py_ssize_t take(Py_ssize_t length, Py_ssize_t* pos, long long count) except -1:
+    cdef Py_ssize_t start = pos[0]
+    if count < 0 or count > length - start:
+        raise EOFError("Unexpected end of avro data at byte {}".format(start))
+    pos[0] = start + count
+    return start
+
+
+cdef inline long long read_long(const unsigned char* buf, Py_ssize_t length, Py_ssize_t* pos) except? -1:
+    cdef unsigned long long accum = 0
+    cdef unsigned long long byte
+    cdef int shift = 0
+    while True:
+        byte = buf[take(length, pos, 1)]
+        accum |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return (accum >> 1) ^ -(accum & 1)
+        shift += 7
+        if shift > 63:
+            raise ValueError("Invalid long at byte {}, more than 10 bytes".format(pos[0]))
+
+
+cdef inline bint read_boolean(const unsigned char* buf, Py_ssize_t length, Py_ssize_t* pos) except -1:
+    return buf[take(length, pos, 1)] == 1
+
+
+cdef inline float read_float(const unsigned char* buf, Py_ssize_t length, Py_ssize_t* pos) except? -1:
+    cdef float value
+    memcpy(&value, buf + take(length, pos, 4), 4)
+    return value
+
+
+cdef inline double read_double(const unsigned char* buf, Py_ssize_t length, Py_ssize_t* pos) except? -1:
+    cdef double value
+    memcpy(&value, buf + take(length, pos, 8), 8)
+    return value
+
+
+cdef inline bytes read_fixed(const unsigned char* buf, Py_ssize_t length, Py_ssize_t* pos, long long size):
+    return PyBytes_FromStringAndSize(<const char*>buf + take(length, pos, size), size)
+
+
+cdef inline bytes read_bytes(const unsigned char* buf, Py_ssize_t length, Py_ssize_t* pos):
+    return read_fixed(buf, length, pos, read_long(buf, length, pos))
+
+
+cdef inline unicode read_utf8(const unsigned char* buf, Py_ssize_t length, Py_ssize_t* pos):
+    cdef long long size = read_long(buf, length, pos)
+    return PyUnicode_DecodeUTF8(<const char*>buf + take(length, pos, size), size, NULL)
+
+
+cdef inline object read_with(reader, fo, Py_ssize_t* pos):
+    # a closure reader reads from the file object itself
+    fo.seek(pos[0])
+    value = reader(fo)
+    pos[0] = fo.tell()
+    return value
+'''
+
+cython_reader_class = '''
+
+cdef class Reader:
+{attributes}
+    cdef object fallback
+
+    def __init__(self, dict constants):
+{assignments}
+        self.fallback = constants['fallback']
+
+    def __call__(self, fo):
+        cdef Py_buffer view
+        cdef Py_ssize_t position
+        try:
+            getbuffer = fo.getbuffer
+        except AttributeError:
+            return self.fallback(fo)
+        buffer = getbuffer()
+        PyObject_GetBuffer(buffer, &view, PyBUF_SIMPLE)
+        position = fo.tell()
+        try:
+            datum = self.read_datum(fo, <const unsigned char*>view.buf, view.len, &position)
+        finally:
+            PyBuffer_Release(&view)
+            # the BytesIO can't be resized while its buffer is exported
+            buffer.release()
+        fo.seek(position)
+        return datum
+'''
+
+primitive_readers = {
+    'null': None,
+    'boolean': 'read_boolean',
+    'int': 'read_long',
+    'long': 'read_long',
+    'float': 'read_float',
+    'double': 'read_double',
+    'bytes': 'read_bytes',
+    'string': 'read_utf8',
+}
+
+
+class ReaderSource(object):
+    '''Generates the Cython source for a reader of one (resolved) schema.
+    The generated code defines make_reader(constants) returning the reader,
+    the constants are attributes of a cdef class whose cdef methods are the
+    generated functions.'''
+    def __init__(self, schema, record_type='dict', **options):
+        if record_type not in ('dict', 'tuple'):
+            raise ValueError("Unknown record type for generated readers: {}".format(repr(record_type)))
+        self.record_type = record_type
+        self.options = options
+        self.constants = {}
+        # arguments of the primitive helpers and of the generated methods
+        self.buffer_args = 'buf, length, pos'
+        self.args = 'fo, buf, length, pos'
+        # the typed locals of the function being generated
+        self.typed_locals = []
+        self.named = {}
+        self.record_functions = {}
+        self.functions = []
+        self.counter = 0
+        body = self.function_body(schema)
+        self.functions.append(self.function('read_datum', body))
+        self.source = self.cython_source()
+
+    def name(self, prefix):
+        self.counter += 1
+        return '{}_{}'.format(prefix, self.counter)
+
+    def constant(self, prefix, value):
+        name = self.name(prefix)
+        self.constants[name] = value
+        return 'self.' + name
+
+    def typed_local(self, prefix):
+        '''A new C long long local of the function being generated'''
+        name = self.name(prefix)
+        self.typed_locals.append(name)
+        return name
+
+    def call(self, function):
+        '''Call a generated function'''
+        return 'self.{}({})'.format(function, self.args)
+
+    def function(self, name, body):
+        # cdef locals have to be declared at the top of the function
+        declarations = ['cdef long long {}'.format(local) for local in self.typed_locals]
+        return (['cdef {}(self, fo, const unsigned char* buf, Py_ssize_t length, Py_ssize_t* pos):'.format(name)] +
+                ['    ' + line for line in declarations + body])
+
+    def function_body(self, schema):
+        value = self.name('value')
+        return self.read(schema, value) + ['return ' + value]
+
+    def cython_source(self):
+        names = sorted(self.constants)
+        lines = ['# generated by spavro.codegen', cython_prelude, cython_reader_class.format(
+            attributes='\n'.join('    cdef object {}'.format(name) for name in names),
+            assignments='\n'.join('        self.{0} = constants[{0!r}]'.format(name) for name in names) or '        pass')]
+        for function in self.functions:
+            lines.append('')
+            lines.extend('    ' + line for line in function)
+        lines.extend(['', '', 'def make_reader(constants):', '    return Reader(constants)', ''])
+        return '\n'.join(lines)
+
+    def inline(self, schema):
+        '''Can schema be read by a single expression'''
+        return get_type(schema) not in ('array', 'map', 'union', 'skip')
+
+    def expression(self, schema):
+        '''Return a single expression reading schema, or None when statements
+        are needed (arrays, maps and unions)'''
+        schema_type = get_type(schema)
+        if isinstance(schema, dict) and 'logicalType' in schema and self.options.get('logical_types'):
+            reader = self.constant('logical', get_reader(schema, **self.options))
+            return 'read_with({}, fo, pos)'.format(reader)
+        if schema_type in primitive_readers:
+            reader = primitive_readers[schema_type]
+            return 'None' if reader is None else '{}({})'.format(reader, self.buffer_args)
+        if schema_type in ('enum', 'fixed', 'record', 'error'):
+            self.named[get_fullname(schema)] = schema
+        if schema_type == 'enum':
+            return '{}[read_long({})]'.format(self.constant('symbols', list(schema['symbols'])), self.buffer_args)
+        if schema_type == 'fixed':
+            return 'read_fixed({}, {:d})'.format(self.buffer_args, schema['size'])
+        if schema_type in ('record', 'error'):
+            return self.call(self.record_function(schema))
+        if schema_type == 'default':
+            return self.constant('default', default_value(schema, self.options))
+        if schema_type in self.named:
+            # a reference to a named type defined earlier
+            return self.expression(self.named[schema_type])
+        return None
+
+    def record_function(self, schema):
+        fullname = get_fullname(schema)
+        try:
+            return self.record_functions[fullname]
+        except KeyError:
+            pass
+        name = self.record_functions[fullname] = self.name('read_record')
+        # nested records are generated while this one is, each function
+        # declares its own locals
+        outer_locals, self.typed_locals = self.typed_locals, []
+        values = []
+        body = []
+        if not all(self.inline(field['type']) for field in schema['fields']):
+            # the record literal is evaluated last, so when any field needs
+            # statements every field is read into a local in order
+            for field in schema['fields']:
+                if get_type(field['type']) == 'skip':
+                    body.extend(self.read(field['type']['value'], None))
+                else:
+                    value = self.name('field')
+                    body.extend(self.read(field['type'], value))
+                    values.append((field['name'], value))
+        else:
+            values = [(field['name'], self.expression(field['type'])) for field in schema['fields']]
+        if self.record_type == 'dict':
+            record = '{' + ', '.join('{!r}: {}'.format(field_name, value) for field_name, value in values) + '}'
+        else:
+            record = '(' + ''.join('{}, '.format(value) for _, value in values) + ')'
+        self.functions.append(self.function(name, body + ['return ' + record]))
+        self.typed_locals = outer_locals
+        return name
+
+    def read(self, schema, target):
+        '''Return the statements that read schema into the local target
+        (None to discard the value)'''
+        assign = '' if target is None else target + ' = '
+        expression = self.expression(schema)
+        if expression is not None:
+            return [assign + expression]
+        schema_type = get_type(schema)
+        if schema_type == 'array':
+            return self.read_blocks(schema['items'], target, False)
+        if schema_type == 'map':
+            return self.read_blocks(schema['values'], target, True)
+        if schema_type == 'union':
+            return self.read_union(schema, target)
+        if schema_type == 'skip':
+            return self.read(schema['value'], None) + ([] if target is None else [target + ' = None'])
+        raise ValueError("Can't generate a reader for schema: {}".format(schema))
+
+    def read_blocks(self, schema, target, is_map):
+        count = self.typed_local('count')
+        counter = self.typed_local('counter')
+        item = self.name('item')
+        container = target or self.name('discard')
+        lines = ['{} = {}'.format(container, '{}' if is_map else '[]'),
+                 '{} = read_long({})'.format(count, self.buffer_args),
+                 'while {}:'.format(count),
+                 '    if {} < 0:'.format(count),
+                 '        {0} = -{0}'.format(count),
+                 '        read_long({})'.format(self.buffer_args),
+                 '    for {} in range({}):'.format(counter, count)]
+        if is_map:
+            key = self.name('key')
+            lines.append('        {} = read_utf8({})'.format(key, self.buffer_args))
+            store = '{}[{}] = {{}}'.format(container, key)
+        else:
+            store = '{}.append({{}})'.format(container)
+        expression = self.expression(schema)
+        if expression is not None:
+            lines.append('        ' + store.format(expression))
+        else:
+            lines.extend('        ' + line for line in self.read(schema, item))
+            lines.append('        ' + store.format(item))
+        lines.append('    {} = read_long({})'.format(count, self.buffer_args))
+        return lines
+
+    def read_union(self, schema, target):
+        index = self.typed_local('index')
+        lines = ['{} = read_long({})'.format(index, self.buffer_args)]
+        for branch_index, branch in enumerate(schema):
+            keyword = 'if' if branch_index == 0 else 'elif'
+            lines.append('{} {} == {}:'.format(keyword, index, branch_index))
+            lines.extend('    ' + line for line in self.read(branch, target) or ['pass'])
+        lines.append('else:')
+        lines.append('    raise TypeError("Unable to process union schema {{}}, union index \'{{}}\' doesn\'t exist.".format({!r}, {}))'.format(
+            repr(schema), index))
+        return lines
+
+
+def default_cache_dir():
+    return os.environ.get('SPAVRO_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'spavro'))
+
+
+def cython_module(source, cache_dir=None):
+    '''Compile generated source with Cython, the module is named after the
+    hash of the source so builds are reused across processes'''
+    import pyximport
+    cache_dir = cache_dir or default_cache_dir()
+    name = 'spavro_reader_' + hashlib.sha1(source.encode('utf-8')).hexdigest()
+    path = os.path.join(cache_dir, name + '.pyx')
+    if not os.path.exists(path):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # write then rename so concurrent processes never see a partial file
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w') as source_file:
+            source_file.write(source)
+        os.rename(temp_path, path)
+    # load_module needs the settings install() makes, the import hooks
+    # themselves aren't wanted so they are removed again right away
+    importers = pyximport.install(build_dir=os.path.join(cache_dir, 'build'), language_level=2)
+    try:
+        return pyximport.load_module(name, path, os.path.join(cache_dir, 'build'), language_level=2)
+    finally:
+        pyximport.uninstall(*importers)
+
+
+def fallback_reader(schema, options):
+    '''The closure reader, built on first use, for the generated Cython
+    readers to read file objects that don't expose their buffer'''
+    built = []
+
+    def read_fallback(fo):
+        if not built:
+            built.append(get_reader(schema, **options))
+        return built[0](fo)
+    return read_fallback
+
+
+def compile_reader(schema, cache_dir=None, **options):
+    '''Generate a reader for a (resolved) schema dict, used the same way as
+    fast_binary.get_reader, and build it with Cython into cache_dir (default
+    ~/.cache/spavro or $SPAVRO_CACHE_DIR).'''
+    generated = ReaderSource(schema, **options)
+    make_reader = cython_module(generated.source, cache_dir).make_reader
+    generated.constants['fallback'] = fallback_reader(schema, options)
+    return make_reader(generated.constants)
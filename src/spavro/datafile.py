@@ -44,13 +44,23 @@ MAGIC = b'Obj' + six.int2byte(VERSION)  # chr(VERSION)
 MAGIC_SIZE = len(MAGIC)
 SYNC_SIZE = 16
 SYNC_INTERVAL = 4000 * SYNC_SIZE # TODO(hammer): make configurable
-META_SCHEMA = schema.parse("""\
+META_SCHEMA_JSON = """\
 {"type": "record", "name": "org.apache.avro.file.Header",
  "fields" : [
      {"name": "magic", "type": {"type": "fixed", "name": "magic", "size": %d}},
      {"name": "meta", "type": {"type": "map", "values": "bytes"}},
      {"name": "sync", "type": {"type": "fixed", "name": "sync", "size": %d}}]}
-""" % (MAGIC_SIZE, SYNC_SIZE))
+""" % (MAGIC_SIZE, SYNC_SIZE)
+
+
+def get_meta_schema():
+    """The schema of the file header. It's parsed on first use rather than
+    at import, schema.parse caches it after that."""
+    return schema.parse(META_SCHEMA_JSON)
+
+
+META_SCHEMA = schema.LazyConstant(get_meta_schema)
+
 VALID_CODECS = ['null', 'deflate']
 if has_snappy:
         VALID_CODECS.append('snappy')
@@ -162,7 +172,7 @@ class DataFileWriter(object):
         header = {'magic': MAGIC,
                             'meta': self.meta,
                             'sync': self.sync_marker}
-        self.datum_writer.write_data(META_SCHEMA, header, self.encoder)
+        self.datum_writer.write_data(get_meta_schema(), header, self.encoder)
         self._header_written = True
 
     # TODO(hammer): make a schema for blocks and use datum_writer
@@ -221,6 +231,25 @@ class DataFileWriter(object):
         if self.buffer_writer.tell() >= SYNC_INTERVAL:
             self._write_block()
 
+    def append_json_lines(self, stream, avro_json=False):
+        """Append a datum for each line of JSON text in stream, transcoding
+        the text directly to the binary encoding. Blank lines are skipped."""
+        for line in stream:
+            if not line.strip():
+                continue
+            position = self.buffer_writer.tell()
+            try:
+                self.datum_writer.write_json(line, self.buffer_encoder, avro_json)
+            except Exception:
+                # drop the partially written datum from the block
+                self.buffer_writer.truncate(position)
+                self.buffer_writer.seek(position)
+                raise
+            self.block_count += 1
+
+            if self.buffer_writer.tell() >= SYNC_INTERVAL:
+                self._write_block()
+
     def sync(self):
         """
         Return the current position as a value that may be passed to
@@ -245,11 +274,19 @@ class DataFileReader(six.Iterator):
     """Read files written by DataFileWriter."""
     # TODO(hammer): allow user to specify expected schema?
     # TODO(hammer): allow user to specify the encoder
-    def __init__(self, reader, datum_reader):
+    def __init__(self, reader, datum_reader, reuse_records=False):
+        """With reuse_records every record is read into the same dict (see
+        FastDatumReader.read_into), so a record is only valid until the next
+        one is read. This saves allocating a dict per record when streaming
+        through a file. The file's schema must be a record schema and the
+        datum reader's record type 'dict' or 'lazy'."""
         self._reader = reader
         self._raw_decoder = io.BinaryDecoder(reader)
         self._datum_decoder = None # Maybe reset at every block.
         self._datum_reader = datum_reader
+        if reuse_records and not hasattr(datum_reader, 'check_read_into'):
+            raise DataFileException("The datum reader can't reuse records: {}".format(datum_reader))
+        self._record = None
         
         # read the header: magic, meta, sync
         self._read_header()
@@ -267,6 +304,12 @@ class DataFileReader(six.Iterator):
         # get ready to read
         self._block_count = 0
         self.datum_reader.writers_schema = schema.parse(self.get_meta(SCHEMA_KEY))
+        if reuse_records:
+            try:
+                self.datum_reader.check_read_into()
+            except ValueError as e:
+                raise DataFileException(str(e))
+            self._record = {}
 
     def __enter__(self):
         return self
@@ -318,7 +361,7 @@ class DataFileReader(six.Iterator):
 
         # read header into a dict
         header = self.datum_reader.read_data(
-            META_SCHEMA, META_SCHEMA, self.raw_decoder)
+            get_meta_schema(), get_meta_schema(), self.raw_decoder)
 
         # check magic number
         if header.get('magic') != MAGIC:
@@ -335,9 +378,10 @@ class DataFileReader(six.Iterator):
     def _read_block_header(self):
         self.block_count = self.raw_decoder.read_long()
         if self.codec == "null":
-            # Skip a long; we don't need to use the length.
-            self.raw_decoder.skip_long()
-            self._datum_decoder = self._raw_decoder
+            # the block is read into memory like the compressed codecs, so
+            # readers decode from a buffer instead of the file
+            data = self.raw_decoder.read_bytes()
+            self._datum_decoder = io.BinaryDecoder(StringIO(data))
         elif self.codec == 'deflate':
             # Compressed data is stored as (length, data), which
             # corresponds to how the "bytes" type is encoded.
@@ -387,7 +431,10 @@ class DataFileReader(six.Iterator):
             else:
                 self._read_block_header()
 
-        datum = self.datum_reader.read(self.datum_decoder) 
+        if self._record is None:
+            datum = self.datum_reader.read(self.datum_decoder)
+        else:
+            datum = self.datum_reader.read_into(self.datum_decoder, self._record)
         self.block_count -= 1
         return datum
 
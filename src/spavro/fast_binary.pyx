@@ -1,9 +1,11 @@
 # Copyright (C) 2018 Pluralsight LLC
-'''Fast Cython extension for reading / writing and validating AVRO records.
+'''Fast Cython extension for reading / writing and validating AVRO records,
+along with the Avro JSON encoding.
 
 The main edge this code has is that it parses the schema only once and creates
 a reader/writer call tree from the schema shape. All reads and writes then
 no longer consult the schema saving lookups.'''
+from __future__ import absolute_import
 
 import six
 INT_MIN_VALUE = -(1 << 31)
@@ -88,20 +90,46 @@ cdef unicode read_utf8(fo):
 
 # ======================================================================
 from collections import namedtuple
+from functools import partial
+from six import BytesIO
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+try:
+    from _thread import RLock
+except ImportError:
+    from threading import RLock
+from spavro.schema import LOGICAL_TYPES
 ReadField = namedtuple('ReadField', ['name', 'reader', 'skip'])
 WriteField = namedtuple('WriteField', ['name', 'writer'])
 
+# spavro.new_schema.Schema, new_schema sets it when it's imported so that
+# importing fast_binary doesn't import new_schema. Until then there are no
+# graph schemas and the empty tuple matches nothing.
+GraphSchema = ()
+
 cpdef unicode get_type(schema):
     if isinstance(schema, list):
         return u"union"
     elif isinstance(schema, dict):
         return unicode(schema['type'])  # "record"
+    elif isinstance(schema, GraphSchema):
+        return schema.type
     else:
         return unicode(schema)
 
 
-def make_union_reader(union_schema):
-    cdef list readers = [get_reader(schema) for schema in union_schema]
+def make_union_reader(union_schema, **options):
+    if len(union_schema) == 2 and 'null' in [get_type(schema) for schema in union_schema]:
+        return make_nullable_reader(union_schema, **options)
+    cdef list readers = []
+    for schema in union_schema:
+        if is_deferred(schema, options):
+            readers.append(deferred(get_reader, schema, deferral_scope(schema, False, options), options,
+                                    partial(readers.__setitem__, len(readers))))
+        else:
+            readers.append(get_reader(schema, **options))
 
     def union_reader(fo):
         '''Read the long index for which schema to process, then use that'''
@@ -110,29 +138,278 @@ def make_union_reader(union_schema):
             return readers[union_index](fo)
         except IndexError:
             raise TypeError("Unable to process union schema {}, union index '{}' doesn't exist. This is most likely because the read schema being used is not compatible with the write schema used to write the data.".format(repr(union_schema), union_index))
-    union_reader.__reduce__ = lambda: (make_union_reader, (union_schema,))
+    union_reader.__reduce__ = lambda: (partial(make_union_reader, **options), (union_schema,))
     return union_reader
 
 
-def make_record_reader(schema):
-    cdef list fields = [ReadField(field['name'], get_reader(field['type']), get_type(field['type']) == 'skip') for field in schema['fields']]
+def make_nullable_reader(union_schema, **options):
+    '''Reader for the common ["null", T] union, primitives are read inline'''
+    cdef int null_index
+    cdef int value_index
+    cdef int kind
+    null_index, value_schema, kind, _ = nullable_branches(union_schema, [get_type(schema) for schema in union_schema], options)
+    value_index = 1 - null_index
+    # a list so a lazily compiled reader can be put in place
+    cdef list value_reader = [None]
+    if is_deferred(value_schema, options):
+        value_reader[0] = deferred(get_reader, value_schema, deferral_scope(value_schema, False, options), options,
+                                   partial(value_reader.__setitem__, 0))
+    else:
+        value_reader[0] = get_reader(value_schema, **options)
+
+    def nullable_reader(fo):
+        cdef long long union_index = read_long(fo)
+        if union_index == null_index:
+            return None
+        if union_index != value_index:
+            raise TypeError("Unable to process union schema {}, union index '{}' doesn't exist. This is most likely because the read schema being used is not compatible with the write schema used to write the data.".format(repr(union_schema), union_index))
+        if kind == NULLABLE_STRING:
+            return read_utf8(fo)
+        elif kind == NULLABLE_DOUBLE:
+            return read_double(fo)
+        elif kind == NULLABLE_FLOAT:
+            return read_float(fo)
+        elif kind == NULLABLE_BOOLEAN:
+            return read_boolean(fo)
+        elif kind == NULLABLE_BYTES:
+            return read_bytes(fo)
+        return value_reader[0](fo)
+    nullable_reader.__reduce__ = lambda: (partial(make_union_reader, **options), (union_schema,))
+    return nullable_reader
+
+
+class SlotsRecord(object):
+    '''Base class for the ``__slots__`` record classes generated by the
+    'slots' record type. Instances behave like a lightweight mutable
+    namedtuple without a per-instance ``__dict__``.'''
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __iter__(self):
+        return iter([getattr(self, name) for name in self.__slots__])
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join(
+            "{}={!r}".format(name, getattr(self, name)) for name in self.__slots__))
+
+    def _asdict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+LazyLayout = namedtuple('LazyLayout', ['names', 'index', 'readers'])
+
+
+class LazyRecord(Mapping):
+    '''A read only mapping over the encoded bytes of a single record.
+
+    The record reader only skips over the fields to build the offset table,
+    a field is decoded the first time it's looked up and then kept. The
+    encoded record is available as ``raw`` so it can be forwarded without
+    re-encoding.'''
+    __slots__ = ('_layout', '_data', '_offsets', '_values', '_buffer')
+
+    def __init__(self, layout, data, offsets):
+        self._layout = layout
+        self._data = data
+        self._offsets = offsets
+        self._values = {}
+        self._buffer = None
+
+    raw = property(lambda self: self._data)
+
+    def __getitem__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        idx = self._layout.index[name]
+        if self._buffer is None:
+            self._buffer = BytesIO(self._data)
+        self._buffer.seek(self._offsets[idx])
+        value = self._layout.readers[idx](self._buffer)
+        self._values[name] = value
+        return value
+
+    def __contains__(self, name):
+        return name in self._layout.index
+
+    def __iter__(self):
+        return iter(self._layout.names)
+
+    def __len__(self):
+        return len(self._layout.names)
+
+    def __repr__(self):
+        return "<LazyRecord fields={}>".format(list(self._layout.names))
+
+    def to_dict(self):
+        '''Decode every field and return the record as a plain dict'''
+        return {name: self[name] for name in self._layout.names}
+
 
-    def record_reader(fo):
-        return {field.name: field.reader(fo) for field in fields if not (field.skip and field.reader(fo) is None)}
-    record_reader.__reduce__ = lambda: (make_record_reader, (schema,))
+record_class_cache = {}
+
+def get_record_class(record_type, schema, field_names):
+    '''Return the generated class for a record schema, there is one class
+    per record schema and field list so repeated compiles (e.g. opening many
+    container files) hand back the same type.'''
+    key = (record_type, get_fullname(schema), tuple(field_names))
+    try:
+        return record_class_cache[key]
+    except KeyError:
+        pass
+    # class names have to be plain identifiers, drop the namespace
+    class_name = str(schema['name'].split('.')[-1])
+    if record_type == 'namedtuple':
+        # avro allows field names with a leading underscore which namedtuple
+        # rejects, those fields are renamed to their position (_0, _1, ...)
+        record_class = namedtuple(class_name, [str(name) for name in field_names], rename=True)
+    else:
+        record_class = type(class_name, (SlotsRecord,), {'__slots__': tuple(str(name) for name in field_names)})
+    record_class_cache[key] = record_class
+    return record_class
+
+
+def factory_order(factory, field_names):
+    '''The positions in field_names of the positional parameters of a
+    record factory, None when it has to be called with keywords (it doesn't
+    take the fields as its first parameters or can't be inspected)'''
+    import inspect
+    try:
+        parameters = list(inspect.signature(factory).parameters.values())
+    except (AttributeError, TypeError, ValueError):
+        return None
+    names = [parameter.name for parameter in parameters[:len(field_names)]
+             if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)]
+    if sorted(names) != sorted(field_names):
+        return None
+    return [field_names.index(name) for name in names]
+
+
+def make_record_reader(schema, **options):
+    '''Create a record reader, the ``record_type`` option picks the python
+    container for each record: 'dict' (the default), 'tuple', 'namedtuple',
+    'slots' or 'lazy'. Tuple based types hold the fields in the order they are
+    decoded. 'lazy' records are LazyRecord views that decode fields on first
+    access, this needs a seekable file object.
+
+    The ``record_factory`` option maps record full names to callables (e.g.
+    dataclasses, attrs or slots classes) that are called with the fields
+    instead, positionally when their parameters are the field names.'''
+    cdef list fields = [ReadField(field['name'], get_reader(field['type'], **options), get_type(field['type']) == 'skip') for field in schema['fields']]
+    record_type = options.get('record_type', 'dict')
+    record_factory = (options.get('record_factory') or {}).get(get_fullname(schema))
+
+    if record_factory is not None:
+        field_names = [field.name for field in fields if not field.skip]
+        order = factory_order(record_factory, field_names)
+        if order is None:
+            def record_reader(fo):
+                return record_factory(**{field.name: field.reader(fo) for field in fields if not (field.skip and field.reader(fo) is None)})
+        elif order == list(range(len(field_names))):
+            def record_reader(fo):
+                return record_factory(*[field.reader(fo) for field in fields if not (field.skip and field.reader(fo) is None)])
+        else:
+            def record_reader(fo):
+                cdef list values = [field.reader(fo) for field in fields if not (field.skip and field.reader(fo) is None)]
+                return record_factory(*[values[index] for index in order])
+    elif record_type == 'dict':
+        def record_reader(fo):
+            return {field.name: field.reader(fo) for field in fields if not (field.skip and field.reader(fo) is None)}
+        record_reader.read_into = make_record_filler(fields)
+    elif record_type == 'tuple':
+        def record_reader(fo):
+            return tuple([field.reader(fo) for field in fields if not (field.skip and field.reader(fo) is None)])
+    elif record_type == 'namedtuple':
+        record_class = get_record_class(record_type, schema, [field.name for field in fields if not field.skip])
+        make_record = record_class._make
+
+        def record_reader(fo):
+            return make_record([field.reader(fo) for field in fields if not (field.skip and field.reader(fo) is None)])
+    elif record_type == 'lazy':
+        # the skip pass only walks the encoding to find each field's offset,
+        # fields are decoded by the LazyRecord when they are looked up
+        names = [field.name for field in fields if not field.skip]
+        layout = LazyLayout(names, {name: idx for idx, name in enumerate(names)},
+                            [field.reader for field in fields if not field.skip])
+        skip_fields = [(get_skipper(field['type']), read_field.skip) for field, read_field in zip(schema['fields'], fields)]
+
+        def record_reader(fo):
+            start = fo.tell()
+            offsets = []
+            for skipper, skip in skip_fields:
+                if not skip:
+                    offsets.append(fo.tell() - start)
+                skipper(fo)
+            end = fo.tell()
+            fo.seek(start)
+            return LazyRecord(layout, fo.read(end - start), offsets)
+    elif record_type == 'slots':
+        record_class = get_record_class(record_type, schema, [field.name for field in fields if not field.skip])
+        new_record = record_class.__new__
+
+        def record_reader(fo):
+            record = new_record(record_class)
+            for field in fields:
+                if field.skip:
+                    field.reader(fo)
+                else:
+                    setattr(record, field.name, field.reader(fo))
+            return record
+    else:
+        raise ValueError("Unknown record type: {}".format(repr(record_type)))
+    record_reader.__reduce__ = lambda: (partial(make_record_reader, **options), (schema,))
     return record_reader
 
 
-def make_enum_reader(schema):
-    cdef list symbols = schema['symbols']
+def make_record_filler(list fields):
+    '''Return read_into(fo, record) for a 'dict' record reader, it reads the
+    record into an existing dict (e.g. the one of the previous record) and
+    returns it. Nested records that are dicts already are refilled too.'''
+    cdef list fillers = [(field.name, field.reader, field.skip, getattr(field.reader, 'read_into', None))
+                         for field in fields]
+
+    def read_into(fo, dict record):
+        for name, reader, skip, fill in fillers:
+            if skip:
+                reader(fo)
+            elif fill is not None and type(record.get(name)) is dict:
+                fill(fo, record[name])
+            else:
+                record[name] = reader(fo)
+        return record
+    return read_into
+
+
+def make_enum_reader(schema, **options):
+    cdef list symbols = list(schema['symbols'])
 
     def enum_reader(fo):
         return symbols[read_long(fo)]
     enum_reader.__reduce__ = lambda: (make_enum_reader, (schema,))
     return enum_reader
 
-def make_array_reader(schema):
-    item_reader = get_reader(schema['items'])
+def make_array_reader(schema, **options):
+    '''Create an array reader, arrays are lists unless the ``array_type``
+    option is 'array' or 'numpy': arrays of numbers are then read into
+    array.array or numpy arrays (see make_numeric_array_reader)'''
+    array_type = options.get('array_type', 'list')
+    if array_type not in ('list', 'array', 'numpy'):
+        raise ValueError("Unknown array type: {}".format(repr(array_type)))
+    if array_type != 'list' and is_numeric_array(schema, options):
+        return make_numeric_array_reader(schema, **options)
+    item_reader = get_reader(schema['items'], **options)
     def array_reader(fo):
         cdef long block_count
         cdef list read_items = []
@@ -145,11 +422,11 @@ def make_array_reader(schema):
                 read_items.append(item_reader(fo))
             block_count = read_long(fo)
         return read_items
-    array_reader.__reduce__ = lambda: (make_array_reader, (schema,))
+    array_reader.__reduce__ = lambda: (partial(make_array_reader, **options), (schema,))
     return array_reader
 
-def make_map_reader(schema):
-    value_reader = get_reader(schema['values'])
+def make_map_reader(schema, **options):
+    value_reader = get_reader(schema['values'], **options)
 
     def map_reader(fo):
         cdef long block_count = read_long(fo)
@@ -163,10 +440,10 @@ def make_map_reader(schema):
                 read_items[key] = value_reader(fo)
             block_count = read_long(fo)
         return read_items
-    map_reader.__reduce__ = lambda: (make_map_reader, (schema,))
+    map_reader.__reduce__ = lambda: (partial(make_map_reader, **options), (schema,))
     return map_reader
 
-def make_fixed_reader(schema):
+def make_fixed_reader(schema, **options):
     cdef long size = schema['size']
 
     def fixed_reader(fo):
@@ -174,50 +451,51 @@ def make_fixed_reader(schema):
     fixed_reader.__reduce__ = lambda: (make_fixed_reader, (schema,))
     return fixed_reader
 
-def make_null_reader(schema):
+def make_null_reader(schema, **options):
     return read_null
 
-def make_string_reader(schema):
+def make_string_reader(schema, **options):
     return read_utf8
 
-def make_boolean_reader(schema):
+def make_boolean_reader(schema, **options):
     return read_boolean
 
-def make_double_reader(schema):
+def make_double_reader(schema, **options):
     return read_double
 
-def make_long_reader(schema):
+def make_long_reader(schema, **options):
     return read_long
 
-def make_byte_reader(schema):
+def make_byte_reader(schema, **options):
     return read_bytes
 
-def make_float_reader(schema):
+def make_float_reader(schema, **options):
     return read_float
 
 
-def make_skip_reader(schema):
+def make_skip_reader(schema, **options):
     # this will create a regular reader that will iterate the bytes
     # in the avro stream properly
-    value_reader = get_reader(schema['value'])
+    value_reader = get_reader(schema['value'], **options)
     def read_skip(fo):
         value_reader(fo)
         return None
-    read_skip.__reduce__ = lambda: (make_skip_reader, (schema,))
+    read_skip.__reduce__ = lambda: (partial(make_skip_reader, **options), (schema,))
     return read_skip
 
 
-def make_default_reader(schema):
-    value = schema["value"]
+def make_default_reader(schema, **options):
+    value = default_value(schema, options)
     def read_default(fo):
         return value
-    read_default.__reduce__ = lambda: (make_default_reader, (schema,))
+    read_default.__reduce__ = lambda: (partial(make_default_reader, **options), (schema,))
     return read_default
 
 
 reader_type_map = {
     'union': make_union_reader,
     'record': make_record_reader,
+    'error': make_record_reader,
     'null': make_null_reader,
     'string': make_string_reader,
     'boolean': make_boolean_reader,
@@ -236,42 +514,1523 @@ reader_type_map = {
 
 schema_cache = {}
 
-class ReaderPlaceholder(object):
-    def __init__(self):
-        self.reader = None
+
+cdef class Placeholder:
+    '''Stands in for the function compiled for a named type while the type
+    is being compiled, for the recursive references to it. References made
+    once the type is done are linked to the function itself (see linked).'''
+    cdef public object target
+
+
+cdef inline linked(placeholder):
+    '''The function behind a placeholder, or the placeholder while its type
+    is still being compiled'''
+    if isinstance(placeholder, Placeholder) and (<Placeholder>placeholder).target is not None:
+        return (<Placeholder>placeholder).target
+    return placeholder
+
+
+cdef class ReaderPlaceholder(Placeholder):
+    @property
+    def reader(self):
+        return self.target
+
+    @reader.setter
+    def reader(self, reader):
+        self.target = reader
 
     def __call__(self, fo):
-        return self.reader(fo)
+        return self.target(fo)
+
+def get_fullname(schema):
+    '''Return the namespace qualified name of a named schema'''
+    if isinstance(schema, GraphSchema):
+        return schema.fullname
+    namespace = schema.get('namespace')
+    name = schema.get('name')
+    if namespace and "." not in name:
+        return '.'.join([namespace, name])
+    return name
+
+
+# what has been compiled for the named schemas of a schema graph in the
+# current top level compile, by kind ('reader', 'writer', ...) and schema
+graph_links = None
+
+
+def compile_graph(kind, schema, make):
+    '''Compile (with make) a part of a schema graph (spavro.new_schema).
+
+    A reference to a named type in a graph is the named schema object itself
+    rather than its name, so every named schema is compiled once per top
+    level compile and recursive references get a placeholder that is bound
+    once the named schema is done.'''
+    global graph_links
+    outermost = graph_links is None
+    if outermost:
+        graph_links = {}
+    try:
+        if not schema.named:
+            return make()
+        key = (kind, schema)
+        try:
+            return graph_links[key]
+        except KeyError:
+            pass
+        placeholder = WriterPlaceholder() if kind == 'writer' else ReaderPlaceholder()
+        graph_links[key] = placeholder
+        compiled = make()
+        if kind == 'writer':
+            placeholder.writer = compiled
+        else:
+            placeholder.reader = compiled
+        graph_links[key] = compiled
+        return compiled
+    finally:
+        if outermost:
+            graph_links = None
+
+
+# ======================================================================
+# lazy compilation (the ``lazy`` option): union branches holding a record,
+# array or map are compiled when data of that branch is first met
+
+deferred_types = frozenset(['record', 'error', 'array', 'map'])
 
-def get_reader(schema):
+# compiling a deferred branch binds the names it refers to in schema_cache
+# and custom_schema for the time of the compile, the lock keeps compiles in
+# other threads from seeing those bindings (or changing them)
+compile_lock = RLock()
+
+
+def is_deferred(schema, dict options):
+    '''Is this union branch compiled lazily'''
+    return bool(options.get('lazy')) and not isinstance(schema, unicode) and get_type(schema) in deferred_types
+
+
+def scan_names(schema, list defined, set referenced):
+    '''Collect the named types defined in a schema dict and the names it
+    refers to'''
+    if isinstance(schema, list):
+        for branch in schema:
+            scan_names(branch, defined, referenced)
+        return
+    if not isinstance(schema, dict):
+        if schema not in reader_type_map:
+            referenced.add(schema)
+        return
+    schema_type = schema['type']
+    if schema_type in ('record', 'error', 'enum', 'fixed'):
+        defined.append((get_fullname(schema), schema))
+    if schema_type in ('record', 'error'):
+        for field in schema['fields']:
+            scan_names(field['type'], defined, referenced)
+    elif schema_type in ('array', 'map'):
+        scan_names(schema['items' if schema_type == 'array' else 'values'], defined, referenced)
+    elif schema_type == 'skip':
+        scan_names(schema['value'], defined, referenced)
+    elif schema_type not in reader_type_map:
+        # {"type": "name"}
+        referenced.add(schema_type)
+
+
+def compile_in_scope(compile, schema, dict scope, dict options):
+    '''Compile a deferred schema with the named types it refers to bound as
+    they were when it was deferred, rather than to whatever was compiled
+    under those names since'''
+    with compile_lock:
+        saved = {name: (schema_cache.get(name), custom_schema.get(name)) for name in scope}
+        for name, (compiled, definition) in scope.items():
+            schema_cache[name] = compiled
+            if definition is not None:
+                custom_schema[name] = definition
+        try:
+            return compile(schema, **options)
+        finally:
+            for name, (compiled, definition) in saved.items():
+                for cache, value in ((schema_cache, compiled), (custom_schema, definition)):
+                    if value is None:
+                        cache.pop(name, None)
+                    else:
+                        cache[name] = value
+
+
+def deferral_scope(schema, bint writer, dict options):
+    '''Return the named types a deferred schema refers to, by name, as
+    (compiled, definition) pairs.
+
+    Named types defined in the schema are registered right away with a
+    deferred reader or writer of their own, so the rest of the tree can
+    refer to them before the branch holding them has been compiled.'''
+    cdef list defined = []
+    cdef set referenced = set()
+    cdef dict scope = {}
+    if isinstance(schema, GraphSchema):
+        # graphs refer to named types directly, there are no names to bind
+        return scope
+    scan_names(schema, defined, referenced)
+    for name in referenced:
+        if name in schema_cache:
+            scope[name] = (schema_cache[name], custom_schema.get(name))
+    for fullname, definition in defined:
+        placeholder = WriterPlaceholder() if writer else ReaderPlaceholder()
+        scope[fullname] = (placeholder, definition if writer else None)
+    compile = get_writer if writer else get_reader
+    attribute = 'writer' if writer else 'reader'
+    for fullname, definition in defined:
+        placeholder = scope[fullname][0]
+        setattr(placeholder, attribute, deferred(compile, definition, scope, options,
+                                                 partial(setattr, placeholder, attribute)))
+        schema_cache[fullname] = placeholder
+        if writer:
+            custom_schema[fullname] = definition
+    return scope
+
+
+def deferred(compile, schema, dict scope, dict options, patch):
+    '''Return a stand in for compile(schema, **options) that compiles the
+    schema in its scope on the first call, hands the result to patch (which
+    puts it in place of the stand in) and then runs it'''
+    compiled = []
+
+    def compile_and_call(*args):
+        if not compiled:
+            with compile_lock:
+                # another thread may have compiled it meanwhile
+                if not compiled:
+                    compiled.append(compile_in_scope(compile, schema, scope, options))
+                    patch(compiled[0])
+        return compiled[0](*args)
+    return compile_and_call
+
+
+def get_reader(schema, **options):
+    '''Create the reader function for a schema, ``options`` are passed down
+    to every reader maker in the tree (see ``make_record_reader``). The
+    schema is a schema dict (list or name) or a schema graph built by
+    spavro.new_schema.parse_schema.
+
+    With ``lazy=True`` the union branches holding a record, array or map
+    are compiled the first time data of that branch is read and then put in
+    place, so readers of huge schemas are built fast and only compile what
+    the data uses. Errors in those branches show up when they're compiled.'''
+    cdef unicode schema_type = get_type(schema)
+    with compile_lock:
+        if isinstance(schema, GraphSchema):
+            return compile_graph('reader', schema, lambda: logical_reader(schema, reader_type_map[schema_type](schema, **options), options))
+        if schema_type in ('record', 'fixed', 'enum'):
+            placeholder = ReaderPlaceholder()
+            # using a placeholder because this is recursive and the reader isn't defined
+            # yet and nested records might refer to this parent schema name
+            fullname = get_fullname(schema)
+            schema_cache[fullname] = placeholder
+            reader = logical_reader(schema, reader_type_map[schema_type](schema, **options), options)
+            # now that we've returned, assign the reader to the placeholder
+            # so that the execution will work
+            placeholder.reader = reader
+            return reader
+        try:
+            reader = logical_reader(schema, reader_type_map[schema_type](schema, **options), options)
+        except KeyError:
+            reader = linked(schema_cache[schema_type])
+
+        return reader
+
+# ======================================================================
+# skippers walk over a datum in the stream without building python objects,
+# they're used to find field offsets for lazily decoded records
+
+cdef int skip_over(fo, long long size) except -1:
+    '''Move past size bytes, reading them so a truncated stream raises
+    EOFError (seeking past the end of a file doesn't)'''
+    if len(fo.read(size)) != size:
+        raise EOFError("Unexpected end of avro data")
+    return 0
+
+
+cdef int skip_nothing(fo) except -1:
+    return 0
+
+
+cdef int skip_boolean(fo) except -1:
+    return skip_over(fo, 1)
+
+
+cdef int skip_long(fo) except -1:
+    cdef bytes raw
+    while True:
+        raw = fo.read(1)
+        if not raw:
+            raise EOFError("Unexpected end of avro data")
+        if not (<unsigned char>raw[0]) & 0x80:
+            return 0
+
+
+cdef int skip_float(fo) except -1:
+    return skip_over(fo, 4)
+
+
+cdef int skip_double(fo) except -1:
+    return skip_over(fo, 8)
+
+
+cdef int skip_bytes(fo) except -1:
+    return skip_over(fo, read_long(fo))
+
+
+def make_union_skipper(union_schema):
+    cdef list skippers = [get_skipper(schema) for schema in union_schema]
+
+    def union_skipper(fo):
+        skippers[read_long(fo)](fo)
+    return union_skipper
+
+
+def make_record_skipper(schema):
+    cdef list skippers = [get_skipper(field['type']) for field in schema['fields']]
+
+    def record_skipper(fo):
+        for skipper in skippers:
+            skipper(fo)
+    return record_skipper
+
+
+def make_fixed_skipper(schema):
+    cdef long size = schema['size']
+
+    def fixed_skipper(fo):
+        skip_over(fo, size)
+    return fixed_skipper
+
+
+def make_array_skipper(schema):
+    item_skipper = get_skipper(schema['items'])
+
+    def array_skipper(fo):
+        cdef long long block_count = read_long(fo)
+        while block_count != 0:
+            if block_count < 0:
+                # negative counts are followed by the block size in bytes
+                # so the whole block can be jumped over
+                skip_over(fo, read_long(fo))
+            else:
+                for _ in range(block_count):
+                    item_skipper(fo)
+            block_count = read_long(fo)
+    return array_skipper
+
+
+def make_map_skipper(schema):
+    value_skipper = get_skipper(schema['values'])
+
+    def map_skipper(fo):
+        cdef long long block_count = read_long(fo)
+        while block_count != 0:
+            if block_count < 0:
+                skip_over(fo, read_long(fo))
+            else:
+                for _ in range(block_count):
+                    skip_bytes(fo)
+                    value_skipper(fo)
+            block_count = read_long(fo)
+    return map_skipper
+
+
+def make_skip_skipper(schema):
+    return get_skipper(schema['value'])
+
+
+skipper_type_map = {
+    'union': make_union_skipper,
+    'record': make_record_skipper,
+    'error': make_record_skipper,
+    'null': lambda schema: skip_nothing,
+    'string': lambda schema: skip_bytes,
+    'boolean': lambda schema: skip_boolean,
+    'double': lambda schema: skip_double,
+    'float': lambda schema: skip_float,
+    'long': lambda schema: skip_long,
+    'bytes': lambda schema: skip_bytes,
+    'int': lambda schema: skip_long,
+    'fixed': make_fixed_skipper,
+    'enum': lambda schema: skip_long,
+    'array': make_array_skipper,
+    'map': make_map_skipper,
+    'skip': make_skip_skipper,
+    'default': lambda schema: skip_nothing
+}
+
+skipper_cache = {}
+
+
+def get_skipper(schema):
+    '''Create a function that moves the file object past a datum of the
+    given schema'''
     cdef unicode schema_type = get_type(schema)
+    if isinstance(schema, GraphSchema):
+        return compile_graph('skipper', schema, lambda: skipper_type_map[schema_type](schema))
     if schema_type in ('record', 'fixed', 'enum'):
         placeholder = ReaderPlaceholder()
-        # using a placeholder because this is recursive and the reader isn't defined
-        # yet and nested records might refer to this parent schema name
-        namespace = schema.get('namespace')
-        name = schema.get('name')
-        if namespace and "." not in name:
-           fullname = '.'.join([namespace, name])
-        else:
-            fullname = name
-        schema_cache[fullname] = placeholder
-        reader = reader_type_map[schema_type](schema)
-        # now that we've returned, assign the reader to the placeholder
-        # so that the execution will work
-        placeholder.reader = reader
-        return reader
+        skipper_cache[get_fullname(schema)] = placeholder
+        skipper = skipper_type_map[schema_type](schema)
+        placeholder.reader = skipper
+        return skipper
     try:
-        reader = reader_type_map[schema_type](schema)
+        skipper = skipper_type_map[schema_type](schema)
     except KeyError:
-        reader = schema_cache[schema_type]
+        skipper = linked(skipper_cache[schema_type])
+    return skipper
 
-    return reader
+# ======================================================================
+# the bytecode engine compiles a (resolved) schema into a flat array of
+# opcodes that a single C loop runs over the bytes of an in memory file.
+# Python objects are only created for the values themselves, there are no
+# python calls between the fields of a record.
+
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+from libc.stdlib cimport malloc, realloc, free
+from libc.string cimport memcpy
+
+cdef enum Opcode:
+    OP_NULL
+    OP_BOOLEAN
+    OP_LONG
+    OP_FLOAT
+    OP_DOUBLE
+    OP_BYTES
+    OP_STRING
+    OP_FIXED        # size
+    OP_ENUM         # constant index of the symbols
+    OP_CONST        # constant index of the value
+    OP_SKIP         # number of bytes
+    OP_SKIP_LONG
+    OP_SKIP_BYTES
+    OP_POP
+    OP_UNION        # branch count, then the offset of each branch
+    OP_JUMP         # offset
+    OP_ARRAY_START  # offset past the loop
+    OP_ARRAY_NEXT   # offset of the loop body
+    OP_MAP_START    # offset past the loop
+    OP_MAP_NEXT     # offset of the loop body
+    OP_CALL         # offset
+    OP_RETURN
+    OP_DICT         # constant index of the field names
+    OP_TUPLE        # field count
+    OP_MAKE         # constant index of the record factory, field count
+    OP_READER       # constant index of a closure reader
+    OP_END
+
+# bumped whenever the opcodes or their arguments change, plans stored with
+# another format aren't loaded (see spavro.plan_cache)
+PROGRAM_FORMAT = 1
+
+# name and argument count of each opcode, for disassembling
+opcode_info = [
+    ('NULL', 0), ('BOOLEAN', 0), ('LONG', 0), ('FLOAT', 0), ('DOUBLE', 0),
+    ('BYTES', 0), ('STRING', 0), ('FIXED', 1), ('ENUM', 1), ('CONST', 1),
+    ('SKIP', 1), ('SKIP_LONG', 0), ('SKIP_BYTES', 0), ('POP', 0),
+    ('UNION', 1), ('JUMP', 1), ('ARRAY_START', 1), ('ARRAY_NEXT', 1),
+    ('MAP_START', 1), ('MAP_NEXT', 1), ('CALL', 1), ('RETURN', 0),
+    ('DICT', 1), ('TUPLE', 1), ('MAKE', 2), ('READER', 1), ('END', 0),
+]
+
+primitive_opcodes = {
+    'null': OP_NULL,
+    'boolean': OP_BOOLEAN,
+    'int': OP_LONG,
+    'long': OP_LONG,
+    'float': OP_FLOAT,
+    'double': OP_DOUBLE,
+    'bytes': OP_BYTES,
+    'string': OP_STRING,
+}
+
+
+class ProgramCompiler(object):
+    '''Compiles a (resolved) schema dict to the opcode list and constants of
+    a Program. Records are compiled once, where they are defined, as a
+    subroutine that every use of the record calls.'''
+    def __init__(self, schema, **options):
+        self.record_type = options.get('record_type', 'dict')
+        if self.record_type not in ('dict', 'tuple', 'namedtuple'):
+            raise ValueError("Unknown record type for the bytecode engine: {}".format(repr(self.record_type)))
+        self.options = options
+        self.code = []
+        self.constants = []
+        self.named = {}
+        self.records = {}
+        self.emit_read(schema)
+        self.code.append(OP_END)
+
+    def constant(self, value):
+        self.constants.append(value)
+        return len(self.constants) - 1
+
+    def emit_read(self, schema):
+        cdef unicode schema_type = get_type(schema)
+        if get_logical_type(schema, self.options) is not None:
+            self.code.extend([OP_READER, self.constant(get_reader(schema, **self.options))])
+        elif schema_type in primitive_opcodes:
+            self.code.append(primitive_opcodes[schema_type])
+        elif schema_type == 'enum':
+            self.named[get_fullname(schema)] = schema
+            self.code.extend([OP_ENUM, self.constant(list(schema['symbols']))])
+        elif schema_type == 'fixed':
+            self.named[get_fullname(schema)] = schema
+            self.code.extend([OP_FIXED, schema['size']])
+        elif schema_type in ('record', 'error'):
+            self.emit_record(schema)
+        elif schema_type == 'array':
+            self.emit_blocks(schema['items'], OP_ARRAY_START, OP_ARRAY_NEXT)
+        elif schema_type == 'map':
+            self.emit_blocks(schema['values'], OP_MAP_START, OP_MAP_NEXT)
+        elif schema_type == 'union':
+            self.emit_union(schema)
+        elif schema_type == 'skip':
+            self.emit_skip(schema['value'])
+            self.code.append(OP_NULL)
+        elif schema_type == 'default':
+            self.code.extend([OP_CONST, self.constant(default_value(schema, self.options))])
+        elif schema_type in self.named:
+            self.emit_read(self.named[schema_type])
+        else:
+            raise ValueError("Can't compile a reader for schema: {}".format(schema))
+
+    def emit_skip(self, schema):
+        cdef unicode schema_type = get_type(schema)
+        if schema_type in self.named:
+            schema = self.named[schema_type]
+            schema_type = get_type(schema)
+        if schema_type in ('enum', 'fixed'):
+            self.named[get_fullname(schema)] = schema
+        if schema_type == 'null':
+            pass
+        elif schema_type == 'boolean':
+            self.code.extend([OP_SKIP, 1])
+        elif schema_type in ('int', 'long', 'enum'):
+            self.code.append(OP_SKIP_LONG)
+        elif schema_type == 'float':
+            self.code.extend([OP_SKIP, 4])
+        elif schema_type == 'double':
+            self.code.extend([OP_SKIP, 8])
+        elif schema_type in ('bytes', 'string'):
+            self.code.append(OP_SKIP_BYTES)
+        elif schema_type == 'fixed':
+            self.code.extend([OP_SKIP, schema['size']])
+        else:
+            self.emit_read(schema)
+            self.code.append(OP_POP)
+
+    def emit_record(self, schema):
+        fullname = get_fullname(schema)
+        self.named[fullname] = schema
+        if fullname not in self.records:
+            # the body is placed inline and jumped over, the record is
+            # registered before its fields so recursive references resolve
+            self.code.extend([OP_JUMP, 0])
+            jump = len(self.code) - 1
+            self.records[fullname] = len(self.code)
+            names = []
+            for field in schema['fields']:
+                if get_type(field['type']) == 'skip':
+                    self.emit_skip(field['type']['value'])
+                else:
+                    self.emit_read(field['type'])
+                    names.append(field['name'])
+            if self.record_type == 'dict':
+                self.code.extend([OP_DICT, self.constant(tuple(names))])
+            elif self.record_type == 'tuple':
+                self.code.extend([OP_TUPLE, len(names)])
+            else:
+                record_class = get_record_class(self.record_type, schema, names)
+                self.code.extend([OP_MAKE, self.constant(record_class._make), len(names)])
+            self.code.append(OP_RETURN)
+            self.code[jump] = len(self.code)
+        self.code.extend([OP_CALL, self.records[fullname]])
+
+    def emit_blocks(self, schema, start_opcode, next_opcode):
+        self.code.extend([start_opcode, 0])
+        start = len(self.code) - 1
+        body = len(self.code)
+        if start_opcode == OP_MAP_START:
+            self.code.append(OP_STRING)
+        self.emit_read(schema)
+        self.code.extend([next_opcode, body])
+        self.code[start] = len(self.code)
+
+    def emit_union(self, schema):
+        self.code.extend([OP_UNION, len(schema)])
+        table = len(self.code)
+        self.code.extend([0] * len(schema))
+        jumps = []
+        for index, branch in enumerate(schema):
+            self.code[table + index] = len(self.code)
+            self.emit_read(branch)
+            self.code.extend([OP_JUMP, 0])
+            jumps.append(len(self.code) - 1)
+        for jump in jumps:
+            self.code[jump] = len(self.code)
+
+
+cdef struct Counters:
+    long long* items
+    Py_ssize_t top
+    Py_ssize_t size
+
+
+cdef int push_counter(Counters* counters, long long value) except -1:
+    cdef long long* items
+    if counters.top + 1 == counters.size:
+        items = <long long*>realloc(counters.items, 2 * counters.size * sizeof(long long))
+        if items == NULL:
+            raise MemoryError()
+        counters.items = items
+        counters.size *= 2
+    counters.top += 1
+    counters.items[counters.top] = value
+    return 0
+
+
+cdef inline Py_ssize_t take(Py_ssize_t length, Py_ssize_t* position, long long count) except -1:
+    '''Move the position past count bytes and return where they start'''
+    cdef Py_ssize_t start = position[0]
+    if count < 0 or count > length - start:
+        raise EOFError("Unexpected end of avro data at byte {}".format(start))
+    position[0] = start + count
+    return start
+
+
+cdef inline long long read_varint(const unsigned char* buf, Py_ssize_t length, Py_ssize_t* position) except? -1:
+    '''Read a zig-zag encoded long from the buffer'''
+    cdef unsigned long long accum = 0
+    cdef unsigned long long byte
+    cdef int shift = 0
+    cdef Py_ssize_t pos = position[0]
+    while True:
+        if pos >= length:
+            raise EOFError("Unexpected end of avro data at byte {}".format(pos))
+        byte = buf[pos]
+        pos += 1
+        accum |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+        if shift > 63:
+            raise ValueError("Invalid long at byte {}, more than 10 bytes".format(position[0]))
+    position[0] = pos
+    return (accum >> 1) ^ -(accum & 1)
+
+
+cdef inline long long read_block_count(const unsigned char* buf, Py_ssize_t length, Py_ssize_t* position) except? -1:
+    cdef long long count = read_varint(buf, length, position)
+    if count < 0:
+        # a negative count is followed by the block size in bytes
+        read_varint(buf, length, position)
+        return -count
+    return count
+
+
+cdef class Program:
+    '''A schema compiled to opcodes by ProgramCompiler. Calling the program
+    with a file object reads one datum, like the closure readers. The opcode
+    loop runs over the buffer of an in memory file (BytesIO), any other file
+    object is read with the closure reader of the schema.'''
+    cdef int* code
+    cdef readonly list opcodes
+    cdef readonly list constants
+    cdef object schema
+    cdef dict options
+    cdef object fallback
+
+    def __cinit__(self, schema, **options):
+        # a program compiled earlier (see load_program) is passed as the
+        # 'compiled' (opcodes, constants) pair
+        if 'compiled' in options:
+            opcodes, constants = options.pop('compiled')
+            self.opcodes = list(opcodes)
+            self.constants = list(constants)
+        else:
+            compiled = ProgramCompiler(schema, **options)
+            self.opcodes = compiled.code
+            self.constants = compiled.constants
+        self.schema = schema
+        self.options = options
+        self.code = <int*>malloc(len(self.opcodes) * sizeof(int))
+        if self.code == NULL:
+            raise MemoryError()
+        for index, opcode in enumerate(self.opcodes):
+            self.code[index] = opcode
+
+    def __dealloc__(self):
+        free(self.code)
+
+    def __reduce__(self):
+        return (partial(Program, **self.options), (self.schema,))
+
+    def disassemble(self):
+        '''Return the program as a list of (offset, name, arguments)'''
+        cdef Py_ssize_t pc = 0
+        instructions = []
+        while pc < len(self.opcodes):
+            name, argument_count = opcode_info[self.opcodes[pc]]
+            if self.opcodes[pc] == OP_UNION:
+                argument_count += self.opcodes[pc + 1]
+            instructions.append((pc, name, tuple(self.opcodes[pc + 1:pc + 1 + argument_count])))
+            pc += 1 + argument_count
+        return instructions
+
+    def __call__(self, fo):
+        cdef Py_buffer view
+        cdef Py_ssize_t position
+        try:
+            getbuffer = fo.getbuffer
+        except AttributeError:
+            if self.fallback is None:
+                self.fallback = get_reader(self.schema, **self.options)
+            return self.fallback(fo)
+        buffer = getbuffer()
+        PyObject_GetBuffer(buffer, &view, PyBUF_SIMPLE)
+        position = fo.tell()
+        try:
+            datum = self.run(fo, <const unsigned char*>view.buf, view.len, &position)
+        finally:
+            PyBuffer_Release(&view)
+            # the BytesIO can't be resized while its buffer is exported
+            buffer.release()
+        fo.seek(position)
+        return datum
+
+    cdef run(self, fo, const unsigned char* buf, Py_ssize_t length, Py_ssize_t* position):
+        cdef int* code = self.code
+        cdef list constants = self.constants
+        cdef list values = []
+        cdef Py_ssize_t pc = 0
+        cdef Py_ssize_t start
+        cdef Py_ssize_t first
+        cdef Py_ssize_t index
+        cdef long long count
+        cdef float float_value
+        cdef double double_value
+        cdef int opcode
+        cdef tuple names
+        cdef dict record
+        # the item counts of the open array and map blocks, and the return
+        # offsets of the record calls
+        cdef Counters counters
+        cdef Counters calls
+        counters.size = calls.size = 16
+        counters.top = calls.top = -1
+        counters.items = <long long*>malloc(counters.size * sizeof(long long))
+        calls.items = <long long*>malloc(calls.size * sizeof(long long))
+        if counters.items == NULL or calls.items == NULL:
+            free(counters.items)
+            free(calls.items)
+            raise MemoryError()
+        try:
+            while True:
+                opcode = code[pc]
+                if opcode == OP_LONG:
+                    values.append(read_varint(buf, length, position))
+                    pc += 1
+                elif opcode == OP_STRING:
+                    count = read_varint(buf, length, position)
+                    start = take(length, position, count)
+                    values.append(PyUnicode_DecodeUTF8(<const char*>buf + start, count, NULL))
+                    pc += 1
+                elif opcode == OP_DOUBLE:
+                    start = take(length, position, 8)
+                    memcpy(&double_value, buf + start, 8)
+                    values.append(double_value)
+                    pc += 1
+                elif opcode == OP_FLOAT:
+                    start = take(length, position, 4)
+                    memcpy(&float_value, buf + start, 4)
+                    values.append(float_value)
+                    pc += 1
+                elif opcode == OP_BOOLEAN:
+                    start = take(length, position, 1)
+                    values.append(buf[start] == 1)
+                    pc += 1
+                elif opcode == OP_NULL:
+                    values.append(None)
+                    pc += 1
+                elif opcode == OP_BYTES:
+                    count = read_varint(buf, length, position)
+                    start = take(length, position, count)
+                    values.append(PyBytes_FromStringAndSize(<const char*>buf + start, count))
+                    pc += 1
+                elif opcode == OP_FIXED:
+                    start = take(length, position, code[pc + 1])
+                    values.append(PyBytes_FromStringAndSize(<const char*>buf + start, code[pc + 1]))
+                    pc += 2
+                elif opcode == OP_ENUM:
+                    count = read_varint(buf, length, position)
+                    values.append((<list>constants[code[pc + 1]])[count])
+                    pc += 2
+                elif opcode == OP_CONST:
+                    values.append(constants[code[pc + 1]])
+                    pc += 2
+                elif opcode == OP_SKIP:
+                    take(length, position, code[pc + 1])
+                    pc += 2
+                elif opcode == OP_SKIP_LONG:
+                    read_varint(buf, length, position)
+                    pc += 1
+                elif opcode == OP_SKIP_BYTES:
+                    take(length, position, read_varint(buf, length, position))
+                    pc += 1
+                elif opcode == OP_POP:
+                    values.pop()
+                    pc += 1
+                elif opcode == OP_UNION:
+                    count = read_varint(buf, length, position)
+                    if count < 0 or count >= code[pc + 1]:
+                        raise TypeError("Unable to process union, union index '{}' doesn't exist. This is most likely because the read schema being used is not compatible with the write schema used to write the data.".format(count))
+                    pc = code[pc + 2 + count]
+                elif opcode == OP_JUMP:
+                    pc = code[pc + 1]
+                elif opcode == OP_ARRAY_START or opcode == OP_MAP_START:
+                    values.append([] if opcode == OP_ARRAY_START else {})
+                    count = read_block_count(buf, length, position)
+                    if count == 0:
+                        pc = code[pc + 1]
+                    else:
+                        push_counter(&counters, count)
+                        pc += 2
+                elif opcode == OP_ARRAY_NEXT or opcode == OP_MAP_NEXT:
+                    if counters.top < 0:
+                        raise ValueError("Invalid program, {} outside a block at {}".format(opcode, pc))
+                    item = values.pop()
+                    if opcode == OP_ARRAY_NEXT:
+                        (<list?>values[len(values) - 1]).append(item)
+                    else:
+                        key = values.pop()
+                        (<dict?>values[len(values) - 1])[key] = item
+                    counters.items[counters.top] -= 1
+                    if counters.items[counters.top] == 0:
+                        counters.items[counters.top] = read_block_count(buf, length, position)
+                    if counters.items[counters.top] == 0:
+                        counters.top -= 1
+                        pc += 2
+                    else:
+                        pc = code[pc + 1]
+                elif opcode == OP_CALL:
+                    push_counter(&calls, pc + 2)
+                    pc = code[pc + 1]
+                elif opcode == OP_RETURN:
+                    if calls.top < 0:
+                        raise ValueError("Invalid program, return outside a call at {}".format(pc))
+                    pc = calls.items[calls.top]
+                    calls.top -= 1
+                elif opcode == OP_DICT:
+                    names = <tuple>constants[code[pc + 1]]
+                    first = len(values) - len(names)
+                    record = {}
+                    for index in range(len(names)):
+                        record[names[index]] = values[first + index]
+                    del values[first:]
+                    values.append(record)
+                    pc += 2
+                elif opcode == OP_TUPLE:
+                    first = len(values) - code[pc + 1]
+                    item = tuple(values[first:])
+                    del values[first:]
+                    values.append(item)
+                    pc += 2
+                elif opcode == OP_MAKE:
+                    first = len(values) - code[pc + 2]
+                    item = constants[code[pc + 1]](values[first:])
+                    del values[first:]
+                    values.append(item)
+                    pc += 3
+                elif opcode == OP_READER:
+                    fo.seek(position[0])
+                    values.append(constants[code[pc + 1]](fo))
+                    position[0] = fo.tell()
+                    pc += 2
+                elif opcode == OP_END:
+                    return values[0]
+                else:
+                    raise ValueError("Invalid opcode {} at {}".format(opcode, pc))
+        finally:
+            free(counters.items)
+            free(calls.items)
+
+
+def compile_program(schema, **options):
+    '''Compile a (resolved) schema dict for the bytecode engine, the returned
+    Program is used like a reader from get_reader. The 'dict', 'tuple' and
+    'namedtuple' record types are supported.'''
+    return Program(schema, **options)
+
+
+def load_program(schema, opcodes, constants, **options):
+    '''Make the Program of a schema from the opcodes and constants of a
+    program compiled earlier with the same options, without compiling.
+    Raises ValueError if they aren't a program the opcode loop can run (see
+    check_program).'''
+    check_program(opcodes, constants)
+    return Program(schema, compiled=(opcodes, constants), **options)
+
+
+# the opcodes whose first argument is an offset in the program
+jump_opcodes = frozenset([OP_JUMP, OP_ARRAY_START, OP_ARRAY_NEXT, OP_MAP_START, OP_MAP_NEXT, OP_CALL])
+# the opcodes whose first argument is a constant index, and its type
+constant_types = {OP_ENUM: list, OP_CONST: object, OP_DICT: tuple}
+
+
+def check_program(opcodes, constants):
+    '''Raise ValueError unless opcodes and constants read back from a plan
+    file are a program the opcode loop can run without reading outside of
+    it: known opcodes with all their arguments, jumps to the start of an
+    instruction, constants of the types their opcodes take and OP_END last.
+    The opcodes calling python objects (OP_MAKE and OP_READER) are never
+    stored, programs holding them are invalid too.'''
+    if not isinstance(opcodes, list) or not isinstance(constants, list):
+        raise ValueError("Invalid program, the opcodes and constants must be lists")
+    if not all(isinstance(value, six.integer_types) and not isinstance(value, bool) and
+               INT_MIN_VALUE <= value <= INT_MAX_VALUE for value in opcodes):
+        raise ValueError("Invalid program, the opcodes must be 32 bit integers")
+    cdef Py_ssize_t pc = 0
+    cdef Py_ssize_t last = -1
+    starts = set()
+    targets = []
+    while pc < len(opcodes):
+        opcode = opcodes[pc]
+        if not 0 <= opcode < len(opcode_info) or opcode in (OP_MAKE, OP_READER):
+            raise ValueError("Invalid program, opcode {} at {}".format(opcode, pc))
+        argument_count = opcode_info[opcode][1]
+        if opcode == OP_UNION and pc + 1 < len(opcodes):
+            if opcodes[pc + 1] < 0:
+                raise ValueError("Invalid program, union of {} branches at {}".format(opcodes[pc + 1], pc))
+            argument_count += opcodes[pc + 1]
+        arguments = opcodes[pc + 1:pc + 1 + argument_count]
+        if len(arguments) < argument_count:
+            raise ValueError("Invalid program, the arguments of opcode {} at {} are missing".format(opcode, pc))
+        if opcode in jump_opcodes:
+            targets.append(arguments[0])
+        elif opcode == OP_UNION:
+            targets.extend(arguments[1:])
+        elif opcode in constant_types:
+            if not (0 <= arguments[0] < len(constants) and
+                    isinstance(constants[arguments[0]], constant_types[opcode])):
+                raise ValueError("Invalid program, constant {} of opcode {} at {}".format(arguments[0], opcode, pc))
+        elif opcode in (OP_FIXED, OP_SKIP, OP_TUPLE) and arguments[0] < 0:
+            raise ValueError("Invalid program, negative size at {}".format(pc))
+        starts.add(pc)
+        last = pc
+        pc += 1 + argument_count
+    if last < 0 or opcodes[last] != OP_END:
+        raise ValueError("Invalid program, it doesn't end with OP_END")
+    for target in targets:
+        if target not in starts:
+            raise ValueError("Invalid program, jump to {}".format(target))
+
+# ======================================================================
+# arrays of numbers. With the ``array_type`` option ('array' or 'numpy')
+# arrays of int, long, float, double and boolean are read into array.array
+# or numpy arrays, a block at a time over the buffer of an in memory file.
+# The writers take those (anything with the buffer protocol) back and
+# write them without making python numbers.
+cimport cpython.array as carray
+from cpython.buffer cimport PyObject_CheckBuffer, PyBUF_FORMAT, PyBUF_C_CONTIGUOUS
+import array as pyarray
+
+numeric_typecodes = {'int': 'i', 'long': 'q', 'float': 'f', 'double': 'd', 'boolean': 'b'}
+numeric_dtypes = {'int': 'int32', 'long': 'int64', 'float': 'float32', 'double': 'float64', 'boolean': 'bool'}
+
+cdef enum NumericKind:
+    NUMERIC_INT, NUMERIC_LONG, NUMERIC_FLOAT, NUMERIC_DOUBLE, NUMERIC_BOOLEAN
+
+numeric_kinds = {'int': NUMERIC_INT, 'long': NUMERIC_LONG, 'float': NUMERIC_FLOAT, 'double': NUMERIC_DOUBLE,
+                 'boolean': NUMERIC_BOOLEAN}
+
+
+def is_numeric_array(schema, dict options):
+    '''Are the items of an array schema numbers that can be read into an
+    array.array and written from a buffer'''
+    items = schema['items']
+    return get_type(items) in numeric_typecodes and get_logical_type(items, options) is None
+
+
+cdef decode_numeric_blocks(carray.array result, int kind, const unsigned char* buf, Py_ssize_t length,
+                           Py_ssize_t* position):
+    '''Decode the blocks of an array of numbers into result'''
+    cdef Py_ssize_t size = 0
+    cdef Py_ssize_t index
+    cdef Py_ssize_t start
+    cdef long long count
+    while True:
+        count = read_block_count(buf, length, position)
+        if count == 0:
+            return
+        # every item takes at least a byte, so a corrupt count can't make
+        # a huge array
+        if count > length - position[0]:
+            raise EOFError("Unexpected end of avro data at byte {}".format(position[0]))
+        carray.resize_smart(result, size + count)
+        if kind == NUMERIC_LONG:
+            for index in range(size, size + count):
+                result.data.as_longlongs[index] = read_varint(buf, length, position)
+        elif kind == NUMERIC_INT:
+            for index in range(size, size + count):
+                result.data.as_ints[index] = <int>read_varint(buf, length, position)
+        elif kind == NUMERIC_DOUBLE:
+            start = take(length, position, count * 8)
+            memcpy(result.data.as_doubles + size, buf + start, count * 8)
+        elif kind == NUMERIC_FLOAT:
+            start = take(length, position, count * 4)
+            memcpy(result.data.as_floats + size, buf + start, count * 4)
+        else:
+            start = take(length, position, count)
+            for index in range(count):
+                result.data.as_schars[size + index] = buf[start + index] == 1
+        size += count
+
+
+def make_numeric_array_reader(schema, **options):
+    '''Reader for arrays of numbers into array.array (or numpy arrays with
+    array_type 'numpy'), file objects other than BytesIO are read an item
+    at a time'''
+    item_type = get_type(schema['items'])
+    cdef int kind = numeric_kinds[item_type]
+    cdef carray.array template = pyarray.array(numeric_typecodes[item_type])
+    item_reader = get_reader(schema['items'])
+    if options.get('array_type') == 'numpy':
+        import numpy
+        dtype = numpy.dtype(numeric_dtypes[item_type])
+        convert = partial(numpy.frombuffer, dtype=dtype)
+    else:
+        convert = None
+
+    def numeric_array_reader(fo):
+        cdef Py_buffer view
+        cdef Py_ssize_t position
+        cdef long long block_count
+        cdef carray.array result = carray.clone(template, 0, False)
+        try:
+            getbuffer = fo.getbuffer
+        except AttributeError:
+            block_count = read_long(fo)
+            while block_count != 0:
+                if block_count < 0:
+                    block_count = -block_count
+                    read_long(fo)
+                for _ in range(block_count):
+                    result.append(item_reader(fo))
+                block_count = read_long(fo)
+        else:
+            buffer = getbuffer()
+            PyObject_GetBuffer(buffer, &view, PyBUF_SIMPLE)
+            position = fo.tell()
+            try:
+                decode_numeric_blocks(result, kind, <const unsigned char*>view.buf, view.len, &position)
+            finally:
+                PyBuffer_Release(&view)
+                buffer.release()
+            fo.seek(position)
+        if convert is not None:
+            return convert(result)
+        return result
+    numeric_array_reader.__reduce__ = lambda: (partial(make_numeric_array_reader, **options), (schema,))
+    return numeric_array_reader
+
+
+cdef inline Py_ssize_t encode_varint(unsigned char* out, long long value):
+    cdef unsigned long long datum = (value << 1) ^ (value >> 63)
+    cdef Py_ssize_t size = 0
+    while datum > 127:
+        out[size] = (datum & 0x7f) | 0x80
+        datum >>= 7
+        size += 1
+    out[size] = datum
+    return size + 1
+
+
+cdef inline long long buffer_integer(const char* item, char code, Py_ssize_t itemsize):
+    '''The integer at item of a buffer with the struct format code'''
+    if code in b'bhilq':
+        if itemsize == 1:
+            return (<const signed char*>item)[0]
+        elif itemsize == 2:
+            return (<const short*>item)[0]
+        elif itemsize == 4:
+            return (<const int*>item)[0]
+        return (<const long long*>item)[0]
+    if itemsize == 1:
+        return (<const unsigned char*>item)[0]
+    elif itemsize == 2:
+        return (<const unsigned short*>item)[0]
+    return (<const unsigned int*>item)[0]
+
+
+cdef bint write_numeric_buffer(outbuf, datum, int kind, bint validate) except -1:
+    '''Write an array of numbers held in an object with the buffer protocol
+    in one go. Returns False, writing nothing, for buffers that aren't
+    contiguous or hold another type than the items of the schema.'''
+    cdef Py_buffer view
+    cdef Py_ssize_t count
+    cdef Py_ssize_t index
+    cdef Py_ssize_t size = 0
+    cdef long long value
+    cdef char code
+    cdef unsigned char* encoded
+    if not PyObject_CheckBuffer(datum):
+        return False
+    try:
+        PyObject_GetBuffer(datum, &view, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS)
+    except BufferError:
+        return False
+    try:
+        # native or little endian, single items
+        code_text = (<bytes>view.format).lstrip(b'@=<')
+        if len(code_text) != 1 or view.itemsize == 0:
+            return False
+        code = code_text[0]
+        count = view.len // view.itemsize
+        if kind == NUMERIC_DOUBLE or kind == NUMERIC_FLOAT:
+            if code != (b'd' if kind == NUMERIC_DOUBLE else b'f')[0]:
+                return False
+            if count:
+                write_long(outbuf, count)
+                outbuf.write(PyBytes_FromStringAndSize(<const char*>view.buf, view.len))
+            write_long(outbuf, 0)
+            return True
+        if kind == NUMERIC_BOOLEAN:
+            if code not in b'?bB' or view.itemsize != 1:
+                return False
+        elif code not in b'bhilqBHI' or view.itemsize > 8 or (code in b'BHI' and view.itemsize > 4):
+            return False
+        encoded = <unsigned char*>malloc(count * 10 + 1)
+        if encoded == NULL:
+            raise MemoryError()
+        try:
+            for index in range(count):
+                value = buffer_integer(<const char*>view.buf + index * view.itemsize, code, view.itemsize)
+                if kind == NUMERIC_BOOLEAN:
+                    encoded[size] = value != 0
+                    size += 1
+                else:
+                    if kind == NUMERIC_INT and validate and not INT_MIN_VALUE <= value <= INT_MAX_VALUE:
+                        raise TypeError("Schema violation, value overflow. {} can't be stored as an int".format(value))
+                    size += encode_varint(encoded + size, value)
+            if count:
+                write_long(outbuf, count)
+                outbuf.write(PyBytes_FromStringAndSize(<const char*>encoded, size))
+            write_long(outbuf, 0)
+        finally:
+            free(encoded)
+        return True
+    finally:
+        PyBuffer_Release(&view)
 
 # ======================================================================
+# logical types, conversion is opt-in per logical type with the
+# ``logical_types`` option, e.g. get_reader(schema, logical_types=['date'])
+# or logical_types=True to convert all of them. Without the option (or for
+# invalid logical type annotations) the underlying avro type is used.
+
+# the parts of the datetime C API used here, declared directly as cimporting
+# cpython.datetime makes the module import datetime when it's loaded
+cdef extern from "datetime.h":
+    ctypedef struct PyDateTime_Delta:
+        int days
+        int seconds
+        int microseconds
+
+    void PyDateTime_IMPORT()
+    object PyDelta_FromDSU(int days, int seconds, int useconds)
+    object PyTime_FromTime(int hour, int minute, int second, int usecond)
+    int PyDateTime_TIME_GET_HOUR(object o)
+    int PyDateTime_TIME_GET_MINUTE(object o)
+    int PyDateTime_TIME_GET_SECOND(object o)
+    int PyDateTime_TIME_GET_MICROSECOND(object o)
+
+from binascii import hexlify, unhexlify
+
+# set by load_datetime() when a date or time logical type is first used
+cdef object datetime = None
+cdef object utc, EPOCH_DATE, EPOCH_NAIVE, EPOCH_UTC
+cdef long EPOCH_ORDINAL
+
+
+def load_datetime():
+    '''Import datetime (and its C API) and make the epochs the first time a
+    date or time logical type is compiled, like uuid and decimal'''
+    global datetime, utc, EPOCH_DATE, EPOCH_ORDINAL, EPOCH_NAIVE, EPOCH_UTC
+    if datetime is not None:
+        return datetime
+    import datetime as module
+    # a macro that sets PyDateTimeAPI (as in cpython.datetime.import_datetime)
+    PyDateTime_IMPORT
+    try:
+        utc = module.timezone.utc
+    except AttributeError:
+        class UTC(module.tzinfo):
+            def utcoffset(self, dt):
+                return module.timedelta(0)
+
+            def tzname(self, dt):
+                return "UTC"
+
+            def dst(self, dt):
+                return module.timedelta(0)
+        utc = UTC()
+    EPOCH_DATE = module.date(1970, 1, 1)
+    EPOCH_ORDINAL = EPOCH_DATE.toordinal()
+    EPOCH_NAIVE = module.datetime(1970, 1, 1)
+    EPOCH_UTC = module.datetime(1970, 1, 1, tzinfo=utc)
+    datetime = module
+    return module
+
+
+def utc_timezone():
+    '''The tzinfo of the timestamps read, datetime.timezone.utc or the same
+    on python 2'''
+    load_datetime()
+    return utc
+
+cdef long long MICROS_PER_DAY = 86400000000
+
+
+cdef timedelta_from_micros(long long micros):
+    cdef long long days = micros // MICROS_PER_DAY
+    cdef long long rest = micros - days * MICROS_PER_DAY
+    return PyDelta_FromDSU(days, rest // 1000000, rest % 1000000)
+
+
+cdef long long micros_since(datum, epoch) except? -1:
+    delta = datum - epoch
+    cdef PyDateTime_Delta* raw = <PyDateTime_Delta*>delta
+    return (<long long>raw.days * 86400 + raw.seconds) * 1000000 + raw.microseconds
+
+
+cdef time_from_micros(long long micros):
+    return PyTime_FromTime(micros // 3600000000, (micros // 60000000) % 60,
+                           (micros // 1000000) % 60, micros % 1000000)
+
+
+cdef long long time_to_micros(datum):
+    return (((<long long>PyDateTime_TIME_GET_HOUR(datum) * 60 + PyDateTime_TIME_GET_MINUTE(datum)) * 60
+             + PyDateTime_TIME_GET_SECOND(datum)) * 1000000 + PyDateTime_TIME_GET_MICROSECOND(datum))
+
+
+cdef unscaled_from_bytes(bytes data):
+    '''Decimals are stored as a big endian two's complement integer'''
+    cdef:
+        Py_ssize_t size = len(data)
+        Py_ssize_t idx
+        const unsigned char* raw = data
+        unsigned long long accum = 0
+    if size == 0:
+        return 0
+    if size <= 8:
+        for idx in range(size):
+            accum = (accum << 8) | raw[idx]
+        # sign extend the value to 64 bits
+        if raw[0] & 0x80 and size < 8:
+            accum |= <unsigned long long>-1 << (size * 8)
+        return <long long>accum
+    value = int(hexlify(data), 16)
+    if raw[0] & 0x80:
+        value -= (<object>1) << (size * 8)
+    return value
+
+
+cdef bytes unscaled_to_bytes(unscaled, Py_ssize_t size):
+    '''Encode an integer as big endian two's complement, a negative size
+    means use the minimum number of bytes'''
+    cdef:
+        long long value
+        unsigned long long accum
+        char buff[8]
+        Py_ssize_t idx
+        Py_ssize_t length
+    if size < 0:
+        size = (unscaled.bit_length() + 8) // 8
+    elif not -((<object>1) << (size * 8 - 1)) <= unscaled < ((<object>1) << (size * 8 - 1)):
+        raise TypeError("Decimal value {} doesn't fit in {} bytes".format(unscaled, size))
+    if size <= 8:
+        value = unscaled
+        accum = <unsigned long long>value
+        for idx in range(size):
+            buff[size - 1 - idx] = accum & 0xff
+            accum >>= 8
+        return buff[:size]
+    if unscaled < 0:
+        unscaled += (<object>1) << (size * 8)
+    return unhexlify('{:0{}x}'.format(unscaled, size * 2))
+
+
+cdef decimal_parameters(schema):
+    '''Return the (precision, scale) of a decimal schema or None if the
+    annotation isn't valid'''
+    precision = schema.get('precision')
+    scale = schema.get('scale', 0)
+    if not isinstance(precision, six.integer_types) or not isinstance(scale, six.integer_types):
+        return None
+    if precision < 1 or not 0 <= scale <= precision:
+        return None
+    if schema['type'] == 'fixed' and precision > len(str(2 ** (8 * schema['size'] - 1) - 1)) - 1:
+        return None
+    return precision, scale
+
+
+def decimal_module():
+    # like uuid, decimal is only imported once the logical type is used
+    import decimal
+    return decimal
+
+
+def make_decimal_reader(schema):
+    precision, scale = decimal_parameters(schema)
+    decimal = decimal_module()
+    context = decimal.Context(prec=precision)
+    Decimal = decimal.Decimal
+    cdef long size = schema['size'] if schema['type'] == 'fixed' else -1
+
+    def decimal_reader(fo):
+        data = fo.read(size) if size >= 0 else read_bytes(fo)
+        return Decimal(unscaled_from_bytes(data)).scaleb(-scale, context)
+    return decimal_reader
+
+
+def make_decimal_writer(schema, writer):
+    precision, scale = decimal_parameters(schema)
+    Decimal = decimal_module().Decimal
+    cdef long size = schema['size'] if schema['type'] == 'fixed' else -1
+
+    def decimal_writer(outbuf, datum):
+        if not isinstance(datum, Decimal):
+            return writer(outbuf, datum)
+        scaled = datum.scaleb(scale)
+        if scaled != scaled.to_integral_value():
+            raise TypeError("{} - has more digits than the decimal scale allows. Schema: {}".format(repr(datum), schema))
+        data = unscaled_to_bytes(int(scaled), size)
+        if size < 0:
+            write_bytes(outbuf, data)
+        else:
+            write_fixed(outbuf, data)
+    return decimal_writer
+
+
+def uuid_class():
+    # uuid is only imported once the logical type is used, importing it
+    # (and platform with it) is a good part of the import time of spavro
+    import uuid
+    return uuid.UUID
+
+
+def make_uuid_reader(schema):
+    UUID = uuid_class()
+
+    def uuid_reader(fo):
+        return UUID(read_utf8(fo))
+    return uuid_reader
+
 
+def make_uuid_writer(schema, writer):
+    UUID = uuid_class()
 
-cdef void write_int(outbuf, long long signed_datum):
+    def uuid_writer(outbuf, datum):
+        if isinstance(datum, UUID):
+            write_utf8(outbuf, unicode(datum))
+        else:
+            writer(outbuf, datum)
+    return uuid_writer
+
+
+def make_date_reader(schema):
+    load_datetime()
+
+    def date_reader(fo):
+        return EPOCH_DATE + PyDelta_FromDSU(read_long(fo), 0, 0)
+    return date_reader
+
+
+def make_date_writer(schema, writer):
+    date = load_datetime().date
+
+    def date_writer(outbuf, datum):
+        if isinstance(datum, date):
+            write_long(outbuf, datum.toordinal() - EPOCH_ORDINAL)
+        else:
+            writer(outbuf, datum)
+    return date_writer
+
+
+def make_time_reader(schema):
+    cdef long long multiplier = 1000 if schema['logicalType'] == 'time-millis' else 1
+    load_datetime()
+
+    def time_reader(fo):
+        return time_from_micros(read_long(fo) * multiplier)
+    return time_reader
+
+
+def make_time_writer(schema, writer):
+    cdef long long divisor = 1000 if schema['logicalType'] == 'time-millis' else 1
+    time = load_datetime().time
+
+    def time_writer(outbuf, datum):
+        if isinstance(datum, time):
+            write_long(outbuf, time_to_micros(datum) // divisor)
+        else:
+            writer(outbuf, datum)
+    return time_writer
+
+
+def make_timestamp_reader(schema):
+    cdef long long multiplier = 1000 if schema['logicalType'].endswith('-millis') else 1
+    load_datetime()
+    # local timestamps have no timezone, they come back as naive datetimes
+    epoch = EPOCH_NAIVE if schema['logicalType'].startswith('local-') else EPOCH_UTC
+
+    def timestamp_reader(fo):
+        return epoch + timedelta_from_micros(read_long(fo) * multiplier)
+    return timestamp_reader
+
+
+def make_timestamp_writer(schema, writer):
+    cdef long long divisor = 1000 if schema['logicalType'].endswith('-millis') else 1
+    cdef bint local = schema['logicalType'].startswith('local-')
+    datetime_type = load_datetime().datetime
+
+    def timestamp_writer(outbuf, datum):
+        if not isinstance(datum, datetime_type):
+            return writer(outbuf, datum)
+        if datum.tzinfo is None:
+            # naive datetimes are taken to be UTC
+            write_long(outbuf, micros_since(datum, EPOCH_NAIVE) // divisor)
+        elif local:
+            write_long(outbuf, micros_since(datum.replace(tzinfo=None), EPOCH_NAIVE) // divisor)
+        else:
+            write_long(outbuf, micros_since(datum, EPOCH_UTC) // divisor)
+    return timestamp_writer
+
+
+LogicalType = namedtuple('LogicalType', ['types', 'reader', 'writer', 'get_python_type'])
+
+# (reader, writer, python type) of the logical types, which avro types they
+# annotate is taken from spavro.schema
+logical_converters = {
+    'decimal': (make_decimal_reader, make_decimal_writer, lambda: decimal_module().Decimal),
+    'uuid': (make_uuid_reader, make_uuid_writer, uuid_class),
+    'date': (make_date_reader, make_date_writer, lambda: load_datetime().date),
+    'time-millis': (make_time_reader, make_time_writer, lambda: load_datetime().time),
+    'time-micros': (make_time_reader, make_time_writer, lambda: load_datetime().time),
+    'timestamp-millis': (make_timestamp_reader, make_timestamp_writer, lambda: load_datetime().datetime),
+    'timestamp-micros': (make_timestamp_reader, make_timestamp_writer, lambda: load_datetime().datetime),
+    'local-timestamp-millis': (make_timestamp_reader, make_timestamp_writer, lambda: load_datetime().datetime),
+    'local-timestamp-micros': (make_timestamp_reader, make_timestamp_writer, lambda: load_datetime().datetime),
+}
+
+logical_type_map = {logical_type: LogicalType(types, *logical_converters[logical_type])
+                    for logical_type, types in LOGICAL_TYPES.items()}
+
+
+def is_instance(python_type, datum):
+    return isinstance(datum, python_type)
+
+
+cdef get_logical_type(schema, dict options):
+    '''Return the logical type of a schema if it's valid and converting it
+    was requested, otherwise None'''
+    logical_types = options.get('logical_types')
+    if not logical_types or not isinstance(schema, (dict, GraphSchema)):
+        return None
+    logical_type = schema.get('logicalType')
+    if logical_type not in logical_type_map:
+        return None
+    if logical_types is not True and logical_type not in logical_types:
+        return None
+    if schema['type'] not in logical_type_map[logical_type].types:
+        return None
+    if logical_type == 'decimal' and decimal_parameters(schema) is None:
+        return None
+    return logical_type
+
+
+cdef logical_reader(schema, reader, dict options):
+    logical_type = get_logical_type(schema, options)
+    if logical_type is None:
+        return reader
+    return logical_type_map[logical_type].reader(schema)
+
+
+cdef logical_writer(schema, writer, dict options):
+    logical_type = get_logical_type(schema, options)
+    if logical_type is None:
+        return writer
+    return logical_type_map[logical_type].writer(schema, writer)
+
+
+def default_converter(schema, dict options):
+    '''Return a function converting a default value (in its JSON form) of
+    schema to the logical types being converted, None when there's nothing
+    to convert. Named types referenced by name aren't followed.'''
+    logical_type = get_logical_type(schema, options)
+    if logical_type is not None:
+        reader = logical_type_map[logical_type].reader(schema)
+        base_type = schema['type']
+
+        def convert_logical(value):
+            buff = BytesIO()
+            if base_type == 'string':
+                write_utf8(buff, value)
+            elif base_type == 'bytes':
+                # bytes and fixed defaults are strings of code points 0-255
+                write_bytes(buff, value.encode('iso-8859-1'))
+            elif base_type == 'fixed':
+                write_fixed(buff, value.encode('iso-8859-1'))
+            else:
+                write_long(buff, value)
+            buff.seek(0)
+            return reader(buff)
+        return convert_logical
+    schema_type = get_type(schema)
+    if schema_type == 'union':
+        # the default of a union is a value of its first branch
+        return default_converter(schema[0], options)
+    if schema_type in ('array', 'map'):
+        convert_item = default_converter(schema['items' if schema_type == 'array' else 'values'], options)
+        if convert_item is None:
+            return None
+        if schema_type == 'array':
+            return lambda value: [convert_item(item) for item in value]
+        return lambda value: {key: convert_item(item) for key, item in value.items()}
+    if schema_type in ('record', 'error'):
+        converters = [(field['name'], default_converter(field['type'], options)) for field in schema['fields']]
+        converters = [(name, convert) for name, convert in converters if convert is not None]
+        if not converters:
+            return None
+
+        def convert_record(value):
+            value = dict(value)
+            for name, convert in converters:
+                if name in value:
+                    value[name] = convert(value[name])
+            return value
+        return convert_record
+    return None
+
+
+def default_value(schema, dict options):
+    '''The value a resolved 'default' schema reads, converted when the
+    reader's field schema (kept by resolve as 'schema') has logical types
+    being converted'''
+    value = schema['value']
+    if 'schema' not in schema or not options.get('logical_types'):
+        return value
+    convert = default_converter(schema['schema'], options)
+    return value if convert is None else convert(value)
+
+# ======================================================================
+
+
+cdef void write_int(outbuf, long long signed_datum) except *:
     """int and long values are written using variable-length, zig-zag coding.
     """
     cdef:
@@ -287,7 +2046,7 @@ cdef void write_int(outbuf, long long signed_datum):
 write_long = write_int
 
 
-cdef void write_bytes(outbuf, datum):
+cdef void write_bytes(outbuf, datum) except *:
     """
     Bytes are encoded as a long followed by that many bytes of data. 
     """
@@ -296,14 +2055,14 @@ cdef void write_bytes(outbuf, datum):
     outbuf.write(datum)
 
 
-cdef void write_utf8(outbuf, datum):
+cdef void write_utf8(outbuf, datum) except *:
     """
     Unicode are encoded as write_bytes of the utf-8 encoded data.
     """
     write_bytes(outbuf, datum.encode("utf-8"))
 
 
-cdef void write_float(outbuf, float datum):
+cdef void write_float(outbuf, float datum) except *:
     """
     A float is written as 4 bytes.
     The float is converted into a 32-bit integer using a method equivalent to
@@ -312,7 +2071,7 @@ cdef void write_float(outbuf, float datum):
     outbuf.write((<char *>&datum)[:sizeof(float)])
 
 
-cdef void write_double(outbuf, double datum):
+cdef void write_double(outbuf, double datum) except *:
     """
     A double is written as 8 bytes.
     The double is converted into a 64-bit integer using a method equivalent to
@@ -325,7 +2084,7 @@ cdef void write_null(outbuf, datum):
     pass
 
 
-cdef void write_fixed(outbuf, datum):
+cdef void write_fixed(outbuf, datum) except *:
     """A fixed writer writes out exactly the bytes up to a count"""
     outbuf.write(datum)
 
@@ -347,6 +2106,7 @@ avro_to_py = {
     u"double": float,
     u"array": list,
     u"record": dict,
+    u"error": dict,
     u"enum": unicode,
     u"fixed": bytes,
     u"bytes": bytes,
@@ -357,9 +2117,25 @@ avro_to_py = {
 # ===============================
 CheckField = namedtuple('CheckField', ['name', 'check'])
 
+check_cache = {}
+
 def get_check(schema):
-    schema = lookup_schema(schema)
     cdef unicode schema_type = get_type(schema)
+    if isinstance(schema, GraphSchema):
+        return compile_graph('check', schema, lambda: check_type_map[schema_type](schema))
+    if schema_type not in check_type_map:
+        # a reference to a named type, either one being built (recursive
+        # schemas) or one that has been defined earlier
+        try:
+            return linked(check_cache[schema_type])
+        except KeyError:
+            schema = lookup_schema(schema)
+            schema_type = get_type(schema)
+    if schema_type == 'record':
+        placeholder = ReaderPlaceholder()
+        check_cache[get_fullname(schema)] = placeholder
+        placeholder.reader = check_type_map[schema_type](schema)
+        return placeholder.reader
     return check_type_map[schema_type](schema)
 
 
@@ -371,7 +2147,7 @@ def make_record_check(schema):
 
 
 def make_enum_check(schema):
-    cdef list symbols = schema['symbols']
+    cdef list symbols = list(schema['symbols'])
     def enum_check(datum):
         return datum in symbols
     return enum_check
@@ -404,7 +2180,7 @@ def make_byte_check(schema):
 def make_array_check(schema):
     item_check = get_check(schema['items'])
     def array_check(datum):
-        return isinstance(datum, list) and all([item_check(item) for item in datum])
+        return isinstance(datum, (list, pyarray.array)) and all([item_check(item) for item in datum])
     return array_check
 
 def make_union_check(union_schema):
@@ -428,6 +2204,7 @@ def make_map_check(schema):
 check_type_map = {
     'union': make_union_check,
     'record': make_record_check,
+    'error': make_record_check,
     'null': make_null_check,
     'string': make_string_check,
     'boolean': make_boolean_check,
@@ -464,6 +2241,9 @@ cdef void create_promotions_for_union(dict writer_lookup_dict):
     # py2 and py3 both handle str/unicode differently
     if unicode in writer_lookup_dict:
         writer_lookup_dict[str] = writer_lookup_dict[unicode]
+    # arrays of numbers can be given as array.array
+    if list in writer_lookup_dict:
+        writer_lookup_dict[pyarray.array] = writer_lookup_dict[list]
     # allow the use of ints to 'find' float unions
     if float in writer_lookup_dict and int not in writer_lookup_dict:
         writer_lookup_dict[int] = writer_lookup_dict[float]
@@ -474,14 +2254,128 @@ cdef void create_promotions_for_union(dict writer_lookup_dict):
         writer_lookup_dict[unicode] = writer_lookup_dict[bytes][0], lambda output_buffer, val: writer_lookup_dict[bytes][1](output_buffer, val.encode('utf-8'))
 
 
-def make_union_writer(union_schema):
+UnionBranch = namedtuple('UnionBranch', ['index', 'check', 'writer', 'keys'])
+
+
+def accepts_null(schema):
+    schema_type = get_type(schema)
+    if schema_type == 'union':
+        return 'null' in [get_type(branch) for branch in schema]
+    return schema_type == 'null'
+
+
+def record_keys(schema):
+    '''The (required, all) field names of a record schema, used to tell
+    record branches of a union apart by the keys of the datum. Only fields
+    that can be null may be left out.'''
+    if get_type(schema) not in ('record', 'error'):
+        return None
+    return (frozenset(field['name'] for field in schema['fields'] if not accepts_null(field['type'])),
+            frozenset(field['name'] for field in schema['fields']))
+
+
+cdef enum NullableKind:
+    NULLABLE_OTHER, NULLABLE_STRING, NULLABLE_BYTES, NULLABLE_DOUBLE, NULLABLE_FLOAT, NULLABLE_BOOLEAN
+
+nullable_kinds = {
+    'string': (NULLABLE_STRING, unicode),
+    'bytes': (NULLABLE_BYTES, bytes),
+    'double': (NULLABLE_DOUBLE, float),
+    'float': (NULLABLE_FLOAT, float),
+    'boolean': (NULLABLE_BOOLEAN, bool),
+}
+
+
+cdef tuple nullable_branches(union_schema, list type_list, dict options):
+    '''Return (null index, value schema, kind, python type) of a ["null", T]
+    union, kind being the primitive read/written inline (if any)'''
+    cdef int null_index = type_list.index('null')
+    value_schema = union_schema[1 - null_index]
+    kind, python_type = nullable_kinds.get(type_list[1 - null_index], (NULLABLE_OTHER, None))
+    if kind != NULLABLE_OTHER and get_logical_type(value_schema, options) is not None:
+        kind, python_type = NULLABLE_OTHER, None
+    return null_index, value_schema, kind, python_type
+
+
+def make_nullable_writer(union_schema, list type_list, write_union, dict options):
+    '''Writer for the common ["null", T] union: None and data of exactly the
+    branch's python type skip the union lookup, with primitives written
+    inline. Anything else (promotions, hints) goes through write_union.'''
+    cdef int null_index
+    cdef int value_index
+    cdef int kind
+    null_index, value_schema, kind, python_type = nullable_branches(union_schema, type_list, options)
+    value_index = 1 - null_index
+    # a list so a lazily compiled writer can be put in place
+    cdef list value_writer = [None]
+    if python_type is None:
+        if is_deferred(value_schema, options):
+            value_writer[0] = deferred(get_writer, value_schema, deferral_scope(value_schema, True, options), options,
+                                       partial(value_writer.__setitem__, 0))
+        else:
+            value_writer[0] = get_writer(value_schema, **options)
+        python_type = avro_to_py[get_type(lookup_schema(value_schema))]
+
+    def write_nullable(outbuf, datum):
+        if datum is None:
+            write_long(outbuf, null_index)
+        elif type(datum) is not python_type:
+            write_union(outbuf, datum)
+        elif kind == NULLABLE_STRING:
+            write_long(outbuf, value_index)
+            write_utf8(outbuf, datum)
+        elif kind == NULLABLE_DOUBLE:
+            write_long(outbuf, value_index)
+            write_double(outbuf, datum)
+        elif kind == NULLABLE_FLOAT:
+            write_long(outbuf, value_index)
+            write_float(outbuf, datum)
+        elif kind == NULLABLE_BOOLEAN:
+            write_long(outbuf, value_index)
+            write_boolean(outbuf, datum)
+        elif kind == NULLABLE_BYTES:
+            write_long(outbuf, value_index)
+            write_bytes(outbuf, datum)
+        else:
+            write_long(outbuf, value_index)
+            value_writer[0](outbuf, datum)
+    return write_nullable
+
+
+def record_object_finder(list record_branches):
+    '''Return a function giving the name of the record branch for a record
+    given as an object: the record named like its class or else the only
+    record of the union, if the object can be one of those records (see
+    spavro.records), otherwise None. record_branches holds the (name, field
+    names) of the record branches.'''
+    from spavro.records import is_record_object
+
+    def record_object_branch(datum):
+        class_name = type(datum).__name__
+        for name, field_names in record_branches:
+            if name.split('.')[-1] == class_name and is_record_object(datum, field_names):
+                return name
+        if len(record_branches) == 1 and is_record_object(datum, record_branches[0][1]):
+            return record_branches[0][0]
+        return None
+    return record_object_branch
+
+
+def make_union_writer(union_schema, **options):
     cdef list type_list = [get_type(lookup_schema(schema)) for schema in union_schema]
     # cdef dict writer_lookup
     # cdef list record_list
     cdef dict writer_lookup_dict
+    cdef dict branch_by_name = {}
+    cdef list record_branches = []
+    cdef dict dispatch_cache = {}
     cdef char simple_union
     cdef list lookup_result
     cdef long idx
+    # dicts with this key name their branch (opt in, it's data in maps)
+    union_type_key = options.get('union_type_key')
+    record_object_branch = record_object_finder(record_branches)
+    from spavro.records import Branch
 
     # if there's more than one kind of record in the union
     # or if there's a string, enum or fixed combined in the union
@@ -494,72 +2388,158 @@ def make_union_writer(union_schema):
                       len(set(type_list) & set(['string', 'enum', 'fixed', 'bytes'])) > 1 or
                       len(set(type_list) & set(['record', 'map'])) > 1)
 
+    def register_branch_name(schema, branch):
+        # branches can be picked explicitly by the names used in the Avro
+        # JSON encoding, named types also by their short name
+        name = json_type_name(lookup_schema(schema))
+        branch_by_name[name] = branch
+        branch_by_name.setdefault(name.split('.')[-1], branch)
+        if get_type(lookup_schema(schema)) in ('record', 'error'):
+            record_branches.append((name, [field['name'] for field in lookup_schema(schema)['fields']]))
+
+    def hinted_branch(datum):
+        '''Find the branch for a datum given as a spavro.records.Branch, or
+        for a record given as an object (see record_object_finder)'''
+        if type(datum) is Branch:
+            try:
+                return branch_by_name[datum.name], datum.datum
+            except (KeyError, TypeError):
+                raise TypeError("{} - Unknown branch in union. Schema: {}".format(repr(datum), union_schema))
+        name = record_object_branch(datum)
+        if name is not None:
+            return branch_by_name[name], datum
+        raise TypeError("{} - Invalid type ({}) in union. Schema: {}".format(repr(datum), type(datum), union_schema))
+
+    def patch_simple(idx, writer):
+        '''Put the lazily compiled writer of a branch in place'''
+        for lookup in (writer_lookup_dict, branch_by_name):
+            for key, entry in lookup.items():
+                if entry[0] == idx:
+                    lookup[key] = (idx, writer)
+
+    def patch_branches(idx, field, compiled):
+        '''Put the lazily compiled writer or check of a branch in place'''
+        for lookup_result in writer_lookup_dict.values():
+            if type(lookup_result) is list:
+                for position, branch in enumerate(lookup_result):
+                    if branch.index == idx:
+                        lookup_result[position] = branch._replace(**{field: compiled})
+        for key, branch in branch_by_name.items():
+            if branch.index == idx:
+                branch_by_name[key] = branch._replace(**{field: compiled})
+        for candidates in dispatch_cache.values():
+            for position, branch in enumerate(candidates):
+                if branch.index == idx:
+                    candidates[position] = branch._replace(**{field: compiled})
+
     if simple_union:
-        writer_lookup_dict = {avro_to_py[get_type(lookup_schema(schema))]: (idx, get_writer(schema)) for idx, schema in enumerate(union_schema)}
+        writer_lookup_dict = {}
+        for idx, schema in enumerate(union_schema):
+            if is_deferred(schema, options):
+                writer = deferred(get_writer, schema, deferral_scope(schema, True, options), options,
+                                  partial(patch_simple, idx))
+            else:
+                writer = get_writer(schema, **options)
+            writer_lookup_dict[avro_to_py[get_type(lookup_schema(schema))]] = (idx, writer)
+            register_branch_name(schema, (idx, writer))
+            # converted logical types are looked up by their own python type
+            logical_type = get_logical_type(lookup_schema(schema), options)
+            if logical_type:
+                writer_lookup_dict[logical_type_map[logical_type].get_python_type()] = (idx, writer)
 
         create_promotions_for_union(writer_lookup_dict)
 
         # warning, this will fail if there's both a long and int in a union
         # or a float and a double in a union (which is valid but nonsensical
         # in python but valid in avro)
-        def simple_writer_lookup(datum):
+        def write_union(outbuf, datum):
             try:
-                return writer_lookup_dict[type(datum)]
+                idx, data_writer = writer_lookup_dict[type(datum)]
             except KeyError:
-                raise TypeError("{} - Invalid type ({}) in union. Schema: {}".format(repr(datum), type(datum), union_schema))
+                (idx, data_writer), datum = hinted_branch(datum)
+            write_long(outbuf, idx)
+            data_writer(outbuf, datum)
 
-        writer_lookup = simple_writer_lookup
+        if len(union_schema) == 2 and 'null' in type_list:
+            write_union = make_nullable_writer(union_schema, type_list, write_union, options)
     else:
         writer_lookup_dict = {}
         for idx, schema in enumerate(union_schema):
             python_type = avro_to_py[get_type(lookup_schema(schema))]
+            if is_deferred(schema, options):
+                scope = deferral_scope(schema, True, options)
+                check = deferred(get_check, schema, scope, {}, partial(patch_branches, idx, 'check'))
+                writer = deferred(get_writer, schema, scope, options, partial(patch_branches, idx, 'writer'))
+            else:
+                check = get_check(schema)
+                writer = get_writer(schema, **options)
+            logical_type = get_logical_type(lookup_schema(schema), options)
+            if logical_type:
+                python_type = logical_type_map[logical_type].get_python_type()
+                check = partial(is_instance, python_type)
+            branch = UnionBranch(idx, check, writer, record_keys(lookup_schema(schema)))
+            register_branch_name(schema, branch)
             # TODO: if fixed and bytes are in the schema then we should check fixed before bytes
             # I think, since that's more efficient space wise?
             if python_type in writer_lookup_dict:
-                writer_lookup_dict[python_type] = writer_lookup_dict[python_type] + [(idx, get_check(schema), get_writer(schema))]
+                writer_lookup_dict[python_type] = writer_lookup_dict[python_type] + [branch]
             else:
-                writer_lookup_dict[python_type] = [(idx, get_check(schema), get_writer(schema))]
+                writer_lookup_dict[python_type] = [branch]
 
         create_promotions_for_union(writer_lookup_dict)
-        # if int in writer_lookup_dict:
-        #     writer_lookup_dict[long] = writer_lookup_dict[int]
-        # if unicode in writer_lookup_dict:
-        #     writer_lookup_dict[str] = writer_lookup_dict[unicode]
-        # if float in writer_lookup_dict and int not in writer_lookup_dict:
-        #     writer_lookup_dict[int] = writer_lookup_dict[float]
-        # if bytes in writer_lookup_dict and str not in writer_lookup_dict:
-        #     writer_lookup_dict[str] = writer_lookup_dict[bytes]
-
-
-        def complex_writer_lookup(datum):
-            cdef:
-                long idx
-                list lookup_result
+
+        def dict_branch(datum, list lookup_result):
+            '''Pick the branch of a dict: the first branch in union order
+            whose check passes, where record branches the keys of the datum
+            don't fit (a required field missing or a key that isn't a field)
+            are only tried when no other branch passes. The branches left by
+            the keys are cached, so most records run a single check.'''
+            if union_type_key is not None and union_type_key in datum:
+                try:
+                    return branch_by_name[datum[union_type_key]]
+                except KeyError:
+                    raise TypeError("{} - Unknown union branch. Schema: {}".format(repr(datum[union_type_key]), union_schema))
+            keys = frozenset(datum)
+            try:
+                candidates = dispatch_cache[keys]
+            except KeyError:
+                candidates = [branch for branch in lookup_result
+                              if branch.keys is None or branch.keys[0] <= keys <= branch.keys[1]]
+                # bounded so unkeyed data (maps) can't grow the cache forever
+                if len(dispatch_cache) < 256:
+                    dispatch_cache[keys] = candidates
+            for branch in candidates:
+                if branch.check(datum):
+                    return branch
+            return checked_branch(datum, lookup_result)
+
+        def checked_branch(datum, list lookup_result):
+            for branch in lookup_result:
+                if branch.check(datum):
+                    return branch
+            raise TypeError("No matching schema for datum: {}".format(repr(datum)))
+
+        def write_union(outbuf, datum):
+            cdef list lookup_result
             try:
                 lookup_result = writer_lookup_dict[type(datum)]
             except KeyError:
-                raise TypeError("{} - Invalid type ({}) in union. Schema: {}".format(repr(datum), type(datum), union_schema))
-            if len(lookup_result) == 1:
-                idx, get_check, writer = lookup_result[0]
+                branch, datum = hinted_branch(datum)
             else:
-                for idx, get_check, writer in lookup_result:
-                    if get_check(datum):
-                        break
+                if len(lookup_result) == 1:
+                    branch = lookup_result[0]
+                elif type(datum) is dict:
+                    branch = dict_branch(datum, lookup_result)
                 else:
-                    raise TypeError("No matching schema for datum: {}".format(repr(datum)))
-            return idx, writer
-
-        writer_lookup = complex_writer_lookup
+                    branch = checked_branch(datum, lookup_result)
+            write_long(outbuf, branch.index)
+            branch.writer(outbuf, datum)
 
-    def write_union(outbuf, datum):
-        idx, data_writer = writer_lookup(datum)
-        write_long(outbuf, idx)
-        data_writer(outbuf, datum)
-    write_union.__reduce__ = lambda: (make_union_writer, (union_schema,))
+    write_union.__reduce__ = lambda: (partial(make_union_writer, **options), (union_schema,))
     return write_union
 
-def make_enum_writer(schema):
-    cdef list symbols = schema['symbols']
+def make_enum_writer(schema, **options):
+    cdef list symbols = list(schema['symbols'])
 
     # the datum can be str or unicode?
     def write_enum(outbuf, basestring datum):
@@ -569,35 +2549,82 @@ def make_enum_writer(schema):
     return write_enum
 
 
-def make_record_writer(schema):
-    cdef list fields = [WriteField(field['name'], get_writer(field['type'])) for field in schema['fields']]
+def make_record_writer(schema, **options):
+    '''Create a record writer. Records are dicts (or other mappings),
+    objects with the fields as attributes (dataclasses, attrs and slots
+    classes), namedtuples or plain tuples of the values in field order, see
+    spavro.records. The values of any type but dict are taken by an accessor
+    made on its first record.'''
+    cdef list fields = [WriteField(field['name'], get_writer(field['type'], **options)) for field in schema['fields']]
+    cdef list names = [field.name for field in fields]
+    cdef dict accessors = {}
+    from spavro.records import record_accessor
 
-    def write_record(outbuf, datum):
-        for field in fields:
-            try:
+    def record_values(datum):
+        try:
+            accessor = accessors[type(datum)]
+        except KeyError:
+            accessor = accessors[type(datum)] = record_accessor(type(datum), names)
+        return accessor(datum)
+
+    def unchecked_write_record(outbuf, datum):
+        if type(datum) is dict:
+            for field in fields:
                 field.writer(outbuf, datum.get(field.name))
-            except TypeError as e:
-                raise TypeError("Error writing record schema at fieldname: '{}', datum: '{}'".format(field.name, repr(datum.get(field.name))))
-    write_record.__reduce__ = lambda: (make_record_writer, (schema,))
-    return write_record
+        else:
+            for field, value in zip(fields, record_values(datum)):
+                field.writer(outbuf, value)
 
+    if not options.get('validate', True):
+        unchecked_write_record.__reduce__ = lambda: (partial(make_record_writer, **options), (schema,))
+        return unchecked_write_record
 
-def make_array_writer(schema):
-    item_writer = get_writer(schema['items'])
+    def write_record(outbuf, datum):
+        if type(datum) is dict:
+            for field in fields:
+                try:
+                    field.writer(outbuf, datum.get(field.name))
+                except TypeError as e:
+                    raise TypeError("Error writing record schema at fieldname: '{}', datum: '{}'".format(field.name, repr(datum.get(field.name))))
+        else:
+            for field, value in zip(fields, record_values(datum)):
+                try:
+                    field.writer(outbuf, value)
+                except TypeError as e:
+                    raise TypeError("Error writing record schema at fieldname: '{}', datum: '{}'".format(field.name, repr(value)))
+    write_record.__reduce__ = lambda: (partial(make_record_writer, **options), (schema,))
+    return write_record
 
-    def write_array(outbuf, list datum):
+
+def make_array_writer(schema, **options):
+    '''Create an array writer, besides lists arrays of numbers can be given
+    as array.array, numpy arrays or other objects with the buffer protocol'''
+    item_writer = get_writer(schema['items'], **options)
+    cdef int numeric_kind = numeric_kinds.get(get_type(lookup_schema(schema['items'])), -1)
+    cdef bint validate = options.get('validate', True)
+    if numeric_kind != -1 and not is_numeric_array({'items': lookup_schema(schema['items'])}, options):
+        numeric_kind = -1
+
+    def write_array(outbuf, datum):
+        if not isinstance(datum, list):
+            if numeric_kind != -1 and write_numeric_buffer(outbuf, datum, numeric_kind, validate):
+                return
+            if not PyObject_CheckBuffer(datum) or not hasattr(datum, 'tolist'):
+                raise TypeError("{} - Not an array. Schema: {}".format(repr(datum), schema))
+            # e.g. a buffer of another type than the items
+            datum = datum.tolist()
         cdef long item_count = len(datum)
         if item_count > 0:
             write_long(outbuf, item_count)
         for item in datum:
             item_writer(outbuf, item)
         write_long(outbuf, 0)
-    write_array.__reduce__ = lambda: (make_array_writer, (schema,))
+    write_array.__reduce__ = lambda: (partial(make_array_writer, **options), (schema,))
     return write_array
 
 
-def make_map_writer(schema):
-    map_value_writer = get_writer(schema['values'])
+def make_map_writer(schema, **options):
+    map_value_writer = get_writer(schema['values'], **options)
 
     def write_map(outbuf, datum):
         cdef long item_count = len(datum)
@@ -607,13 +2634,15 @@ def make_map_writer(schema):
             write_utf8(outbuf, key)
             map_value_writer(outbuf, val)
         write_long(outbuf, 0)
-    write_map.__reduce__ = lambda: (make_map_writer, (schema,))
+    write_map.__reduce__ = lambda: (partial(make_map_writer, **options), (schema,))
     return write_map
 
 
-def make_boolean_writer(schema):
+def make_boolean_writer(schema, **options):
     '''Create a boolean writer, adds a validation step before the actual
     write function'''
+    if not options.get('validate', True):
+        return write_boolean
     def checked_boolean_writer(outbuf, datum):
         if not isinstance(datum, bool):
             raise TypeError("{} - Not a boolean value. Schema: {}".format(repr(datum), schema))
@@ -621,11 +2650,13 @@ def make_boolean_writer(schema):
     return checked_boolean_writer
 
 
-def make_fixed_writer(schema):
+def make_fixed_writer(schema, **options):
     '''A writer that must write X bytes defined by the schema'''
     cdef long size = schema['size']
     # note: not a char* because those are null terminated and fixed
     # has no such limitation
+    if not options.get('validate', True):
+        return write_fixed
     def checked_write_fixed(outbuf, datum):
         if len(datum) != size:
             raise TypeError("{} - Size Mismatch ({}) for Fixed data. Schema: {}".format(repr(datum), len(datum), schema))
@@ -633,9 +2664,11 @@ def make_fixed_writer(schema):
     return checked_write_fixed
 
 
-def make_int_writer(schema):
+def make_int_writer(schema, **options):
     '''Create a int writer, adds a validation step before the actual
     write function to make sure the int value doesn't overflow'''
+    if not options.get('validate', True):
+        return write_long
     def checked_int_write(outbuf, datum):
         if not isinstance(datum, six.integer_types):
             raise TypeError("Schema violation, {} is not an example of schema {}".format(datum, schema))
@@ -645,9 +2678,11 @@ def make_int_writer(schema):
     return checked_int_write
 
 
-def make_long_writer(schema):
+def make_long_writer(schema, **options):
     '''Create a long writer, adds a validation step before the actual
     write function to make sure the long value doesn't overflow'''
+    if not options.get('validate', True):
+        return write_long
     def checked_long_write(outbuf, datum):
         if not (isinstance(datum, six.integer_types)
                         and LONG_MIN_VALUE <= datum <= LONG_MAX_VALUE):
@@ -656,7 +2691,9 @@ def make_long_writer(schema):
     return checked_long_write
 
 
-def make_string_writer(schema):
+def make_string_writer(schema, **options):
+    if not options.get('validate', True):
+        return write_utf8
     def checked_string_writer(outbuf, datum):
         if not isinstance(datum, six.string_types):
             raise TypeError("{} - is not a string value. Schema: {}".format(repr(datum), schema))
@@ -664,19 +2701,19 @@ def make_string_writer(schema):
     return checked_string_writer
 
 
-def make_byte_writer(schema):
+def make_byte_writer(schema, **options):
     return write_bytes
 
 
-def make_float_writer(schema):
+def make_float_writer(schema, **options):
     return write_float
 
 
-def make_double_writer(schema):
+def make_double_writer(schema, **options):
     return write_double
 
 
-def make_null_writer(schema):
+def make_null_writer(schema, **options):
     return write_null
 
 
@@ -684,6 +2721,7 @@ def make_null_writer(schema):
 writer_type_map = {
     'union': make_union_writer,
     'record': make_record_writer,
+    'error': make_record_writer,
     'null': make_null_writer,
     'string': make_string_writer,
     'boolean': make_boolean_writer,
@@ -700,44 +2738,1257 @@ writer_type_map = {
 
 custom_schema = {}
 
-class WriterPlaceholder(object):
-    def __init__(self):
-        self.writer = None
+cdef class WriterPlaceholder(Placeholder):
+    @property
+    def writer(self):
+        return self.target
+
+    @writer.setter
+    def writer(self, writer):
+        self.target = writer
 
     def __call__(self, fo, val):
-        return self.writer(fo, val)
+        return self.target(fo, val)
 
 
-def get_writer(schema):
+def get_writer(schema, **options):
+    '''Create the writer function for a schema, ``options`` are passed down
+    to every writer maker in the tree. Like get_reader it takes a schema
+    dict or a schema graph, and compiles union branches on first use with
+    ``lazy=True``.'''
     cdef unicode schema_type = get_type(schema)
+    with compile_lock:
+        if isinstance(schema, GraphSchema):
+            return compile_graph('writer', schema, lambda: logical_writer(schema, writer_type_map[schema_type](schema, **options), options))
+
+        if schema_type in ('record', 'fixed', 'enum'):
+            placeholder = WriterPlaceholder()
+            # using a placeholder because this is recursive and the writer isn't defined
+            # yet and nested records might refer to this parent schema name
+            fullname = get_fullname(schema)
+            custom_schema[fullname] = schema
+            schema_cache[fullname] = placeholder
+            writer = logical_writer(schema, writer_type_map[schema_type](schema, **options), options)
+            # now that we've returned, assign the writer to the placeholder
+            # so that the execution will work
+            placeholder.writer = writer
+            return writer
+        try:
+            writer = logical_writer(schema, writer_type_map[schema_type](schema, **options), options)
+        except KeyError:
+            # lookup the schema by unique previously defined name,
+            # i.e. a custom type
+            writer = linked(schema_cache[schema_type])
 
-    if schema_type in ('record', 'fixed', 'enum'):
-        placeholder = WriterPlaceholder()
-        # using a placeholder because this is recursive and the writer isn't defined
-        # yet and nested records might refer to this parent schema name
-        namespace = schema.get('namespace')
-        name = schema.get('name')
-        if namespace and "." not in name:
-            fullname = '.'.join([namespace, name])
+        return writer
+
+
+# ======================================================================
+# Validation. A validator returns None for valid data, otherwise a list
+# holding the error message followed by the path segments from the failing
+# value back up to the root, which error_path() joins into a path like
+# 'payload.items[3].price'. The list is only built when validation fails.
+
+cdef class ValidatorPlaceholder(Placeholder):
+    @property
+    def validator(self):
+        return self.target
+
+    @validator.setter
+    def validator(self, validator):
+        self.target = validator
+
+    def __call__(self, datum):
+        return self.target(datum)
+
+
+def error_path(list error):
+    '''Join the reversed path segments of a validation error'''
+    cdef list parts = []
+    for segment in reversed(error[1:]):
+        if isinstance(segment, int):
+            parts.append(u'[{}]'.format(segment))
+        elif segment.startswith(u'['):
+            parts.append(segment)
+        elif parts:
+            parts.append(u'.' + segment)
+        else:
+            parts.append(segment)
+    return u''.join(parts)
+
+
+cdef list invalid(datum, schema):
+    return [u'{} is not an example of {}'.format(repr(datum), json_type_name(schema))]
+
+
+def make_null_validator(schema, **options):
+    def validate_null(datum):
+        if datum is not None:
+            return invalid(datum, schema)
+    return validate_null
+
+
+def make_boolean_validator(schema, **options):
+    def validate_boolean(datum):
+        if not isinstance(datum, bool):
+            return invalid(datum, schema)
+    return validate_boolean
+
+
+def make_string_validator(schema, **options):
+    def validate_string(datum):
+        if not isinstance(datum, six.string_types):
+            return invalid(datum, schema)
+    return validate_string
+
+
+def make_bytes_validator(schema, **options):
+    def validate_bytes(datum):
+        if not isinstance(datum, bytes):
+            return invalid(datum, schema)
+    return validate_bytes
+
+
+def make_integer_validator(schema, **options):
+    cdef unicode schema_type = get_type(schema)
+    low, high = (INT_MIN_VALUE, INT_MAX_VALUE) if schema_type == 'int' else (LONG_MIN_VALUE, LONG_MAX_VALUE)
+
+    def validate_integer(datum):
+        if not isinstance(datum, six.integer_types):
+            return invalid(datum, schema)
+        if not low <= datum <= high:
+            return [u'{} overflows {}'.format(datum, schema_type)]
+    return validate_integer
+
+
+def make_number_validator(schema, **options):
+    def validate_number(datum):
+        if not isinstance(datum, (float,) + six.integer_types):
+            return invalid(datum, schema)
+    return validate_number
+
+
+def make_fixed_validator(schema, **options):
+    cdef long size = schema['size']
+
+    def validate_fixed(datum):
+        if not isinstance(datum, bytes) or len(datum) != size:
+            return invalid(datum, schema)
+    return validate_fixed
+
+
+def make_enum_validator(schema, **options):
+    cdef frozenset symbols = frozenset(schema['symbols'])
+
+    def validate_enum(datum):
+        try:
+            if datum in symbols:
+                return None
+        except TypeError:
+            pass
+        return invalid(datum, schema)
+    return validate_enum
+
+
+def make_array_validator(schema, **options):
+    '''Arrays are lists, or array.array, numpy arrays and other buffers
+    whose items fit the schema, see py_binary.array_items'''
+    from spavro.py_binary import array_items
+    item_validator = get_validator(schema['items'], **options)
+    boolean_items = get_type(schema['items']) == 'boolean'
+
+    def validate_array(datum):
+        cdef Py_ssize_t index
+        items = array_items(datum, boolean_items)
+        if items is None:
+            return invalid(datum, schema)
+        for index, item in enumerate(items):
+            error = item_validator(item)
+            if error is not None:
+                error.append(index)
+                return error
+    return validate_array
+
+
+def make_map_validator(schema, **options):
+    value_validator = get_validator(schema['values'], **options)
+
+    def validate_map(datum):
+        if not isinstance(datum, dict):
+            return invalid(datum, schema)
+        for key, value in datum.items():
+            if not isinstance(key, six.string_types):
+                return [u'{} is not a string map key'.format(repr(key))]
+            error = value_validator(value)
+            if error is not None:
+                import json
+                error.append(u'[{}]'.format(json.dumps(key)))
+                return error
+    return validate_map
+
+
+def make_record_validator(schema, **options):
+    '''Records are validated in all the forms the record writer takes, see
+    spavro.records'''
+    cdef list fields = [(field['name'], get_validator(field['type'], **options)) for field in schema['fields']]
+    cdef list names = [name for name, _ in fields]
+    cdef dict accessors = {}
+    from spavro.records import record_accessor
+
+    def validate_record(datum):
+        if type(datum) is dict:
+            values = [datum.get(name) for name in names]
+        else:
+            try:
+                accessor = accessors[type(datum)]
+            except KeyError:
+                accessor = accessors[type(datum)] = record_accessor(type(datum), names)
+            try:
+                values = accessor(datum)
+            except TypeError:
+                return invalid(datum, schema)
+        for (name, validator), value in zip(fields, values):
+            error = validator(value)
+            if error is not None:
+                error.append(name)
+                return error
+    return validate_record
+
+
+def make_union_validator(union_schema, **options):
+    cdef list validators = [get_validator(schema, **options) for schema in union_schema]
+    # when only one branch can hold the python type of the datum, its error
+    # tells more than the union's
+    cdef dict by_python_type = {}
+    for schema, validator in zip(union_schema, validators):
+        python_type = avro_to_py[get_type(lookup_validator_schema(schema))]
+        by_python_type[python_type] = validator if python_type not in by_python_type else None
+
+    def validate_union(datum):
+        for validator in validators:
+            if validator(datum) is None:
+                return None
+        branch = by_python_type.get(type(datum))
+        if branch is not None:
+            return branch(datum)
+        return [u'{} is not an example of any branch of {}'.format(
+            repr(datum), [json_type_name(lookup_validator_schema(schema)) for schema in union_schema])]
+    return validate_union
+
+
+def make_logical_validator(schema, validator, python_type):
+    '''Converted logical types also accept their python type'''
+    def validate_logical(datum):
+        if isinstance(datum, python_type):
+            return None
+        return validator(datum)
+    return validate_logical
+
+
+validator_type_map = {
+    'union': make_union_validator,
+    'record': make_record_validator,
+    'error': make_record_validator,
+    'null': make_null_validator,
+    'string': make_string_validator,
+    'boolean': make_boolean_validator,
+    'double': make_number_validator,
+    'float': make_number_validator,
+    'long': make_integer_validator,
+    'bytes': make_bytes_validator,
+    'int': make_integer_validator,
+    'fixed': make_fixed_validator,
+    'enum': make_enum_validator,
+    'array': make_array_validator,
+    'map': make_map_validator
+}
+
+validator_cache = {}
+validator_schema_cache = {}
+
+
+def lookup_validator_schema(schema):
+    if get_type(schema) in validator_type_map:
+        return schema
+    return validator_schema_cache[get_type(schema)]
+
+
+def get_validator(schema, **options):
+    '''Create a validator function for a schema, see error_path'''
+    cdef unicode schema_type = get_type(schema)
+    if schema_type in ('record', 'error', 'fixed', 'enum'):
+        placeholder = ValidatorPlaceholder()
+        fullname = get_fullname(schema)
+        validator_schema_cache[fullname] = schema
+        validator_cache[fullname] = placeholder
+        validator = validator_type_map[schema_type](schema, **options)
+        placeholder.validator = validator
+    else:
+        try:
+            validator = validator_type_map[schema_type](schema, **options)
+        except KeyError:
+            return linked(validator_cache[schema_type])
+    logical_type = get_logical_type(schema, options)
+    if logical_type is not None:
+        validator = make_logical_validator(schema, validator, logical_type_map[logical_type].get_python_type())
+    return validator
+
+
+def validate_many(validator, records):
+    '''Validate each of records, returning (index, error) for the invalid ones'''
+    cdef list errors = []
+    cdef Py_ssize_t index = 0
+    for datum in records:
+        error = validator(datum)
+        if error is not None:
+            errors.append((index, error))
+        index += 1
+    return errors
+
+
+# ======================================================================
+# Avro JSON encoding. The json readers take the already parsed JSON value
+# (e.g. from json.loads) and return the python datum, the json writers
+# return a value that can be passed straight to json.dumps. Following the
+# spec unions are encoded as {"type name": value} (null as just null) and
+# bytes/fixed as strings of the code points 0-255 (ISO-8859-1).
+
+def identity(datum):
+    return datum
+
+
+def json_type_name(schema):
+    '''The name a union branch is keyed with in the JSON encoding'''
+    cdef unicode schema_type = get_type(schema)
+    if schema_type in ('record', 'error', 'fixed', 'enum'):
+        return get_fullname(schema)
+    return schema_type
+
+
+def read_json_null(datum):
+    if datum is not None:
+        raise ValueError("{} - is not null".format(repr(datum)))
+    return None
+
+
+def read_json_float(datum):
+    return float(datum)
+
+
+def read_json_bytes(datum):
+    return datum.encode('iso-8859-1')
+
+
+def write_json_bytes(datum):
+    if isinstance(datum, unicode):
+        # same promotion as the binary writer, strings are utf-8 encoded
+        datum = datum.encode('utf-8')
+    return datum.decode('iso-8859-1')
+
+
+def make_json_union_reader(union_schema):
+    cdef dict readers = {}
+    for schema in union_schema:
+        reader = get_json_reader(schema)
+        name = json_type_name(lookup_json_schema(schema))
+        readers[name] = reader
+        # allow the short name for named types as well
+        readers.setdefault(name.split('.')[-1], reader)
+
+    def json_union_reader(datum):
+        if datum is None:
+            return None
+        try:
+            (name, value), = datum.items()
+            return readers[name](value)
+        except (AttributeError, ValueError, KeyError):
+            raise ValueError("{} - is not an encoded branch of union: {}".format(repr(datum), union_schema))
+    return json_union_reader
+
+
+def make_json_record_reader(schema):
+    fields = []
+    for field in schema['fields']:
+        reader = get_json_reader(field['type'])
+        if 'default' in field:
+            # defaults for unions are values of the first branch
+            default_schema = field['type'][0] if isinstance(field['type'], list) else field['type']
+            fields.append((field['name'], reader, True, get_json_reader(default_schema)(field['default'])))
+        else:
+            fields.append((field['name'], reader, False, None))
+
+    def json_record_reader(datum):
+        record = {}
+        for name, reader, has_default, default in fields:
+            try:
+                value = datum[name]
+            except KeyError:
+                if not has_default:
+                    raise ValueError("{} - missing field '{}' of record: {}".format(repr(datum), name, schema['name']))
+                record[name] = default
+            else:
+                record[name] = reader(value)
+        return record
+    return json_record_reader
+
+
+def make_json_array_reader(schema):
+    item_reader = get_json_reader(schema['items'])
+    if item_reader is identity:
+        return list
+
+    def json_array_reader(datum):
+        return [item_reader(item) for item in datum]
+    return json_array_reader
+
+
+def make_json_map_reader(schema):
+    value_reader = get_json_reader(schema['values'])
+    if value_reader is identity:
+        return dict
+
+    def json_map_reader(datum):
+        return {key: value_reader(value) for key, value in datum.items()}
+    return json_map_reader
+
+
+def make_json_enum_reader(schema):
+    cdef set symbols = set(schema['symbols'])
+
+    def json_enum_reader(datum):
+        if datum not in symbols:
+            raise ValueError("{} - is not a symbol of enum: {}".format(repr(datum), schema['name']))
+        return datum
+    return json_enum_reader
+
+
+json_reader_type_map = {
+    'union': make_json_union_reader,
+    'record': make_json_record_reader,
+    'error': make_json_record_reader,
+    'null': lambda schema: read_json_null,
+    'string': lambda schema: identity,
+    'boolean': lambda schema: identity,
+    'double': lambda schema: read_json_float,
+    'float': lambda schema: read_json_float,
+    'long': lambda schema: identity,
+    'bytes': lambda schema: read_json_bytes,
+    'int': lambda schema: identity,
+    'fixed': lambda schema: read_json_bytes,
+    'enum': make_json_enum_reader,
+    'array': make_json_array_reader,
+    'map': make_json_map_reader
+}
+
+json_reader_cache = {}
+json_schema_cache = {}
+
+
+def lookup_json_schema(schema):
+    '''Expand a reference to a named type to the named schema'''
+    if get_type(schema) in json_reader_type_map:
+        return schema
+    return json_schema_cache[get_type(schema)]
+
+
+def get_json_reader(schema):
+    '''Create a function that decodes a parsed Avro JSON value'''
+    cdef unicode schema_type = get_type(schema)
+    if schema_type in ('record', 'error', 'fixed', 'enum'):
+        placeholder = ReaderPlaceholder()
+        fullname = get_fullname(schema)
+        json_schema_cache[fullname] = schema
+        json_reader_cache[fullname] = placeholder
+        reader = json_reader_type_map[schema_type](schema)
+        placeholder.reader = reader
+        return reader
+    try:
+        reader = json_reader_type_map[schema_type](schema)
+    except KeyError:
+        reader = linked(json_reader_cache[schema_type])
+    return reader
+
+
+def make_json_union_writer(union_schema):
+    cdef list branches = []
+    cdef dict by_type = {}
+    cdef list record_branches = []
+    cdef dict record_writers = {}
+    record_object_branch = record_object_finder(record_branches)
+    for schema in union_schema:
+        expanded = lookup_json_schema(schema)
+        name = json_type_name(expanded)
+        if name == 'null':
+            writer = write_json_null_branch
         else:
-            fullname = name
+            writer = partial(write_json_branch, name, get_json_writer(schema))
+        if get_type(expanded) in ('record', 'error'):
+            record_branches.append((name, [field['name'] for field in expanded['fields']]))
+            record_writers[name] = writer
+        if get_type(expanded) == 'int':
+            # int and long share a python type but not a branch name
+            branch = (check_int_range, writer)
+        else:
+            branch = (get_check(schema), writer)
+        branches.append(branch)
+        by_type.setdefault(avro_to_py[get_type(expanded)], []).append(branch)
+
+    def json_union_writer(datum):
+        # when only one branch has the datum's python type there's nothing
+        # to check, otherwise test the candidate branches in order
+        candidates = by_type.get(type(datum), branches)
+        if len(candidates) == 1:
+            return candidates[0][1](datum)
+        for check, writer in candidates:
+            if check(datum):
+                return writer(datum)
+        for check, writer in branches:
+            if check(datum):
+                return writer(datum)
+        # records given as objects, like the binary union writer takes them
+        name = record_object_branch(datum)
+        if name is not None:
+            return record_writers[name](datum)
+        raise TypeError("{} - Invalid type ({}) in union. Schema: {}".format(repr(datum), type(datum), union_schema))
+    return json_union_writer
+
+
+def check_int_range(datum):
+    return isinstance(datum, (int, long)) and not isinstance(datum, bool) and -2147483648 <= datum <= 2147483647
+
+
+def write_json_null_branch(datum):
+    return None
+
+
+def write_json_branch(name, writer, datum):
+    return {name: writer(datum)}
+
+
+def make_json_record_writer(schema):
+    '''Records are taken in all the forms the binary record writer takes,
+    see spavro.records'''
+    cdef list fields = [WriteField(field['name'], get_json_writer(field['type'])) for field in schema['fields']]
+    cdef list names = [field.name for field in fields]
+    cdef dict accessors = {}
+    from spavro.records import record_accessor
+
+    def json_record_writer(datum):
+        if type(datum) is dict:
+            return {field.name: field.writer(datum.get(field.name)) for field in fields}
+        try:
+            accessor = accessors[type(datum)]
+        except KeyError:
+            accessor = accessors[type(datum)] = record_accessor(type(datum), names)
+        try:
+            values = accessor(datum)
+        except TypeError:
+            raise TypeError("{} - is not a record. Schema: {}".format(repr(datum), schema['name']))
+        return {field.name: field.writer(value) for field, value in zip(fields, values)}
+    return json_record_writer
+
+
+def make_json_array_writer(schema):
+    item_writer = get_json_writer(schema['items'])
+    if item_writer is identity:
+        # array.array and numpy arrays are written as lists
+        from spavro.py_binary import array_items
+        boolean_items = get_type(schema['items']) == 'boolean'
+
+        def json_list(datum):
+            items = array_items(datum, boolean_items)
+            return datum if items is None else items
+        return json_list
+
+    def json_array_writer(datum):
+        return [item_writer(item) for item in datum]
+    return json_array_writer
+
+
+def make_json_map_writer(schema):
+    value_writer = get_json_writer(schema['values'])
+    if value_writer is identity:
+        return identity
+
+    def json_map_writer(datum):
+        return {key: value_writer(value) for key, value in datum.items()}
+    return json_map_writer
+
+
+json_writer_type_map = {
+    'union': make_json_union_writer,
+    'record': make_json_record_writer,
+    'error': make_json_record_writer,
+    'null': lambda schema: identity,
+    'string': lambda schema: identity,
+    'boolean': lambda schema: identity,
+    'double': lambda schema: identity,
+    'float': lambda schema: identity,
+    'long': lambda schema: identity,
+    'bytes': lambda schema: write_json_bytes,
+    'int': lambda schema: identity,
+    'fixed': lambda schema: write_json_bytes,
+    'enum': lambda schema: identity,
+    'array': make_json_array_writer,
+    'map': make_json_map_writer
+}
+
+json_writer_cache = {}
+
+
+def get_json_writer(schema):
+    '''Create a function that turns a python datum into its Avro JSON value'''
+    cdef unicode schema_type = get_type(schema)
+    if schema_type in ('record', 'error', 'fixed', 'enum'):
+        placeholder = ReaderPlaceholder()
+        fullname = get_fullname(schema)
+        # the union writers check data against named types with get_check
         custom_schema[fullname] = schema
-        schema_cache[fullname] = placeholder
-        writer = writer_type_map[schema_type](schema)
-        # now that we've returned, assign the writer to the placeholder
-        # so that the execution will work
-        placeholder.writer = writer
+        json_schema_cache[fullname] = schema
+        json_writer_cache[fullname] = placeholder
+        writer = json_writer_type_map[schema_type](schema)
+        placeholder.reader = writer
         return writer
     try:
-        writer = writer_type_map[schema_type](schema)
+        writer = json_writer_type_map[schema_type](schema)
     except KeyError:
-        # lookup the schema by unique previously defined name,
-        # i.e. a custom type
-        writer = schema_cache[schema_type]
-
+        writer = linked(json_writer_cache[schema_type])
     return writer
 
 
+# ======================================================================
+# Binary to JSON text transcoding. The transcoders walk the binary encoding
+# and append JSON text fragments to an output list, so no python datum is
+# built along the way. avro_json selects between plain JSON (unions are
+# just their value) and the Avro JSON encoding (unions are wrapped).
+from json.encoder import encode_basestring_ascii
+
+
+cdef class TranscoderPlaceholder(Placeholder):
+    @property
+    def transcoder(self):
+        return self.target
+
+    @transcoder.setter
+    def transcoder(self, transcoder):
+        self.target = transcoder
+
+    def __call__(self, *args):
+        return self.target(*args)
+
+
+cdef unicode json_float(double value):
+    # the same spelling json.dumps uses
+    if value != value:
+        return u'NaN'
+    if value == float('inf'):
+        return u'Infinity'
+    if value == -float('inf'):
+        return u'-Infinity'
+    return unicode(repr(value))
+
+
+def transcode_null(fo, list out):
+    out.append(u'null')
+
+
+def transcode_boolean(fo, list out):
+    out.append(u'true' if read_boolean(fo) else u'false')
+
+
+def transcode_long(fo, list out):
+    out.append(unicode(read_long(fo)))
+
+
+def transcode_float(fo, list out):
+    out.append(json_float(read_float(fo)))
+
+
+def transcode_double(fo, list out):
+    out.append(json_float(read_double(fo)))
+
+
+def transcode_string(fo, list out):
+    out.append(encode_basestring_ascii(read_utf8(fo)))
+
+
+def transcode_bytes(fo, list out):
+    out.append(encode_basestring_ascii(read_bytes(fo).decode('iso-8859-1')))
+
+
+def make_fixed_transcoder(schema, bint avro_json):
+    cdef long size = schema['size']
+
+    def fixed_transcoder(fo, list out):
+        out.append(encode_basestring_ascii(fo.read(size).decode('iso-8859-1')))
+    return fixed_transcoder
+
+
+def make_enum_transcoder(schema, bint avro_json):
+    # symbols are encoded once up front
+    cdef list symbols = [encode_basestring_ascii(symbol) for symbol in schema['symbols']]
+
+    def enum_transcoder(fo, list out):
+        out.append(symbols[read_long(fo)])
+    return enum_transcoder
+
+
+def make_union_transcoder(union_schema, bint avro_json):
+    cdef list transcoders = []
+    cdef list prefixes = []
+    for schema in union_schema:
+        transcoders.append(get_json_transcoder(schema, avro_json))
+        name = json_type_name(lookup_json_schema(schema))
+        if avro_json and name != 'null':
+            prefixes.append(u'{' + encode_basestring_ascii(name) + u': ')
+        else:
+            prefixes.append(None)
+
+    def union_transcoder(fo, list out):
+        cdef long long union_index = read_long(fo)
+        try:
+            prefix = prefixes[union_index]
+        except IndexError:
+            raise TypeError("Unable to process union schema {}, union index '{}' doesn't exist.".format(repr(union_schema), union_index))
+        if prefix is None:
+            transcoders[union_index](fo, out)
+        else:
+            out.append(prefix)
+            transcoders[union_index](fo, out)
+            out.append(u'}')
+    return union_transcoder
+
+
+def make_record_transcoder(schema, bint avro_json):
+    # the key of each field is encoded along with its separator
+    cdef list fields = []
+    for index, field in enumerate(schema['fields']):
+        key = encode_basestring_ascii(field['name']) + u': '
+        fields.append(((u'{' if index == 0 else u', ') + key, get_json_transcoder(field['type'], avro_json)))
+
+    def record_transcoder(fo, list out):
+        if not fields:
+            out.append(u'{}')
+            return
+        for prefix, transcoder in fields:
+            out.append(prefix)
+            transcoder(fo, out)
+        out.append(u'}')
+    return record_transcoder
+
+
+def make_array_transcoder(schema, bint avro_json):
+    item_transcoder = get_json_transcoder(schema['items'], avro_json)
+
+    def array_transcoder(fo, list out):
+        cdef long long block_count = read_long(fo)
+        cdef bint first = True
+        out.append(u'[')
+        while block_count != 0:
+            if block_count < 0:
+                block_count = -block_count
+                read_long(fo)
+            for _ in range(block_count):
+                if not first:
+                    out.append(u', ')
+                first = False
+                item_transcoder(fo, out)
+            block_count = read_long(fo)
+        out.append(u']')
+    return array_transcoder
+
+
+def make_map_transcoder(schema, bint avro_json):
+    value_transcoder = get_json_transcoder(schema['values'], avro_json)
+
+    def map_transcoder(fo, list out):
+        cdef long long block_count = read_long(fo)
+        cdef bint first = True
+        out.append(u'{')
+        while block_count != 0:
+            if block_count < 0:
+                block_count = -block_count
+                read_long(fo)
+            for _ in range(block_count):
+                if not first:
+                    out.append(u', ')
+                first = False
+                out.append(encode_basestring_ascii(read_utf8(fo)))
+                out.append(u': ')
+                value_transcoder(fo, out)
+            block_count = read_long(fo)
+        out.append(u'}')
+    return map_transcoder
+
+
+transcoder_type_map = {
+    'union': make_union_transcoder,
+    'record': make_record_transcoder,
+    'error': make_record_transcoder,
+    'null': lambda schema, avro_json: transcode_null,
+    'string': lambda schema, avro_json: transcode_string,
+    'boolean': lambda schema, avro_json: transcode_boolean,
+    'double': lambda schema, avro_json: transcode_double,
+    'float': lambda schema, avro_json: transcode_float,
+    'long': lambda schema, avro_json: transcode_long,
+    'bytes': lambda schema, avro_json: transcode_bytes,
+    'int': lambda schema, avro_json: transcode_long,
+    'fixed': make_fixed_transcoder,
+    'enum': make_enum_transcoder,
+    'array': make_array_transcoder,
+    'map': make_map_transcoder
+}
+
+transcoder_cache = {}
+
+
+def get_json_transcoder(schema, avro_json=False):
+    '''Create a function that reads a binary encoded datum from fo and appends
+    its JSON text to the list out: transcoder(fo, out)'''
+    cdef unicode schema_type = get_type(schema)
+    if schema_type in ('record', 'error', 'fixed', 'enum'):
+        placeholder = TranscoderPlaceholder()
+        fullname = get_fullname(schema)
+        # union branches are named by the expanded schema
+        json_schema_cache[fullname] = schema
+        transcoder_cache[(fullname, avro_json)] = placeholder
+        transcoder = transcoder_type_map[schema_type](schema, avro_json)
+        placeholder.transcoder = transcoder
+        return transcoder
+    try:
+        transcoder = transcoder_type_map[schema_type](schema, avro_json)
+    except KeyError:
+        transcoder = linked(transcoder_cache[(schema_type, avro_json)])
+    return transcoder
+
+
+# ======================================================================
+# JSON text to binary transcoding. The transcoders read one JSON value from
+# a unicode string starting at pos, write its binary encoding to fo and
+# return the position after the value: transcoder(text, pos, fo). Union
+# branches are picked from the JSON token, or from the {"branch": value}
+# wrapper when transcoding the Avro JSON encoding.
+from json.decoder import scanstring, JSONDecoder
+
+json_decoder = JSONDecoder()
+
+
+cdef Py_ssize_t skip_whitespace(unicode text, Py_ssize_t pos):
+    cdef Py_ssize_t length = len(text)
+    cdef Py_UCS4 char
+    while pos < length:
+        char = text[pos]
+        if char != u' ' and char != u'\n' and char != u'\t' and char != u'\r':
+            break
+        pos += 1
+    return pos
+
+
+cdef inline bint at_char(unicode text, Py_ssize_t pos, Py_UCS4 char):
+    return pos < len(text) and text[pos] == char
+
+
+cdef Py_ssize_t expect(unicode text, Py_ssize_t pos, unicode token) except -1:
+    pos = skip_whitespace(text, pos)
+    if not text.startswith(token, pos):
+        raise ValueError("Expecting '{}' at position {}".format(token, pos))
+    return pos + len(token)
+
+
+cdef Py_ssize_t expect_char(unicode text, Py_ssize_t pos, Py_UCS4 char) except -1:
+    pos = skip_whitespace(text, pos)
+    if not at_char(text, pos, char):
+        raise ValueError("Expecting '{}' at position {}".format(char, pos))
+    return pos + 1
+
+
+cdef Py_ssize_t number_end(unicode text, Py_ssize_t pos):
+    # digits along with the spellings of NaN and Infinity
+    cdef Py_ssize_t length = len(text)
+    cdef Py_UCS4 char
+    while pos < length:
+        char = text[pos]
+        if not (u'0' <= char <= u'9' or char == u'-' or char == u'.' or char == u'e'
+                or char == u'E' or char == u'+' or char in u'INaifnty'):
+            break
+        pos += 1
+    return pos
+
+
+cdef bint is_integer_token(unicode token):
+    return token.lstrip(u'-').isdigit()
+
+
+cdef tuple read_json_string(unicode text, Py_ssize_t pos):
+    '''Return the (unescaped string, end position) of the string at pos'''
+    pos = skip_whitespace(text, pos)
+    if pos >= len(text) or text[pos] != u'"':
+        raise ValueError("Expecting a string at position {}".format(pos))
+    return scanstring(text, pos + 1)
+
+
+def json_to_null(unicode text, Py_ssize_t pos, fo):
+    return expect(text, pos, u'null')
+
+
+def json_to_boolean(unicode text, Py_ssize_t pos, fo):
+    pos = skip_whitespace(text, pos)
+    if text.startswith(u'true', pos):
+        write_boolean(fo, 1)
+        return pos + 4
+    if text.startswith(u'false', pos):
+        write_boolean(fo, 0)
+        return pos + 5
+    raise ValueError("Expecting a boolean at position {}".format(pos))
+
+
+cdef tuple read_json_number(unicode text, Py_ssize_t pos):
+    pos = skip_whitespace(text, pos)
+    cdef Py_ssize_t end = number_end(text, pos)
+    if end == pos:
+        raise ValueError("Expecting a number at position {}".format(pos))
+    return text[pos:end], end
+
+
+def json_to_int(unicode text, Py_ssize_t pos, fo):
+    token, end = read_json_number(text, pos)
+    if not is_integer_token(token):
+        raise ValueError("{} - is not an integer".format(token))
+    value = int(token)
+    if not INT_MIN_VALUE <= value <= INT_MAX_VALUE:
+        raise ValueError("{} - out of range for int".format(token))
+    write_long(fo, value)
+    return end
+
+
+def json_to_long(unicode text, Py_ssize_t pos, fo):
+    token, end = read_json_number(text, pos)
+    if not is_integer_token(token):
+        raise ValueError("{} - is not an integer".format(token))
+    value = int(token)
+    if not LONG_MIN_VALUE <= value <= LONG_MAX_VALUE:
+        raise ValueError("{} - out of range for long".format(token))
+    write_long(fo, value)
+    return end
+
+
+def json_to_float(unicode text, Py_ssize_t pos, fo):
+    token, end = read_json_number(text, pos)
+    write_float(fo, float(token))
+    return end
+
+
+def json_to_double(unicode text, Py_ssize_t pos, fo):
+    token, end = read_json_number(text, pos)
+    write_double(fo, float(token))
+    return end
+
+
+def json_to_string(unicode text, Py_ssize_t pos, fo):
+    value, end = read_json_string(text, pos)
+    write_utf8(fo, value)
+    return end
+
+
+def json_to_bytes(unicode text, Py_ssize_t pos, fo):
+    value, end = read_json_string(text, pos)
+    write_bytes(fo, value.encode('iso-8859-1'))
+    return end
+
+
+def make_fixed_json_to_binary(schema, bint avro_json):
+    cdef long size = schema['size']
+
+    def fixed_json_to_binary(unicode text, Py_ssize_t pos, fo):
+        value, end = read_json_string(text, pos)
+        value = value.encode('iso-8859-1')
+        if len(value) != size:
+            raise ValueError("{} - is not {} bytes long".format(repr(value), size))
+        fo.write(value)
+        return end
+    return fixed_json_to_binary
+
+
+def make_enum_json_to_binary(schema, bint avro_json):
+    cdef dict symbols = {symbol: index for index, symbol in enumerate(schema['symbols'])}
+
+    def enum_json_to_binary(unicode text, Py_ssize_t pos, fo):
+        value, end = read_json_string(text, pos)
+        try:
+            write_long(fo, symbols[value])
+        except KeyError:
+            raise ValueError("{} - is not a symbol of enum: {}".format(repr(value), schema['name']))
+        return end
+    return enum_json_to_binary
+
+
+def make_array_json_to_binary(schema, bint avro_json):
+    item_transcoder = get_binary_transcoder(schema['items'], avro_json)
+
+    def array_json_to_binary(unicode text, Py_ssize_t pos, fo):
+        # the item count comes first in the binary encoding, so the items
+        # are encoded into a buffer until the end of the array
+        cdef long count = 0
+        pos = expect_char(text, pos, u'[')
+        buff = BytesIO()
+        pos = skip_whitespace(text, pos)
+        if at_char(text, pos, u']'):
+            pos += 1
+        else:
+            while True:
+                pos = item_transcoder(text, pos, buff)
+                count += 1
+                pos = skip_whitespace(text, pos)
+                if at_char(text, pos, u']'):
+                    pos += 1
+                    break
+                pos = expect_char(text, pos, u',')
+        if count:
+            write_long(fo, count)
+            fo.write(buff.getvalue())
+        write_long(fo, 0)
+        return pos
+    return array_json_to_binary
+
+
+def make_map_json_to_binary(schema, bint avro_json):
+    value_transcoder = get_binary_transcoder(schema['values'], avro_json)
+
+    def map_json_to_binary(unicode text, Py_ssize_t pos, fo):
+        cdef long count = 0
+        pos = expect_char(text, pos, u'{')
+        buff = BytesIO()
+        pos = skip_whitespace(text, pos)
+        if at_char(text, pos, u'}'):
+            pos += 1
+        else:
+            while True:
+                key, pos = read_json_string(text, pos)
+                pos = expect_char(text, pos, u':')
+                write_utf8(buff, key)
+                pos = value_transcoder(text, pos, buff)
+                count += 1
+                pos = skip_whitespace(text, pos)
+                if at_char(text, pos, u'}'):
+                    pos += 1
+                    break
+                pos = expect_char(text, pos, u',')
+        if count:
+            write_long(fo, count)
+            fo.write(buff.getvalue())
+        write_long(fo, 0)
+        return pos
+    return map_json_to_binary
+
+
+cdef bytes encode_default(field_schema, default):
+    '''Binary encoding of a field default, defaults of unions are values of
+    the first branch'''
+    buff = BytesIO()
+    if isinstance(field_schema, list):
+        write_long(buff, 0)
+        field_schema = field_schema[0]
+    field_schema = lookup_json_schema(field_schema)
+    get_writer(field_schema)(buff, get_json_reader(field_schema)(default))
+    return buff.getvalue()
+
+
+def make_record_json_to_binary(schema, bint avro_json):
+    cdef list transcoders = []
+    cdef list defaults = []
+    cdef dict index = {}
+    for field_index, field in enumerate(schema['fields']):
+        index[field['name']] = field_index
+        transcoders.append(get_binary_transcoder(field['type'], avro_json))
+        defaults.append(encode_default(field['type'], field['default']) if 'default' in field else None)
+    cdef Py_ssize_t field_count = len(transcoders)
+
+    def record_json_to_binary(unicode text, Py_ssize_t pos, fo):
+        # fields that arrive in schema order are written straight through,
+        # the others are buffered until the fields before them are done
+        cdef Py_ssize_t next_field = 0
+        cdef list parts = [None] * field_count
+        pos = expect_char(text, pos, u'{')
+        pos = skip_whitespace(text, pos)
+        if at_char(text, pos, u'}'):
+            pos += 1
+        else:
+            while True:
+                key, pos = read_json_string(text, pos)
+                pos = expect_char(text, pos, u':')
+                field_index = index.get(key)
+                if field_index is None:
+                    # not part of the schema, skip the value
+                    pos = json_decoder.raw_decode(text, skip_whitespace(text, pos))[1]
+                elif field_index == next_field:
+                    pos = transcoders[field_index](text, pos, fo)
+                    next_field += 1
+                    while next_field < field_count and parts[next_field] is not None:
+                        fo.write(parts[next_field])
+                        next_field += 1
+                else:
+                    buff = BytesIO()
+                    pos = transcoders[field_index](text, pos, buff)
+                    parts[field_index] = buff.getvalue()
+                pos = skip_whitespace(text, pos)
+                if at_char(text, pos, u'}'):
+                    pos += 1
+                    break
+                pos = expect_char(text, pos, u',')
+        while next_field < field_count:
+            part = parts[next_field]
+            if part is None:
+                part = defaults[next_field]
+                if part is None:
+                    raise ValueError("Missing field '{}' of record: {}".format(schema['fields'][next_field]['name'], schema['name']))
+            fo.write(part)
+            next_field += 1
+        return pos
+    return record_json_to_binary
+
+
+cdef bint branch_accepts(schema, value):
+    '''Check a decoded JSON value against a union branch in plain JSON, only
+    used when the JSON token alone matches more than one branch'''
+    cdef unicode schema_type = get_type(schema)
+    if schema_type in ('int', 'long'):
+        if isinstance(value, float):
+            return False
+        if schema_type == 'int':
+            return INT_MIN_VALUE <= value <= INT_MAX_VALUE
+        return LONG_MIN_VALUE <= value <= LONG_MAX_VALUE
+    if schema_type in ('float', 'double', 'string', 'map'):
+        return True
+    if schema_type == 'bytes':
+        return all(ord(char) < 256 for char in value)
+    if schema_type == 'fixed':
+        return len(value) == schema['size'] and all(ord(char) < 256 for char in value)
+    if schema_type == 'enum':
+        return value in schema['symbols']
+    if schema_type in ('record', 'error'):
+        names = set(field['name'] for field in schema['fields'])
+        required = set(field['name'] for field in schema['fields'] if 'default' not in field)
+        return required.issubset(value) and names.issuperset(value)
+    return False
+
+
+# the JSON token each avro type is written as, keyed by its first character
+json_token_types = {
+    'null': u'n',
+    'boolean': u'tf',
+    'int': u'-0123456789',
+    'long': u'-0123456789',
+    'float': u'-0123456789NI',
+    'double': u'-0123456789NI',
+    'string': u'"',
+    'bytes': u'"',
+    'fixed': u'"',
+    'enum': u'"',
+    'array': u'[',
+    'map': u'{',
+    'record': u'{',
+    'error': u'{'
+}
+
+
+def make_union_json_to_binary(union_schema, bint avro_json):
+    cdef dict by_token = {}
+    cdef dict by_name = {}
+    for union_index, schema in enumerate(union_schema):
+        expanded = lookup_json_schema(schema)
+        branch = (union_index, expanded, get_binary_transcoder(schema, avro_json))
+        name = json_type_name(expanded)
+        by_name[name] = branch
+        by_name.setdefault(name.split('.')[-1], branch)
+        for token in json_token_types[get_type(expanded)]:
+            by_token.setdefault(token, []).append(branch)
+
+    def wrapped_union_json_to_binary(unicode text, Py_ssize_t pos, fo):
+        pos = skip_whitespace(text, pos)
+        if text.startswith(u'null', pos):
+            branch = by_name.get('null')
+            if branch is None:
+                raise ValueError("null is not a branch of union: {}".format(union_schema))
+            write_long(fo, branch[0])
+            return pos + 4
+        pos = expect_char(text, pos, u'{')
+        name, pos = read_json_string(text, pos)
+        try:
+            union_index, _, transcoder = by_name[name]
+        except KeyError:
+            raise ValueError("{} - is not a branch of union: {}".format(repr(name), union_schema))
+        pos = expect_char(text, pos, u':')
+        write_long(fo, union_index)
+        pos = transcoder(text, pos, fo)
+        return expect_char(text, pos, u'}')
+
+    def union_json_to_binary(unicode text, Py_ssize_t pos, fo):
+        pos = skip_whitespace(text, pos)
+        try:
+            candidates = by_token[text[pos]]
+        except (KeyError, IndexError):
+            raise ValueError("No branch of union {} for the value at position {}".format(union_schema, pos))
+        if len(candidates) > 1:
+            # decode the value to tell the matching branches apart
+            if text[pos] == u'"':
+                value = scanstring(text, pos + 1)[0]
+            else:
+                value = json_decoder.raw_decode(text, pos)[0]
+            for branch in candidates:
+                if branch_accepts(branch[1], value):
+                    break
+            else:
+                raise ValueError("{} - No branch of union {} matches".format(repr(value), union_schema))
+        else:
+            branch = candidates[0]
+        write_long(fo, branch[0])
+        return branch[2](text, pos, fo)
+
+    if avro_json:
+        return wrapped_union_json_to_binary
+    return union_json_to_binary
+
+
+binary_transcoder_type_map = {
+    'union': make_union_json_to_binary,
+    'record': make_record_json_to_binary,
+    'error': make_record_json_to_binary,
+    'null': lambda schema, avro_json: json_to_null,
+    'string': lambda schema, avro_json: json_to_string,
+    'boolean': lambda schema, avro_json: json_to_boolean,
+    'double': lambda schema, avro_json: json_to_double,
+    'float': lambda schema, avro_json: json_to_float,
+    'long': lambda schema, avro_json: json_to_long,
+    'bytes': lambda schema, avro_json: json_to_bytes,
+    'int': lambda schema, avro_json: json_to_int,
+    'fixed': make_fixed_json_to_binary,
+    'enum': make_enum_json_to_binary,
+    'array': make_array_json_to_binary,
+    'map': make_map_json_to_binary
+}
+
+binary_transcoder_cache = {}
+
+
+def get_binary_transcoder(schema, avro_json=False):
+    '''Create a function that parses a JSON value from text at pos and writes
+    its binary encoding to fo: transcoder(text, pos, fo) -> end position'''
+    cdef unicode schema_type = get_type(schema)
+    if schema_type in ('record', 'error', 'fixed', 'enum'):
+        placeholder = TranscoderPlaceholder()
+        fullname = get_fullname(schema)
+        json_schema_cache[fullname] = schema
+        binary_transcoder_cache[(fullname, avro_json)] = placeholder
+        transcoder = binary_transcoder_type_map[schema_type](schema, avro_json)
+        placeholder.transcoder = transcoder
+        return transcoder
+    try:
+        transcoder = binary_transcoder_type_map[schema_type](schema, avro_json)
+    except KeyError:
+        transcoder = linked(binary_transcoder_cache[(schema_type, avro_json)])
+    return transcoder
+
+
 import struct
 from binascii import crc32
 
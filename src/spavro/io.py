@@ -42,6 +42,7 @@ import struct
 from spavro import schema
 import sys
 from binascii import crc32
+from collections import namedtuple
 
 try:
     import json
@@ -122,8 +123,11 @@ def validate(expected_schema, datum):
     elif schema_type == 'enum':
         return datum in expected_schema.symbols
     elif schema_type == 'array':
-        return (isinstance(datum, list) and
-            False not in [validate(expected_schema.items, d) for d in datum])
+        # array.array and numpy arrays as well
+        from spavro.py_binary import array_items
+        items = array_items(datum, expected_schema.items.type == 'boolean')
+        return (items is not None and
+            False not in [validate(expected_schema.items, d) for d in items])
     elif schema_type == 'map':
         return (isinstance(datum, dict) and
             False not in [isinstance(k, six.string_types) for k in datum.keys()] and
@@ -136,18 +140,71 @@ def validate(expected_schema, datum):
             False not in
                 [validate(f.type, datum.get(f.name)) for f in expected_schema.fields])
 
+
+ValidationError = namedtuple('ValidationError', ['path', 'message'])
+
+
+class DatumValidator(object):
+    """Validate python data against a schema using a validator compiled
+    from the schema once, reporting where invalid data fails."""
+    def __init__(self, schema, logical_types=None):
+        """
+        logical_types accepts the python types of the given logical types
+        (or all of them for True) as FastDatumWriter does.
+        """
+        self.schema = schema
+        self.check_datum = get_validator(schema.to_json(), logical_types=logical_types)
+
+    def validate(self, datum):
+        return self.check_datum(datum) is None
+
+    def first_error(self, datum):
+        """Return None for valid data, otherwise a ValidationError with the
+        path to the first failing value, e.g. 'payload.items[3].price'"""
+        error = self.check_datum(datum)
+        if error is None:
+            return None
+        return ValidationError(error_path(error), error[0])
+
+    def validate_many(self, records):
+        """Return a list of (index, ValidationError) for the invalid records"""
+        return [(index, ValidationError(error_path(error), error[0]))
+                for index, error in validate_many(self.check_datum, records)]
+
 #
 # Decoder/Encoder
 #
-import logging
-log = logging.getLogger(__name__)
+def get_log():
+    # logging is only imported when there's something to log, it's slow to
+    # import
+    import logging
+    return logging.getLogger(__name__)
+
+
 use_fast = False
 try:
-    from spavro.fast_binary import get_reader, get_writer
+    from spavro.fast_binary import get_reader, get_writer, get_type, get_fullname
+    from spavro.fast_binary import get_json_reader, get_json_writer
+    from spavro.fast_binary import get_json_transcoder, get_binary_transcoder
+    from spavro.fast_binary import get_validator, validate_many, error_path
+    from spavro.fast_binary import compile_program
     from spavro.fast_binary import FastBinaryEncoder, FastBinaryDecoder
     use_fast = True
 except ImportError:
-    log.warn("Failed to load spavro C extension, using default slow Encoder/Decoder")
+    get_log().warning("Failed to load spavro C extension, using the pure python readers and writers")
+    from spavro.py_binary import get_reader, get_writer, get_type, get_fullname
+
+    def needs_extension(feature):
+        '''Stands in for a fast_binary function without a python version'''
+        def unavailable(*args, **options):
+            raise ImportError("{} needs the spavro C extension".format(feature))
+        return unavailable
+    get_json_reader = needs_extension("JsonDatumReader")
+    get_json_writer = needs_extension("JsonDatumWriter")
+    get_json_transcoder = needs_extension("JsonTranscodingReader")
+    get_binary_transcoder = needs_extension("FastDatumWriter.write_json")
+    get_validator = needs_extension("DatumValidator")
+    compile_program = needs_extension("The 'bytecode' engine")
 from spavro.binary import BinaryEncoder as SlowBinaryEncoder, BinaryDecoder as SlowBinaryDecoder
 
 #
@@ -739,13 +796,68 @@ class FastDatumReader(object):
             return True
         return False
 
-    def __init__(self, writers_schema=None, readers_schema=None):
+    def __init__(self, writers_schema=None, readers_schema=None, record_type='dict', logical_types=None,
+                 engine='closure', plan_cache=None, record_factory=None, array_type='list'):
         """
         As defined in the Avro specification, we call the schema encoded
         in the data the "writer's schema", and the schema expected by the
         reader the "reader's schema".
+
+        record_type selects the python type records are decoded into, one of
+        'dict' (default), 'tuple', 'namedtuple', 'slots' or 'lazy'. The tuple
+        based types use one generated class per record schema and hold far
+        less memory per record than a dict. 'lazy' returns read only mapping
+        views that only decode a field when it's accessed.
+
+        record_factory maps record full names to callables, e.g. dataclasses,
+        attrs or slots classes, that build those records straight from the
+        field values instead. A factory whose parameters are the field names
+        is called with positional arguments, any other with keywords. Only the
+        'closure' engine supports it.
+
+        array_type 'array' reads arrays of int, long, float, double and
+        boolean into array.array (typecodes 'i', 'q', 'f', 'd' and 'b'),
+        'numpy' into numpy arrays, instead of lists of python numbers. Only
+        the 'closure' engine supports it.
+
+        logical_types is a list of the logical types (e.g. 'decimal',
+        'timestamp-millis') to convert to python objects while decoding, or
+        True to convert all of them. By default the underlying avro type is
+        returned. Defaults of reader fields missing from the writer's schema
+        are converted as well, except inside named types the field's schema
+        refers to by name.
+
+        engine selects how the reader is built: 'closure' (default) builds
+        a tree of closures, 'cython' generates the Cython source of a reader
+        specialized to the schema, decoding from the buffer of the decoder's
+        BytesIO (see spavro.codegen), and builds it, caching the build on
+        disk. It supports the 'dict' and 'tuple' record types and needs
+        Cython and a C compiler at run time. 'bytecode' compiles the schema
+        to opcodes run by one C loop over the buffer of the decoder's
+        BytesIO, it supports the 'dict', 'tuple' and 'namedtuple' record
+        types.
+
+        plan_cache is a spavro.plan_cache.PlanCache, the resolved schema
+        (and the bytecode program) of every writer's schema is then taken
+        from it, saving the schema resolution and compilation of data read
+        before, also in earlier processes.
         """
+        if engine not in ('closure', 'cython', 'bytecode'):
+            raise ValueError("Unknown reader engine: {}".format(repr(engine)))
+        if engine != 'closure' and not use_fast:
+            raise ValueError("The {} engine needs the spavro C extension".format(repr(engine)))
+        if engine != 'closure' and record_factory:
+            raise ValueError("The {} engine doesn't support record_factory".format(repr(engine)))
+        if engine != 'closure' and array_type != 'list':
+            raise ValueError("The {} engine doesn't support array_type".format(repr(engine)))
+        self.engine = engine
+        self.plan_cache = plan_cache
         self.schema_cache = {}
+        self.options = {'record_type': record_type, 'logical_types': logical_types}
+        if record_factory:
+            self.options['record_factory'] = record_factory
+        if array_type != 'list':
+            self.options['array_type'] = array_type
         if readers_schema:
             self.readers_schema = readers_schema
         if writers_schema:
@@ -770,16 +882,33 @@ class FastDatumReader(object):
         self._writers_schema = parsed_writer_schema
 
         # create the reader function from the schema
-        if hasattr(self, 'readers_schema'):
+        if not hasattr(self, 'readers_schema'):
+            self.readers_schema = parsed_writer_schema
+            readers_json = None
+        else:
+            readers_json = self.readers_schema.to_json()
+        program = None
+        if self.plan_cache is not None:
+            resolved_schema, program = self.plan_cache.plan(parsed_writer_schema.to_json(), readers_json,
+                                                            self.engine, **self.options)
+        elif readers_json is not None:
             # to_json is a terrible method name for something
             # that returns a python dict! :/
-            resolved_schema = resolve(parsed_writer_schema.to_json(), self.readers_schema.to_json())
+            resolved_schema = resolve(parsed_writer_schema.to_json(), readers_json)
         else:
             # if no reader schema, then the resolved schema is just the writers
             # schema
             resolved_schema = parsed_writer_schema.to_json()
-            self.readers_schema = parsed_writer_schema
-        self.read_datum = get_reader(resolved_schema)
+        if self.engine == 'closure':
+            self.read_datum = get_reader(resolved_schema, **self.options)
+        elif self.engine == 'bytecode':
+            if program is None:
+                program = compile_program(resolved_schema, **self.options)
+            self.read_datum = program
+        else:
+            from spavro.codegen import compile_reader
+            self.read_datum = compile_reader(resolved_schema, **self.options)
+        self.read_into_error = read_into_error(resolved_schema, self.options)
 
         # schema matching
         if not FastDatumReader.match_schemas(self.writers_schema, self.readers_schema):
@@ -791,6 +920,27 @@ class FastDatumReader(object):
         # and pass the underlying file object to the read_datum function
         return self.read_datum(decoder.reader)
 
+    def check_read_into(self):
+        '''Raise ValueError if read_into can't read the writer's schema into
+        a dict: it isn't a record schema or the records aren't mappings'''
+        if self.read_into_error is not None:
+            raise ValueError(self.read_into_error)
+
+    def read_into(self, decoder, record):
+        '''Read a record into the dict record instead of a new dict and
+        return it, for streaming through records without allocating one per
+        datum. The fields are overwritten and nested records refilled, keys
+        that aren't fields are left alone. The 'lazy' records and the dicts
+        read by the other engines are copied into the dict. Other record
+        types and schemas other than records raise ValueError before
+        anything is read.'''
+        self.check_read_into()
+        read_into = getattr(self.read_datum, 'read_into', None)
+        if read_into is None:
+            record.update(self.read(decoder))
+            return record
+        return read_into(decoder.reader, record)
+
     def read_data(self, writers_schema, readers_schema, decoder):
         resolved_schema = resolve(writers_schema.to_json(), readers_schema.to_json())
         # try:
@@ -801,9 +951,42 @@ class FastDatumReader(object):
         return datum_reader(decoder.reader)
 
 
+def read_into_error(resolved_schema, options):
+    '''Why FastDatumReader.read_into can't take the records of a resolved
+    schema, None when it can'''
+    schema_type = get_type(resolved_schema)
+    if schema_type not in ('record', 'error'):
+        return "read_into needs a record schema, not {}".format(repr(schema_type))
+    if get_fullname(resolved_schema) in (options.get('record_factory') or {}):
+        return "read_into can't fill a dict with the records of a record_factory"
+    if options['record_type'] not in ('dict', 'lazy'):
+        return "read_into can't fill a dict with {} records".format(repr(options['record_type']))
+    return None
+
+
 class FastDatumWriter(object):
     """FastDatumWriter for generic python objects."""
-    def __init__(self, writers_schema=None):
+    def __init__(self, writers_schema=None, logical_types=None, validate=True, union_type_key=None):
+        """
+        logical_types is a list of the logical types (or True for all of
+        them) that are converted from their python objects (e.g. datetime,
+        Decimal) while encoding.
+
+        validate=False skips the type and range checks of ints, longs,
+        strings, booleans and fixed values, for data that has already been
+        validated. Invalid data then only fails where the C conversion does
+        (e.g. a long that doesn't fit in 64 bits), and int values aren't
+        checked for overflowing 32 bits.
+
+        union_type_key names a dict key (e.g. '__type') that picks the union
+        branch of a dict by its type name, for records that can't be told
+        apart otherwise. Maps holding that key can't be written in those
+        unions, so it's off by default. Any datum can also be written as
+        spavro.records.Branch(branch name, datum).
+        """
+        self.options = {'logical_types': logical_types, 'validate': validate}
+        if union_type_key is not None:
+            self.options['union_type_key'] = union_type_key
         self.writers_schema = writers_schema
         self.schema_cache = {}
 
@@ -817,17 +1000,36 @@ class FastDatumWriter(object):
         if parsed_writer_schema:
             # to_json is a terrible method name for something
             # that returns a python dict! :/
-            self.write_datum = get_writer(parsed_writer_schema.to_json())
+            self.write_datum = get_writer(parsed_writer_schema.to_json(), **self.options)
+        self.json_transcoders = {}
 
     def write(self, datum, encoder):
         # validate datum
         try:
             self.write_datum(encoder.writer, datum)
         except TypeError as ex:
-            log.error(self.write_datum)
-            log.exception("type error")
+            get_log().error(self.write_datum)
+            get_log().exception("type error")
             raise AvroTypeException(self.writers_schema, datum)
 
+    def write_json(self, json_text, encoder, avro_json=False):
+        """Write a datum given as JSON text, parsing the text straight into
+        the binary encoding. Union branches are picked from the JSON values,
+        with avro_json the text is in the Avro JSON encoding instead."""
+        try:
+            transcode = self.json_transcoders[avro_json]
+        except KeyError:
+            transcode = get_binary_transcoder(self.writers_schema.to_json(), avro_json)
+            self.json_transcoders[avro_json] = transcode
+        if isinstance(json_text, bytes):
+            json_text = json_text.decode('utf-8')
+        try:
+            end = transcode(json_text, 0, encoder.writer)
+        except (TypeError, ValueError):
+            raise AvroTypeException(self.writers_schema, json_text)
+        if json_text[end:].strip():
+            raise AvroTypeException(self.writers_schema, json_text)
+
     def write_data(self, schema, datum, encoder):
         try:
             datum_writer = self.schema_cache[str(schema)]
@@ -836,13 +1038,100 @@ class FastDatumWriter(object):
             self.schema_cache[str(schema)] = datum_writer
         datum_writer(encoder.writer, datum)
 
+
+#
+# Avro JSON encoding
+#
+
+class JsonDatumReader(object):
+    """Decode data in the Avro JSON encoding, where unions are wrapped
+    as {"branch type": value} and bytes are ISO-8859-1 strings."""
+    def __init__(self, writers_schema=None):
+        self.writers_schema = writers_schema
+
+    @property
+    def writers_schema(self):
+        return self._writers_schema
+
+    @writers_schema.setter
+    def writers_schema(self, parsed_writer_schema):
+        self._writers_schema = parsed_writer_schema
+        if parsed_writer_schema:
+            self.read_datum = get_json_reader(parsed_writer_schema.to_json())
+
+    def read(self, json_text):
+        return self.read_json(json.loads(json_text))
+
+    def read_json(self, json_data):
+        """Decode an already parsed JSON value"""
+        try:
+            return self.read_datum(json_data)
+        except (TypeError, ValueError, AttributeError):
+            raise AvroTypeException(self.writers_schema, json_data)
+
+
+class JsonDatumWriter(object):
+    """Encode data in the Avro JSON encoding"""
+    def __init__(self, writers_schema=None):
+        self.writers_schema = writers_schema
+
+    @property
+    def writers_schema(self):
+        return self._writers_schema
+
+    @writers_schema.setter
+    def writers_schema(self, parsed_writer_schema):
+        self._writers_schema = parsed_writer_schema
+        if parsed_writer_schema:
+            self.write_datum = get_json_writer(parsed_writer_schema.to_json())
+
+    def write(self, datum):
+        return json.dumps(self.write_json(datum))
+
+    def write_json(self, datum):
+        """Return the JSON value (before serialization) of datum"""
+        try:
+            return self.write_datum(datum)
+        except (TypeError, ValueError, AttributeError):
+            raise AvroTypeException(self.writers_schema, datum)
+
+
+class JsonTranscodingReader(FastDatumReader):
+    """Read binary encoded data directly as JSON text, without building
+    the python datum in between. Works as the datum reader of a
+    DataFileReader, e.g. to convert a container file to JSON lines."""
+    def __init__(self, writers_schema=None, avro_json=False):
+        """
+        With avro_json the output is in the Avro JSON encoding (unions wrapped
+        as {"branch type": value}) and can be decoded again with a
+        JsonDatumReader, otherwise plain JSON is written.
+        """
+        self.avro_json = avro_json
+        FastDatumReader.__init__(self, writers_schema)
+
+    @property
+    def writers_schema(self):
+        return self._writers_schema
+
+    @writers_schema.setter
+    def writers_schema(self, parsed_writer_schema):
+        self._writers_schema = parsed_writer_schema
+        self.transcode = get_json_transcoder(parsed_writer_schema.to_json(), self.avro_json)
+
+    def read(self, decoder):
+        out = []
+        self.transcode(decoder.reader, out)
+        return u''.join(out)
+
+
 if use_fast:
     DatumReader = FastDatumReader
     DatumWriter = FastDatumWriter
     BinaryEncoder = FastBinaryEncoder
     BinaryDecoder = FastBinaryDecoder
 else:
-    DatumReader = SlowDatumReader
-    DatumWriter = SlowDatumWriter
+    # the same compiled reader/writer trees, built by spavro.py_binary
+    DatumReader = FastDatumReader
+    DatumWriter = FastDatumWriter
     BinaryEncoder = SlowBinaryEncoder
     BinaryDecoder = SlowBinaryDecoder
\ No newline at end of file
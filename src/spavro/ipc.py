@@ -19,7 +19,6 @@
 Support for inter-process calls.
 """
 import six
-from six.moves import http_client as httplib
 from six import BytesIO as StringIO
 from spavro import io
 from spavro import protocol
@@ -29,28 +28,49 @@ from spavro import schema
 # Constants
 #
 
-# Handshake schema is pulled in during build
-with open('./ipc/HandshakeRequest.avsc', 'rb') as handshake_request:
-    HANDSHAKE_REQUEST_SCHEMA = schema.parse(handshake_request.read().decode('utf-8'))
-# """
-# """)
-with open('./ipc/HandshakeResponse.avsc', 'rb') as handshake_response:
-    HANDSHAKE_RESPONSE_SCHEMA = schema.parse(handshake_response.read().decode('utf-8'))
-
-# HANDSHAKE_RESPONSE_SCHEMA = schema.parse("""
-# @HANDSHAKE_RESPONSE_SCHEMA@
-# """)
-
-HANDSHAKE_REQUESTOR_WRITER = io.DatumWriter(HANDSHAKE_REQUEST_SCHEMA)
-HANDSHAKE_REQUESTOR_READER = io.DatumReader(HANDSHAKE_RESPONSE_SCHEMA)
-HANDSHAKE_RESPONDER_WRITER = io.DatumWriter(HANDSHAKE_RESPONSE_SCHEMA)
-HANDSHAKE_RESPONDER_READER = io.DatumReader(HANDSHAKE_REQUEST_SCHEMA)
-
-META_SCHEMA = schema.parse('{"type": "map", "values": "bytes"}')
-META_WRITER = io.DatumWriter(META_SCHEMA)
-META_READER = io.DatumReader(META_SCHEMA)
-
-SYSTEM_ERROR_SCHEMA = schema.parse('["string"]')
+def parse_schema_file(path):
+  with open(path, 'rb') as schema_file:
+    return schema.parse(schema_file.read().decode('utf-8'))
+
+# The handshake and metadata schemas with their readers and writers are
+# built the first time they're used (see constant), importing the module
+# doesn't parse or compile anything. Handshake schemas are pulled in during
+# build.
+constant_makers = {
+  'HANDSHAKE_REQUEST_SCHEMA': lambda: parse_schema_file('./ipc/HandshakeRequest.avsc'),
+  'HANDSHAKE_RESPONSE_SCHEMA': lambda: parse_schema_file('./ipc/HandshakeResponse.avsc'),
+  'HANDSHAKE_REQUESTOR_WRITER': lambda: io.DatumWriter(constant('HANDSHAKE_REQUEST_SCHEMA')),
+  'HANDSHAKE_REQUESTOR_READER': lambda: io.DatumReader(constant('HANDSHAKE_RESPONSE_SCHEMA')),
+  'HANDSHAKE_RESPONDER_WRITER': lambda: io.DatumWriter(constant('HANDSHAKE_RESPONSE_SCHEMA')),
+  'HANDSHAKE_RESPONDER_READER': lambda: io.DatumReader(constant('HANDSHAKE_REQUEST_SCHEMA')),
+  'META_SCHEMA': lambda: schema.parse('{"type": "map", "values": "bytes"}'),
+  'META_WRITER': lambda: io.DatumWriter(constant('META_SCHEMA')),
+  'META_READER': lambda: io.DatumReader(constant('META_SCHEMA')),
+  'SYSTEM_ERROR_SCHEMA': lambda: schema.parse('["string"]'),
+}
+constants = {}
+
+def constant(name):
+  """Return one of the constant schemas, readers or writers, making it on
+  first use."""
+  try:
+    return constants[name]
+  except KeyError:
+    value = constants[name] = constant_makers[name]()
+    return value
+
+# the constants are also module attributes, standing in for the value until
+# it's made
+HANDSHAKE_REQUEST_SCHEMA = schema.LazyConstant(lambda: constant('HANDSHAKE_REQUEST_SCHEMA'))
+HANDSHAKE_RESPONSE_SCHEMA = schema.LazyConstant(lambda: constant('HANDSHAKE_RESPONSE_SCHEMA'))
+HANDSHAKE_REQUESTOR_WRITER = schema.LazyConstant(lambda: constant('HANDSHAKE_REQUESTOR_WRITER'))
+HANDSHAKE_REQUESTOR_READER = schema.LazyConstant(lambda: constant('HANDSHAKE_REQUESTOR_READER'))
+HANDSHAKE_RESPONDER_WRITER = schema.LazyConstant(lambda: constant('HANDSHAKE_RESPONDER_WRITER'))
+HANDSHAKE_RESPONDER_READER = schema.LazyConstant(lambda: constant('HANDSHAKE_RESPONDER_READER'))
+META_SCHEMA = schema.LazyConstant(lambda: constant('META_SCHEMA'))
+META_WRITER = schema.LazyConstant(lambda: constant('META_WRITER'))
+META_READER = schema.LazyConstant(lambda: constant('META_READER'))
+SYSTEM_ERROR_SCHEMA = schema.LazyConstant(lambda: constant('SYSTEM_ERROR_SCHEMA'))
 
 # protocol cache
 REMOTE_HASHES = {}
@@ -133,7 +153,7 @@ class BaseRequestor(object):
     request_datum['serverHash'] = remote_hash
     if self.send_protocol:
       request_datum['clientProtocol'] = str(self.local_protocol)
-    HANDSHAKE_REQUESTOR_WRITER.write(request_datum, encoder)
+    constant('HANDSHAKE_REQUESTOR_WRITER').write(request_datum, encoder)
 
   def write_call_request(self, message_name, request_datum, encoder):
     """
@@ -145,7 +165,7 @@ class BaseRequestor(object):
     """
     # request metadata (not yet implemented)
     request_metadata = {}
-    META_WRITER.write(request_metadata, encoder)
+    constant('META_WRITER').write(request_metadata, encoder)
 
     # message name
     message = self.local_protocol.messages.get(message_name)
@@ -161,7 +181,7 @@ class BaseRequestor(object):
     datum_writer.write(request_datum, encoder)
 
   def read_handshake_response(self, decoder):
-    handshake_response = HANDSHAKE_REQUESTOR_READER.read(decoder)
+    handshake_response = constant('HANDSHAKE_REQUESTOR_READER').read(decoder)
     match = handshake_response.get('match')
     if match == 'BOTH':
       self.send_protocol = False
@@ -196,7 +216,7 @@ class BaseRequestor(object):
           the error, serialized per the message's error union schema.
     """
     # response metadata
-    response_metadata = META_READER.read(decoder)
+    response_metadata = constant('META_READER').read(decoder)
 
     # remote response schema
     remote_message_schema = self.remote_protocol.messages.get(message_name)
@@ -278,7 +298,7 @@ class Responder(object):
         return buffer_writer.getvalue()
 
       # read request using remote protocol
-      request_metadata = META_READER.read(buffer_decoder)
+      request_metadata = constant('META_READER').read(buffer_decoder)
       remote_message_name = buffer_decoder.read_utf8()
 
       # get remote and local request schemas so we can do
@@ -305,7 +325,7 @@ class Responder(object):
         error = AvroRemoteException(str(e))
 
       # write response using local protocol
-      META_WRITER.write(response_metadata, buffer_encoder)
+      constant('META_WRITER').write(response_metadata, buffer_encoder)
       buffer_encoder.write_boolean(error is not None)
       if error is None:
         writers_schema = local_message.response
@@ -316,13 +336,13 @@ class Responder(object):
     except schema.AvroException as e:
       error = AvroRemoteException(str(e))
       buffer_encoder = io.BinaryEncoder(StringIO())
-      META_WRITER.write(response_metadata, buffer_encoder)
+      constant('META_WRITER').write(response_metadata, buffer_encoder)
       buffer_encoder.write_boolean(True)
-      self.write_error(SYSTEM_ERROR_SCHEMA, error, buffer_encoder)
+      self.write_error(constant('SYSTEM_ERROR_SCHEMA'), error, buffer_encoder)
     return buffer_writer.getvalue()
 
   def process_handshake(self, decoder, encoder):
-    handshake_request = HANDSHAKE_RESPONDER_READER.read(decoder)
+    handshake_request = constant('HANDSHAKE_RESPONDER_READER').read(decoder)
     handshake_response = {}
 
     # determine the remote protocol
@@ -350,7 +370,7 @@ class Responder(object):
       handshake_response['serverProtocol'] = str(self.local_protocol)
       handshake_response['serverHash'] = self.local_hash
 
-    HANDSHAKE_RESPONDER_WRITER.write(handshake_response, encoder)
+    constant('HANDSHAKE_RESPONDER_WRITER').write(handshake_response, encoder)
     return remote_protocol
 
   def invoke(self, local_message, request):
@@ -443,6 +463,7 @@ class HTTPTransceiver(object):
   Useful for clients but not for servers
   """
   def __init__(self, host, port, req_resource='/'):
+    from six.moves import http_client as httplib
     self.req_resource = req_resource
     self.conn = httplib.HTTPConnection(host, port)
     self.conn.connect()
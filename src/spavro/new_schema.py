@@ -1,3 +1,26 @@
+'''A lightweight, immutable schema model.
+
+parse_schema links a schema (in its JSON form) once into a graph of schema
+objects: a reference to a named type is the named schema object itself,
+so recursive records make the graph cyclic and nothing is looked up by
+name afterwards. The objects use __slots__ and can't be changed once built.
+
+fast_binary compiles readers and writers straight from the graph. Schema
+objects also allow the read only item access of schema dicts
+(schema['fields'], schema.get('logicalType')) for code written against
+parsed JSON.
+
+spavro.io doesn't use the graph: FastDatumReader compiles resolved schemas,
+whose 'skip' and default entries only exist as dicts, and a FastDatumWriter
+compiled from the graph writes no faster while taking twice as long to
+build.
+
+Named types keep their full name, so namespaces aren't stored apart from it,
+and their aliases as full names as well.'''
+
+import six
+
+from spavro.schema import SchemaParseException
 
 
 PRIMITIVE = (
@@ -11,10 +34,63 @@ PRIMITIVE = (
     u'double',
 )
 
+# the attributes of a schema dict that aren't kept in props
+RESERVED = ('type', 'name', 'namespace', 'aliases', 'fields', 'symbols', 'items', 'values', 'size')
+
 
 class Schema(object):
-    def to_json(self):
-        raise NotImplemented()
+    __slots__ = ('type', 'props')
+    # the slots holding the attributes of the schema dict, anything else is
+    # in props
+    attributes = {'type': 'type'}
+    named = False
+
+    def __init__(self, schema_type, props=None):
+        object.__setattr__(self, 'type', schema_type)
+        object.__setattr__(self, 'props', props or {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} objects are immutable".format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{} objects are immutable".format(type(self).__name__))
+
+    def __getitem__(self, key):
+        slot = self.attributes.get(key)
+        if slot is None:
+            return self.props[key]
+        return getattr(self, slot)
+
+    def get(self, key, default=None):
+        slot = self.attributes.get(key)
+        if slot is None:
+            return self.props.get(key, default)
+        return getattr(self, slot)
+
+    def __contains__(self, key):
+        return key in self.attributes or key in self.props
+
+    def __reduce__(self):
+        return (parse_schema, (self.to_json(),))
+
+    def to_json(self, names=None):
+        '''The JSON form of the schema, a named type is defined where it's
+        first used and referred to by its full name after that'''
+        if names is None:
+            names = set()
+        if self.named:
+            if self.fullname in names:
+                return self.fullname
+            names.add(self.fullname)
+        if len(self.attributes) == 1 and not self.props:
+            return self.type
+        schema = dict(self.props)
+        for attribute, slot in self.attributes.items():
+            value = getattr(self, slot)
+            if attribute == 'aliases' and not value:
+                continue
+            schema[attribute] = attribute_json(value, names)
+        return schema
 
     def __str__(self):
         return str(self.type)
@@ -23,80 +99,240 @@ class Schema(object):
         return "<{} type='{}'>".format(self.__class__.__name__, self)
 
 
+def attribute_json(value, names):
+    if isinstance(value, (Schema, RecordField)):
+        return value.to_json(names)
+    if isinstance(value, tuple):
+        return [attribute_json(item, names) for item in value]
+    return value
+
+
 class PrimitiveSchema(Schema):
-    def __init__(self, schema_name):
-        self.type = schema_name
+    __slots__ = ()
+
+
+# plain primitives have no properties, so one object per type is shared
+primitive_schemas = {schema_type: PrimitiveSchema(schema_type) for schema_type in PRIMITIVE}
+
+
+class NamedSchema(Schema):
+    __slots__ = ('fullname', 'aliases')
+    named = True
+
+    def __init__(self, schema_type, fullname, props=None):
+        Schema.__init__(self, schema_type, props)
+        object.__setattr__(self, 'fullname', fullname)
+        # set by parse_named
+        object.__setattr__(self, 'aliases', ())
+
+    def __str__(self):
+        return self.fullname
 
 
 class RecordField(object):
-    def __init__(self, fielddef):
-        self.name = fielddef['name']
-        self.type = parse_schema(fielddef['type'])
+    __slots__ = ('name', 'type', 'props')
+
+    def __init__(self, name, field_type, props=None):
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'type', field_type)
+        object.__setattr__(self, 'props', props or {})
+
+    attributes = {'name': 'name', 'type': 'type'}
+
+    __setattr__ = Schema.__setattr__
+    __delattr__ = Schema.__delattr__
+    __getitem__ = Schema.__getitem__
+    get = Schema.get
+    __contains__ = Schema.__contains__
+
+    has_default = property(lambda self: 'default' in self.props)
+    default = property(lambda self: self.props.get('default'))
+
+    def to_json(self, names):
+        field = dict(self.props)
+        field['name'] = self.name
+        field['type'] = self.type.to_json(names)
+        return field
 
     def __str__(self):
         return str(self.type)
 
     def __repr__(self):
-        return "<{} type='{}'>".format(self.__class__.__name__, self)
+        return "<{} name='{}' type='{}'>".format(self.__class__.__name__, self.name, self)
 
 
-class RecordSchema(Schema):
-    def __init__(self, schema):
-        self.name = schema['name']
-        self.type = schema['type']
-        self.fields = [RecordField(field) for field in schema['fields']]
+class RecordSchema(NamedSchema):
+    __slots__ = ('fields',)
+    attributes = {'type': 'type', 'name': 'fullname', 'aliases': 'aliases', 'fields': 'fields'}
 
+    def __init__(self, schema_type, fullname, props=None):
+        NamedSchema.__init__(self, schema_type, fullname, props)
+        # the fields are linked once the record itself is known, so they
+        # can refer to it
+        object.__setattr__(self, 'fields', ())
 
-class UnionSchema(Schema):
-    def __init__(self, schemas, names=None):
-        self.type = 'union'
-        self.schemas = [parse_schema(schema, names) for schema in schemas]
+    @property
+    def fields_dict(self):
+        return {field.name: field for field in self.fields}
+
+
+class EnumSchema(NamedSchema):
+    __slots__ = ('symbols',)
+    attributes = {'type': 'type', 'name': 'fullname', 'aliases': 'aliases', 'symbols': 'symbols'}
+
+    def __init__(self, fullname, symbols, props=None):
+        NamedSchema.__init__(self, u'enum', fullname, props)
+        object.__setattr__(self, 'symbols', tuple(symbols))
 
 
-class EnumSchema(Schema):
-    def __init__(self, schema):
-        self.type = 'enum'
-        self.symbols = schema['symbols']
-        self.name = schema.get('name', None)
+class FixedSchema(NamedSchema):
+    __slots__ = ('size',)
+    attributes = {'type': 'type', 'name': 'fullname', 'aliases': 'aliases', 'size': 'size'}
+
+    def __init__(self, fullname, size, props=None):
+        NamedSchema.__init__(self, u'fixed', fullname, props)
+        object.__setattr__(self, 'size', size)
 
 
 class ArraySchema(Schema):
-    def __init__(self, schema):
-        raise NotImplemented()
+    __slots__ = ('items',)
+    attributes = {'type': 'type', 'items': 'items'}
+
+    def __init__(self, items, props=None):
+        Schema.__init__(self, u'array', props)
+        object.__setattr__(self, 'items', items)
 
 
 class MapSchema(Schema):
-    def __init__(self, schema):
-        raise NotImplemented()
-
-
-class FixedSchema(Schema):
-    def __init__(self, schema):
-        raise NotImplemented()
-
-
-# all complex types are represented by dictionaries
-complex_types = {
-    'record': RecordSchema,
-    'enum': EnumSchema,
-    'array': ArraySchema,
-    'map': MapSchema,
-    'fixed': FixedSchema
-}
-
-
-def parse_schema(schema, names=None):
-    if type(schema) is list:
-        return UnionSchema(schema)
-    elif type(schema) is dict:
-        if schema['type'] in complex_types:
-            return complex_types[schema['type']](schema)
-        elif schema['type'] in PRIMITIVE:
-            # could add if 'logicalType' in schema as a double guard
-            # this handles annotated schemas and logical types
-            # ignores everything else in the dictionary
-            return parse_schema(schema['type'])
-    elif schema in PRIMITIVE:
-        return PrimitiveSchema(schema)
-
-    raise Exception("Invalid schema: {}".format(schema))
+    __slots__ = ('values',)
+    attributes = {'type': 'type', 'values': 'values'}
+
+    def __init__(self, values, props=None):
+        Schema.__init__(self, u'map', props)
+        object.__setattr__(self, 'values', values)
+
+
+class UnionSchema(Schema):
+    '''A union is used like the list of its branch schemas'''
+    __slots__ = ('schemas',)
+
+    def __init__(self, schemas):
+        Schema.__init__(self, u'union')
+        object.__setattr__(self, 'schemas', tuple(schemas))
+
+    # like a list a union has no attributes
+    attributes = {}
+
+    def __getitem__(self, index):
+        if isinstance(index, six.string_types):
+            raise KeyError(index)
+        return self.schemas[index]
+
+    def __iter__(self):
+        return iter(self.schemas)
+
+    def __len__(self):
+        return len(self.schemas)
+
+    def to_json(self, names=None):
+        if names is None:
+            names = set()
+        return [schema.to_json(names) for schema in self.schemas]
+
+
+class Names(object):
+    '''The named types defined so far while linking a schema'''
+    __slots__ = ('schemas',)
+
+    def __init__(self):
+        self.schemas = {}
+
+    def fullname(self, name, namespace):
+        if '.' in name or not namespace:
+            return name
+        return u'{}.{}'.format(namespace, name)
+
+    def add(self, schema):
+        if schema.fullname in PRIMITIVE or schema.fullname in self.schemas:
+            raise SchemaParseException("The name {} is already in use".format(repr(schema.fullname)))
+        self.schemas[schema.fullname] = schema
+
+    def lookup(self, name, namespace):
+        '''Find a referenced named type, a short name is looked up in the
+        enclosing namespace first'''
+        for fullname in (self.fullname(name, namespace), name):
+            if fullname in self.schemas:
+                return self.schemas[fullname]
+        raise SchemaParseException("Unknown type: {}".format(repr(name)))
+
+
+def other_props(schema):
+    return {key: value for key, value in schema.items() if key not in RESERVED}
+
+
+def parse_named(schema, names, namespace):
+    '''Create a record, enum or fixed schema and add it to the names'''
+    if not isinstance(schema.get('name'), six.string_types) or not schema['name']:
+        raise SchemaParseException("Named schemas need a name: {}".format(schema))
+    namespace = schema.get('namespace', namespace)
+    fullname = names.fullname(schema['name'], namespace)
+    schema_type = schema['type']
+    if schema_type in ('record', 'error'):
+        named = RecordSchema(schema_type, fullname, other_props(schema))
+    elif schema_type == 'enum':
+        named = EnumSchema(fullname, schema['symbols'], other_props(schema))
+    else:
+        named = FixedSchema(fullname, schema['size'], other_props(schema))
+    # aliases are relative to the namespace of the named type
+    aliases = [names.fullname(alias, namespace) for alias in schema.get('aliases') or ()]
+    object.__setattr__(named, 'aliases', tuple(aliases))
+    names.add(named)
+    if schema_type in ('record', 'error'):
+        # names in the fields default to the record's namespace
+        namespace = fullname.rpartition('.')[0]
+        fields = []
+        for field in schema['fields']:
+            props = {key: value for key, value in field.items() if key not in ('name', 'type')}
+            fields.append(RecordField(field['name'], parse_schema(field['type'], names, namespace), props))
+        if len(set(field.name for field in fields)) != len(fields):
+            raise SchemaParseException("Duplicate field names in record {}".format(fullname))
+        object.__setattr__(named, 'fields', tuple(fields))
+    return named
+
+
+def parse_schema(schema, names=None, namespace=None):
+    '''Link a schema in its JSON form (as returned by json.loads) into
+    schema objects'''
+    if names is None:
+        names = Names()
+    try:
+        if type(schema) is list:
+            return UnionSchema([parse_schema(branch, names, namespace) for branch in schema])
+        elif type(schema) is dict:
+            schema_type = schema.get('type')
+            if schema_type in ('record', 'error', 'enum', 'fixed'):
+                return parse_named(schema, names, namespace)
+            elif schema_type == 'array':
+                return ArraySchema(parse_schema(schema['items'], names, namespace), other_props(schema))
+            elif schema_type == 'map':
+                return MapSchema(parse_schema(schema['values'], names, namespace), other_props(schema))
+            elif schema_type in PRIMITIVE:
+                # annotated primitives (logical types) keep their properties
+                props = other_props(schema)
+                return PrimitiveSchema(schema_type, props) if props else primitive_schemas[schema_type]
+        elif schema in PRIMITIVE:
+            return primitive_schemas[schema]
+        elif isinstance(schema, six.string_types):
+            return names.lookup(schema, namespace)
+    except KeyError as e:
+        raise SchemaParseException("Missing {} in schema: {}".format(e, schema))
+    raise SchemaParseException("Invalid schema: {}".format(schema))
+
+
+try:
+    from spavro import fast_binary
+except ImportError:
+    pass
+else:
+    # fast_binary doesn't import this module, it learns the schema class here
+    fast_binary.GraphSchema = Schema
@@ -0,0 +1,129 @@
+# Copyright (C) 2018 Pluralsight LLC
+'''A persistent cache of reader plans.
+
+A plan is what a FastDatumReader works out for a writer's and reader's
+schema before reading: the resolved schema and, for the bytecode engine,
+the compiled opcode program. Plans are stored on disk by the fingerprint of
+both schemas, the engine and the reader options, so a new process opening
+data it has seen before skips schema resolution and compiling the program.
+
+Plans are kept under a directory per spavro version (and PLAN_FORMAT, the
+PROGRAM_FORMAT of the opcodes built into fast_binary and the python
+version), so a different build never reads them. A plan file holds
+the sha1 of its marshalled contents, files that don't match are ignored.
+Programs using python objects that can't be stored (the record classes of
+'namedtuple' records, converted logical types) are compiled when loaded,
+only their resolved schema is stored.'''
+
+import hashlib
+import json
+import marshal
+import os
+import sys
+from collections import namedtuple
+
+import spavro
+from spavro.codegen import default_cache_dir
+from spavro.fast_binary import compile_program, load_program, PROGRAM_FORMAT
+from spavro.schema_resolve import resolve
+
+# bumped whenever the layout of the plan files changes
+PLAN_FORMAT = 2
+
+Plan = namedtuple('Plan', ['schema', 'program'])
+
+
+def schema_json(schema):
+    return schema.to_json() if hasattr(schema, 'to_json') else schema
+
+
+class PlanCache(object):
+    '''Reader plans in memory and in cache_dir (default ~/.cache/spavro or
+    $SPAVRO_CACHE_DIR), pass it to FastDatumReader as plan_cache.'''
+    def __init__(self, cache_dir=None):
+        version = '{}-{}.{}-py{}{}'.format(spavro.__version__, PLAN_FORMAT, PROGRAM_FORMAT,
+                                           *sys.version_info[:2])
+        self.cache_dir = os.path.join(cache_dir or default_cache_dir(), 'plans', version)
+        self.plans = {}
+
+    def key(self, writers_schema, readers_schema, engine, options):
+        '''The fingerprint of a plan, None when the options can't be
+        serialized (e.g. they hold functions), those plans aren't stored'''
+        try:
+            text = json.dumps([writers_schema, readers_schema, engine, options], sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.plan')
+
+    def load(self, key):
+        '''Return the stored (resolved schema, opcodes, constants) of a key
+        or None when it's missing or damaged'''
+        try:
+            with open(self.path(key), 'rb') as plan_file:
+                data = plan_file.read()
+        except (IOError, OSError):
+            return None
+        digest, payload = data[:20], data[20:]
+        if hashlib.sha1(payload).digest() != digest:
+            return None
+        try:
+            stored = marshal.loads(payload)
+        except (EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(stored, tuple) or len(stored) != 3:
+            return None
+        return stored
+
+    def store(self, key, stored):
+        try:
+            payload = marshal.dumps(stored)
+        except ValueError:
+            # the program holds python objects, only keep the schema
+            payload = marshal.dumps((stored[0], None, None))
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            # write then rename so concurrent processes never see a partial file
+            temp_path = '{}.{}.tmp'.format(self.path(key), os.getpid())
+            with open(temp_path, 'wb') as plan_file:
+                plan_file.write(hashlib.sha1(payload).digest() + payload)
+            os.rename(temp_path, self.path(key))
+        except (IOError, OSError):
+            # the cache is an optimization, a read only or full disk isn't
+            # an error
+            pass
+
+    def plan(self, writers_schema, readers_schema=None, engine='closure', **options):
+        '''Return the Plan for reading data written with writers_schema as
+        readers_schema (parsed schemas or their JSON form). The program is
+        None unless the engine is 'bytecode'.'''
+        writers_schema = schema_json(writers_schema)
+        readers_schema = schema_json(readers_schema)
+        key = self.key(writers_schema, readers_schema, engine, options)
+        if key is not None and key in self.plans:
+            return self.plans[key]
+        stored = None if key is None else self.load(key)
+        if stored is None:
+            resolved = writers_schema if readers_schema is None else resolve(writers_schema, readers_schema)
+            program = compile_program(resolved, **options) if engine == 'bytecode' else None
+            if key is not None:
+                self.store(key, (resolved, program and program.opcodes, program and program.constants))
+        else:
+            resolved, opcodes, constants = stored
+            program = None
+            if engine == 'bytecode':
+                if opcodes is None:
+                    program = compile_program(resolved, **options)
+                else:
+                    try:
+                        program = load_program(resolved, opcodes, constants, **options)
+                    except ValueError:
+                        # not a valid program, e.g. a crafted plan file
+                        program = compile_program(resolved, **options)
+        plan = Plan(resolved, program)
+        if key is not None:
+            self.plans[key] = plan
+        return plan
@@ -0,0 +1,734 @@
+# Copyright (C) 2018 Pluralsight LLC
+'''Pure python version of the fast_binary reader and writer trees, used when
+the C extension can't be imported (PyPy, installs without a compiler).
+
+Like fast_binary the schema is parsed only once into a tree of closures, so
+reads and writes no longer consult the schema. The readers decode from the
+bytes of the file object rather than calling read() for every value: each
+reader takes the buffer and a position and returns the value with the
+position after it.
+
+Logical type conversion isn't supported, it needs the C extension.'''
+
+import array
+import struct
+from collections import namedtuple
+
+import six
+
+from spavro.records import Branch, record_accessor, is_record_object
+
+INT_MIN_VALUE = -(1 << 31)
+INT_MAX_VALUE = (1 << 31) - 1
+LONG_MIN_VALUE = -(1 << 63)
+LONG_MAX_VALUE = (1 << 63) - 1
+
+numeric_typecodes = {'int': 'i', 'long': 'q', 'float': 'f', 'double': 'd', 'boolean': 'b'}
+numeric_dtypes = {'i': 'int32', 'q': 'int64', 'f': 'float32', 'd': 'float64', 'b': 'bool'}
+
+# the first read of a datum from a file without getvalue
+file_chunk_size = 4096
+
+float_struct = struct.Struct('<f')
+double_struct = struct.Struct('<d')
+
+
+def get_type(schema):
+    if isinstance(schema, list):
+        return u"union"
+    elif isinstance(schema, dict):
+        return six.text_type(schema['type'])  # "record"
+    else:
+        return six.text_type(schema)
+
+
+def get_fullname(schema):
+    '''Return the namespace qualified name of a named schema'''
+    namespace = schema.get('namespace')
+    name = schema.get('name')
+    if namespace and "." not in name:
+        return '.'.join([namespace, name])
+    return name
+
+
+def check_options(options):
+    if options.get('logical_types'):
+        raise ValueError("Logical type conversion needs the fast_binary extension")
+    record_type = options.get('record_type', 'dict')
+    if record_type not in ('dict', 'tuple', 'namedtuple'):
+        raise ValueError("Unknown record type without the fast_binary extension: {}".format(repr(record_type)))
+    if options.get('array_type', 'list') not in ('list', 'array', 'numpy'):
+        raise ValueError("Unknown array type: {}".format(repr(options['array_type'])))
+
+# ======================================================================
+# buffer readers, read_x(buf, pos) -> (value, position after the value)
+
+
+def read_long(buf, pos):
+    '''Read a long using zig-zag binary encoding'''
+    byte = buf[pos]
+    pos += 1
+    accum = byte & 0x7F
+    shift = 7
+    while byte & 0x80:
+        byte = buf[pos]
+        pos += 1
+        accum |= (byte & 0x7F) << shift
+        shift += 7
+    return (accum >> 1) ^ -(accum & 1), pos
+
+
+def take(buf, pos, size):
+    end = pos + size
+    if size < 0 or end > len(buf):
+        raise EOFError("Unexpected end of avro data at byte {}".format(pos))
+    return end
+
+
+def read_null(buf, pos):
+    return None, pos
+
+
+def read_boolean(buf, pos):
+    end = take(buf, pos, 1)
+    return buf[pos] == 1, end
+
+
+def read_float(buf, pos):
+    end = take(buf, pos, 4)
+    return float_struct.unpack_from(buf, pos)[0], end
+
+
+def read_double(buf, pos):
+    end = take(buf, pos, 8)
+    return double_struct.unpack_from(buf, pos)[0], end
+
+
+def read_bytes(buf, pos):
+    size, pos = read_long(buf, pos)
+    end = take(buf, pos, size)
+    return bytes(buf[pos:end]), end
+
+
+def read_utf8(buf, pos):
+    size, pos = read_long(buf, pos)
+    end = take(buf, pos, size)
+    return six.text_type(buf[pos:end], 'utf-8'), end
+
+
+def make_union_reader(union_schema, **options):
+    readers = [get_buffer_reader(schema, **options) for schema in union_schema]
+    branch_count = len(readers)
+
+    def union_reader(buf, pos):
+        '''Read the long index for which schema to process, then use that'''
+        union_index, pos = read_long(buf, pos)
+        if not 0 <= union_index < branch_count:
+            raise TypeError("Unable to process union schema {}, union index '{}' doesn't exist. This is most likely because the read schema being used is not compatible with the write schema used to write the data.".format(repr(union_schema), union_index))
+        return readers[union_index](buf, pos)
+    return union_reader
+
+
+record_class_cache = {}
+
+
+def get_record_class(schema, field_names):
+    '''Return the namedtuple class of a record schema'''
+    key = (get_fullname(schema), tuple(field_names))
+    try:
+        return record_class_cache[key]
+    except KeyError:
+        pass
+    record_class = namedtuple(str(schema['name'].split('.')[-1]), [str(name) for name in field_names], rename=True)
+    record_class_cache[key] = record_class
+    return record_class
+
+
+def make_record_reader(schema, **options):
+    fields = [(field['name'], get_buffer_reader(field['type'], **options), get_type(field['type']) == 'skip')
+              for field in schema['fields']]
+    record_type = options.get('record_type', 'dict')
+    record_factory = (options.get('record_factory') or {}).get(get_fullname(schema))
+
+    if record_factory is not None:
+        # called with keywords, fast_binary also passes them positionally
+        def factory_record_reader(buf, pos):
+            values = {}
+            for name, reader, skip in fields:
+                value, pos = reader(buf, pos)
+                if not skip:
+                    values[name] = value
+            return record_factory(**values), pos
+        return factory_record_reader
+
+    if record_type == 'dict':
+        def record_reader(buf, pos):
+            record = {}
+            for name, reader, skip in fields:
+                value, pos = reader(buf, pos)
+                if not skip:
+                    record[name] = value
+            return record, pos
+        return record_reader
+
+    make_record = tuple
+    if record_type == 'namedtuple':
+        make_record = get_record_class(schema, [name for name, _, skip in fields if not skip])._make
+
+    def tuple_record_reader(buf, pos):
+        values = []
+        for name, reader, skip in fields:
+            value, pos = reader(buf, pos)
+            if not skip:
+                values.append(value)
+        return make_record(values), pos
+    return tuple_record_reader
+
+
+def make_enum_reader(schema, **options):
+    symbols = schema['symbols']
+
+    def enum_reader(buf, pos):
+        index, pos = read_long(buf, pos)
+        return symbols[index], pos
+    return enum_reader
+
+
+def make_array_reader(schema, **options):
+    item_reader = get_buffer_reader(schema['items'], **options)
+
+    def array_reader(buf, pos):
+        read_items = []
+        block_count, pos = read_long(buf, pos)
+        while block_count != 0:
+            if block_count < 0:
+                block_count = -block_count
+                _, pos = read_long(buf, pos)
+            for _ in range(block_count):
+                item, pos = item_reader(buf, pos)
+                read_items.append(item)
+            block_count, pos = read_long(buf, pos)
+        return read_items, pos
+
+    typecode = numeric_typecodes.get(get_type(schema['items']))
+    if typecode is not None and options.get('array_type', 'list') != 'list':
+        return make_numeric_array_reader(array_reader, typecode, options['array_type'])
+    return array_reader
+
+
+def make_numeric_array_reader(array_reader, typecode, array_type):
+    '''Arrays of numbers read into array.array or numpy arrays'''
+    if array_type == 'numpy':
+        import numpy
+        dtype = numpy.dtype(numeric_dtypes[typecode])
+
+    def numeric_array_reader(buf, pos):
+        items, pos = array_reader(buf, pos)
+        items = array.array(typecode, items)
+        if array_type == 'numpy':
+            items = numpy.frombuffer(items, dtype)
+        return items, pos
+    return numeric_array_reader
+
+
+def make_map_reader(schema, **options):
+    value_reader = get_buffer_reader(schema['values'], **options)
+
+    def map_reader(buf, pos):
+        read_items = {}
+        block_count, pos = read_long(buf, pos)
+        while block_count != 0:
+            if block_count < 0:
+                block_count = -block_count
+                _, pos = read_long(buf, pos)
+            for _ in range(block_count):
+                key, pos = read_utf8(buf, pos)
+                read_items[key], pos = value_reader(buf, pos)
+            block_count, pos = read_long(buf, pos)
+        return read_items, pos
+    return map_reader
+
+
+def make_fixed_reader(schema, **options):
+    size = schema['size']
+
+    def fixed_reader(buf, pos):
+        end = take(buf, pos, size)
+        return bytes(buf[pos:end]), end
+    return fixed_reader
+
+
+def make_skip_reader(schema, **options):
+    value_reader = get_buffer_reader(schema['value'], **options)
+
+    def read_skip(buf, pos):
+        return None, value_reader(buf, pos)[1]
+    return read_skip
+
+
+def make_default_reader(schema, **options):
+    value = schema["value"]
+
+    def read_default(buf, pos):
+        return value, pos
+    return read_default
+
+
+reader_type_map = {
+    'union': make_union_reader,
+    'record': make_record_reader,
+    'error': make_record_reader,
+    'null': lambda schema, **options: read_null,
+    'string': lambda schema, **options: read_utf8,
+    'boolean': lambda schema, **options: read_boolean,
+    'double': lambda schema, **options: read_double,
+    'float': lambda schema, **options: read_float,
+    'long': lambda schema, **options: read_long,
+    'bytes': lambda schema, **options: read_bytes,
+    'int': lambda schema, **options: read_long,
+    'fixed': make_fixed_reader,
+    'enum': make_enum_reader,
+    'array': make_array_reader,
+    'map': make_map_reader,
+    'skip': make_skip_reader,
+    'default': make_default_reader
+}
+
+schema_cache = {}
+
+
+class Placeholder(object):
+    '''Stands in for the reader, writer or check of a named type while it's
+    being built, recursive schemas refer to it'''
+    def __init__(self):
+        self.function = None
+
+    def __call__(self, *args):
+        return self.function(*args)
+
+
+def get_buffer_reader(schema, **options):
+    '''Create the buffer reader function for a (resolved) schema'''
+    schema_type = get_type(schema)
+    if schema_type in ('record', 'error', 'fixed', 'enum'):
+        # recursive schemas refer to the record before its reader exists
+        placeholder = Placeholder()
+        schema_cache[get_fullname(schema)] = placeholder
+        reader = reader_type_map[schema_type](schema, **options)
+        placeholder.function = reader
+        return reader
+    if schema_type in reader_type_map:
+        return reader_type_map[schema_type](schema, **options)
+    return schema_cache[schema_type]
+
+
+def get_reader(schema, **options):
+    '''Create the reader function for a (resolved) schema, used like
+    fast_binary.get_reader: the reader takes a file object, reads one datum
+    and leaves the file positioned after it.'''
+    check_options(options)
+    buffer_reader = get_buffer_reader(schema, **options)
+
+    def read_buffer(buf, start):
+        if six.PY2:
+            # py2 bytes index to single characters
+            buf = bytearray(buf)
+        try:
+            return buffer_reader(buf, start)
+        except (IndexError, struct.error):
+            raise EOFError("Unexpected end of avro data")
+
+    def read_file(fo):
+        # a file on disk, decode from a chunk and read twice as much while
+        # the datum runs past it, then go back to the datum end
+        buf = b''
+        size = file_chunk_size
+        while True:
+            more = fo.read(size)
+            buf += more
+            try:
+                datum, end = read_buffer(buf, 0)
+            except EOFError:
+                if not more:
+                    raise
+                size = len(buf)
+                continue
+            fo.seek(end - len(buf), 1)
+            return datum
+
+    def read_bytes_io(fo, getbuffer):
+        # a view of the BytesIO's bytes, getvalue() copies them on PyPy. The
+        # view is released after the datum, so the file can still be written
+        view = getbuffer()
+        try:
+            datum, end = read_buffer(view, fo.tell())
+        finally:
+            view.release()
+        fo.seek(end)
+        return datum
+
+    def reader(fo):
+        getbuffer = getattr(fo, 'getbuffer', None)
+        if getbuffer is not None:
+            return read_bytes_io(fo, getbuffer)
+        try:
+            # python 2 BytesIO
+            buf = fo.getvalue()
+        except AttributeError:
+            return read_file(fo)
+        datum, end = read_buffer(buf, fo.tell())
+        fo.seek(end)
+        return datum
+    return reader
+
+# ======================================================================
+# writers, write_x(outbuf, datum) writes to a file object
+
+
+def encode_long(datum):
+    '''zig-zag encode a long'''
+    datum = (datum << 1) ^ (datum >> 63)
+    encoded = bytearray()
+    while datum & ~0x7F:
+        encoded.append((datum & 0x7F) | 0x80)
+        datum >>= 7
+    encoded.append(datum)
+    return bytes(encoded)
+
+
+# union indexes, block counts and many lengths are small, those are looked up
+small_longs = [encode_long(datum) for datum in range(-64, 64)]
+
+
+def write_long(outbuf, datum):
+    if -64 <= datum < 64:
+        outbuf.write(small_longs[datum + 64])
+    else:
+        outbuf.write(encode_long(datum))
+
+
+def write_null(outbuf, datum):
+    pass
+
+
+def write_boolean(outbuf, datum):
+    outbuf.write(b'\x01' if datum else b'\x00')
+
+
+def write_float(outbuf, datum):
+    outbuf.write(float_struct.pack(datum))
+
+
+def write_double(outbuf, datum):
+    outbuf.write(double_struct.pack(datum))
+
+
+def write_bytes(outbuf, datum):
+    write_long(outbuf, len(datum))
+    outbuf.write(datum)
+
+
+def write_utf8(outbuf, datum):
+    write_bytes(outbuf, datum.encode("utf-8"))
+
+
+def write_fixed(outbuf, datum):
+    outbuf.write(datum)
+
+
+avro_to_py = {
+    u"string": six.text_type,
+    u"int": int,
+    u"long": int,
+    u"boolean": bool,
+    u"null": type(None),
+    u"float": float,
+    u"double": float,
+    u"array": list,
+    u"record": dict,
+    u"error": dict,
+    u"enum": six.text_type,
+    u"fixed": bytes,
+    u"bytes": bytes,
+    u"map": dict
+}
+
+
+def is_number(datum):
+    return isinstance(datum, six.integer_types + (float,)) and not isinstance(datum, bool)
+
+
+def is_integer(datum):
+    return isinstance(datum, six.integer_types) and not isinstance(datum, bool)
+
+
+check_cache = {}
+
+
+def get_check(schema):
+    '''A predicate telling if a datum fits a schema, used to pick the union
+    branch when the python type alone doesn't decide it'''
+    schema_type = get_type(schema)
+    if schema_type not in writer_type_map:
+        # a reference to a named type, either one being built (recursive
+        # schemas) or one that has been defined earlier
+        if schema_type in check_cache:
+            return check_cache[schema_type]
+        schema = lookup_schema(schema)
+        schema_type = get_type(schema)
+    if schema_type == 'union':
+        checks = [get_check(branch) for branch in schema]
+        return lambda datum: any(check(datum) for check in checks)
+    if schema_type in ('record', 'error'):
+        placeholder = Placeholder()
+        check_cache[get_fullname(schema)] = placeholder
+        fields = [(field['name'], get_check(field['type'])) for field in schema['fields']]
+        placeholder.function = lambda datum: isinstance(datum, dict) and all(
+            check(datum.get(name)) for name, check in fields)
+        return placeholder.function
+    if schema_type == 'enum':
+        symbols = schema['symbols']
+        return lambda datum: datum in symbols
+    if schema_type == 'fixed':
+        size = schema['size']
+        return lambda datum: isinstance(datum, bytes) and len(datum) == size
+    if schema_type == 'array':
+        item_check = get_check(schema['items'])
+        return lambda datum: isinstance(datum, list) and all(item_check(item) for item in datum)
+    if schema_type == 'map':
+        value_check = get_check(schema['values'])
+        return lambda datum: isinstance(datum, dict) and all(
+            isinstance(key, six.string_types) and value_check(value) for key, value in datum.items())
+    if schema_type in ('int', 'long'):
+        return is_integer
+    if schema_type in ('float', 'double'):
+        return is_number
+    python_type = avro_to_py[schema_type]
+    return lambda datum: isinstance(datum, python_type)
+
+
+def make_union_writer(union_schema, **options):
+    branches = {}
+    branch_by_name = {}
+    record_branches = []
+    for index, schema in enumerate(union_schema):
+        schema = lookup_schema(schema)
+        schema_type = get_type(schema)
+        branch = (index, get_check(schema), get_writer(union_schema[index], **options))
+        branches.setdefault(avro_to_py[schema_type], []).append(branch)
+        name = get_fullname(schema) if schema_type in ('record', 'error', 'enum', 'fixed') else schema_type
+        branch_by_name[name] = branch
+        branch_by_name.setdefault(name.split('.')[-1], branch)
+        if schema_type in ('record', 'error'):
+            record_branches.append((name, [field['name'] for field in schema['fields']]))
+    # the same promotions the fast_binary union writer makes
+    if float in branches:
+        branches[int] = branches.get(int, []) + branches[float]
+    if six.PY2:
+        branches[long] = branches.get(int, [])
+        branches[str] = branches.get(bytes, []) + branches.get(unicode, [])
+    if bytes in branches and str not in branches and six.text_type not in branches:
+        branches[six.text_type] = [(index, check, encoded_writer(writer)) for index, check, writer in branches[bytes]]
+
+    def find_branch(datum):
+        for branch in branches.get(type(datum), ()):
+            if len(branches[type(datum)]) == 1 or branch[1](datum):
+                return branch, datum
+        if type(datum) is Branch and datum.name in branch_by_name:
+            return branch_by_name[datum.name], datum.datum
+        # a record object, by its class name or the only record
+        for name, field_names in record_branches:
+            if name.split('.')[-1] == type(datum).__name__ and is_record_object(datum, field_names):
+                return branch_by_name[name], datum
+        if len(record_branches) == 1 and is_record_object(datum, record_branches[0][1]):
+            return branch_by_name[record_branches[0][0]], datum
+        raise TypeError("{} - Invalid type ({}) in union. Schema: {}".format(repr(datum), type(datum), union_schema))
+
+    def write_union(outbuf, datum):
+        (index, _, writer), datum = find_branch(datum)
+        write_long(outbuf, index)
+        writer(outbuf, datum)
+    return write_union
+
+
+def encoded_writer(writer):
+    '''Write strings with a bytes writer'''
+    return lambda outbuf, datum: writer(outbuf, datum.encode('utf-8'))
+
+
+def make_enum_writer(schema, **options):
+    symbols = schema['symbols']
+
+    def write_enum(outbuf, datum):
+        try:
+            write_long(outbuf, symbols.index(datum))
+        except ValueError:
+            raise TypeError("{} - Not a symbol of enum schema: {}".format(repr(datum), schema))
+    return write_enum
+
+
+def make_record_writer(schema, **options):
+    fields = [(field['name'], get_writer(field['type'], **options)) for field in schema['fields']]
+    names = [name for name, _ in fields]
+    accessors = {}
+
+    def write_record(outbuf, datum):
+        if type(datum) is dict:
+            values = [datum.get(name) for name in names]
+        else:
+            # objects, dataclasses and tuples, see spavro.records
+            try:
+                accessor = accessors[type(datum)]
+            except KeyError:
+                accessor = accessors[type(datum)] = record_accessor(type(datum), names)
+            values = accessor(datum)
+        for (name, writer), value in zip(fields, values):
+            try:
+                writer(outbuf, value)
+            except TypeError:
+                raise TypeError("Error writing record schema at fieldname: '{}', datum: '{}'".format(name, repr(value)))
+    return write_record
+
+
+def array_items(datum, boolean_items=False):
+    '''The items of an array datum, a list or an array.array, numpy array or
+    other buffer with tolist(). None if the datum isn't an array. Buffers of
+    bytes hold the items of boolean arrays, as in the fast_binary writer.'''
+    if isinstance(datum, list):
+        return datum
+    if not hasattr(datum, 'tolist'):
+        return None
+    items = datum.tolist()
+    if boolean_items:
+        try:
+            item_format = memoryview(datum).format.lstrip('@=<')
+        except TypeError:
+            # python 2 array.array has no memoryview
+            item_format = getattr(datum, 'typecode', None)
+        if item_format in ('?', 'b', 'B'):
+            items = [item != 0 for item in items]
+    return items
+
+
+def make_array_writer(schema, **options):
+    item_writer = get_writer(schema['items'], **options)
+    boolean_items = get_type(schema['items']) == 'boolean'
+
+    def write_array(outbuf, datum):
+        items = array_items(datum, boolean_items)
+        if items is None:
+            raise TypeError("{} - Not an array. Schema: {}".format(repr(datum), schema))
+        if items:
+            write_long(outbuf, len(items))
+        for item in items:
+            item_writer(outbuf, item)
+        write_long(outbuf, 0)
+    return write_array
+
+
+def make_map_writer(schema, **options):
+    map_value_writer = get_writer(schema['values'], **options)
+
+    def write_map(outbuf, datum):
+        if datum:
+            write_long(outbuf, len(datum))
+        for key, val in six.iteritems(datum):
+            write_utf8(outbuf, key)
+            map_value_writer(outbuf, val)
+        write_long(outbuf, 0)
+    return write_map
+
+
+def make_boolean_writer(schema, **options):
+    if not options.get('validate', True):
+        return write_boolean
+
+    def checked_boolean_writer(outbuf, datum):
+        if not isinstance(datum, bool):
+            raise TypeError("{} - Not a boolean value. Schema: {}".format(repr(datum), schema))
+        write_boolean(outbuf, datum)
+    return checked_boolean_writer
+
+
+def make_fixed_writer(schema, **options):
+    size = schema['size']
+    if not options.get('validate', True):
+        return write_fixed
+
+    def checked_write_fixed(outbuf, datum):
+        if len(datum) != size:
+            raise TypeError("{} - Size Mismatch ({}) for Fixed data. Schema: {}".format(repr(datum), len(datum), schema))
+        write_fixed(outbuf, datum)
+    return checked_write_fixed
+
+
+def make_integer_writer(minimum, maximum):
+    def make_writer(schema, **options):
+        if not options.get('validate', True):
+            return write_long
+
+        def checked_long_write(outbuf, datum):
+            if not (is_integer(datum) and minimum <= datum <= maximum):
+                raise TypeError("{} - Non integer value or overflow. Schema: {}".format(repr(datum), schema))
+            write_long(outbuf, datum)
+        return checked_long_write
+    return make_writer
+
+
+def make_string_writer(schema, **options):
+    if not options.get('validate', True):
+        return write_utf8
+
+    def checked_string_writer(outbuf, datum):
+        if not isinstance(datum, six.string_types):
+            raise TypeError("{} - is not a string value. Schema: {}".format(repr(datum), schema))
+        write_utf8(outbuf, datum)
+    return checked_string_writer
+
+
+writer_type_map = {
+    'union': make_union_writer,
+    'record': make_record_writer,
+    'error': make_record_writer,
+    'null': lambda schema, **options: write_null,
+    'string': make_string_writer,
+    'boolean': make_boolean_writer,
+    'double': lambda schema, **options: write_double,
+    'float': lambda schema, **options: write_float,
+    'long': make_integer_writer(LONG_MIN_VALUE, LONG_MAX_VALUE),
+    'bytes': lambda schema, **options: write_bytes,
+    'int': make_integer_writer(INT_MIN_VALUE, INT_MAX_VALUE),
+    'fixed': make_fixed_writer,
+    'enum': make_enum_writer,
+    'array': make_array_writer,
+    'map': make_map_writer,
+}
+
+custom_schema = {}
+writer_cache = {}
+
+
+def lookup_schema(schema):
+    '''Replace the name of a named type with its schema'''
+    schema_type = get_type(schema)
+    if schema_type in writer_type_map:
+        return schema
+    return custom_schema[schema_type]
+
+
+def get_writer(schema, **options):
+    '''Create the writer function for a schema, used like
+    fast_binary.get_writer'''
+    check_options(options)
+    schema_type = get_type(schema)
+    if schema_type in ('record', 'error', 'fixed', 'enum'):
+        placeholder = Placeholder()
+        fullname = get_fullname(schema)
+        custom_schema[fullname] = schema
+        writer_cache[fullname] = placeholder
+        writer = writer_type_map[schema_type](schema, **options)
+        placeholder.function = writer
+        return writer
+    if schema_type in writer_type_map:
+        return writer_type_map[schema_type](schema, **options)
+    return writer_cache[schema_type]
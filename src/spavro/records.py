@@ -0,0 +1,93 @@
+# Copyright (C) 2018 Pluralsight LLC
+'''Taking the field values of records to write from python objects.
+
+Besides dicts, the record writers take objects with the fields as
+attributes (dataclasses, attrs and slots classes), namedtuples and plain
+tuples of the values in field order. How the values are taken is worked
+out once per python type and record schema by record_accessor, which
+returns a function giving the values of a record in field order. Other
+objects are only records when they have some of the fields as attributes,
+so a number or a string isn't written as a record of nulls.
+
+Branch(name, datum) writes a datum as the union branch of that name, the
+names being those of the Avro JSON encoding (named types also by their
+short name). It's its own type so that tuple records are never taken for
+it.'''
+
+from collections import namedtuple
+from operator import attrgetter, itemgetter
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+Branch = namedtuple('Branch', ['name', 'datum'])
+
+
+def record_accessor(python_type, names):
+    '''Return a function that takes a record of python_type and returns its
+    values for the field names, in that order'''
+    names = list(names)
+    if issubclass(python_type, Mapping):
+        return lambda datum: [datum.get(name) for name in names]
+    if issubclass(python_type, tuple):
+        tuple_fields = getattr(python_type, '_fields', None)
+        if tuple_fields is None:
+            return positional_accessor(names)
+        if all(name in tuple_fields for name in names):
+            return getter_accessor(itemgetter, [tuple_fields.index(name) for name in names])
+    return attribute_accessor(names)
+
+
+def positional_accessor(names):
+    '''Plain tuples hold the values in field order'''
+    def tuple_values(datum):
+        if len(datum) != len(names):
+            raise TypeError("{} - A tuple record needs {} values: {}".format(repr(datum), len(names), names))
+        return datum
+    return tuple_values
+
+
+def getter_accessor(make_getter, keys):
+    if not keys:
+        return lambda datum: ()
+    getter = make_getter(*keys)
+    if len(keys) == 1:
+        # a getter of one key returns the value itself
+        return lambda datum: (getter(datum),)
+    return getter
+
+
+def attribute_accessor(names):
+    '''Take the fields from attributes, missing attributes are None like
+    missing keys of a dict (which only nullable fields accept). A datum
+    without any of the fields isn't a record.'''
+    getter = getter_accessor(attrgetter, names)
+
+    def attribute_values(datum):
+        try:
+            return getter(datum)
+        except AttributeError:
+            if names and not has_fields(datum, names):
+                raise TypeError("{} - Not a record, it has none of the fields: {}".format(repr(datum), names))
+            return [getattr(datum, name, None) for name in names]
+    return attribute_values
+
+
+def is_record_class(python_type):
+    '''Dataclasses, attrs classes and classes with __slots__ hold records'''
+    return (hasattr(python_type, '__dataclass_fields__') or hasattr(python_type, '__attrs_attrs__') or
+            any('__slots__' in vars(cls) for cls in python_type.__mro__[:-1]))
+
+
+def has_fields(datum, names):
+    return any(hasattr(datum, name) for name in names)
+
+
+def is_record_object(datum, names):
+    '''Can the datum be a record with the field names given as an object or
+    tuple'''
+    return (isinstance(datum, tuple) or is_record_class(type(datum)) or
+            (hasattr(datum, '__dict__') and has_fields(datum, names)))
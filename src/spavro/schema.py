@@ -40,6 +40,8 @@ try:
 except ImportError:
     import simplejson as json
 
+import functools
+
 # Python3
 import six
 
@@ -99,6 +101,19 @@ VALID_FIELD_SORT_ORDERS = (
     'ignore',
 )
 
+# logical type name and the avro types it can annotate
+LOGICAL_TYPES = {
+    'decimal': ('bytes', 'fixed'),
+    'uuid': ('string',),
+    'date': ('int',),
+    'time-millis': ('int',),
+    'time-micros': ('long',),
+    'timestamp-millis': ('long',),
+    'timestamp-micros': ('long',),
+    'local-timestamp-millis': ('long',),
+    'local-timestamp-micros': ('long',),
+}
+
 #
 # Exceptions
 #
@@ -116,8 +131,36 @@ class SchemaParseException(AvroException):
 #
 
 
+# bumped by every set_prop(), a property of a nested schema or field changes
+# the JSON of the schemas holding it, so JSON memoized before is rebuilt
+json_generation = 0
+
+
+def memoize_json(to_json):
+    """Cache the result of a top level to_json() call on the schema. Calls
+    passing names are part of an enclosing schema's to_json and depend on
+    the names seen so far, they aren't cached. The JSON text is cached and
+    every call returns a new value decoded from it, callers may modify it."""
+    @functools.wraps(to_json)
+    def memoized_to_json(self, names=None):
+        if names is not None:
+            return to_json(self, names)
+        cached = self._json
+        if cached is None or cached[0] != json_generation:
+            value = to_json(self)
+            try:
+                cached = self._json = (json_generation, json.dumps(value))
+            except (TypeError, ValueError):
+                # properties that aren't JSON, built on every call
+                return value
+        return json.loads(cached[1])
+    return memoized_to_json
+
+
 class Schema(object):
     """Base class for all Schema classes."""
+    __slots__ = ('_props', 'type', '_json')
+
     def __init__(self, type, other_props=None):
         # Ensure valid ctor args
         if not isinstance(type, six.string_types):
@@ -142,12 +185,25 @@ class Schema(object):
     other_props = property(lambda self: get_other_props(self._props, SCHEMA_RESERVED_PROPS),
                                                  doc="dictionary of non-reserved properties")
 
+    @property
+    def logical_type(self):
+        """The logicalType annotation of the schema, None if there isn't one
+        or it's not a known logical type for this schema's type. Following
+        the spec unknown logical types fall back to the underlying type."""
+        logical_type = self._props.get('logicalType')
+        if self.type in LOGICAL_TYPES.get(logical_type, ()):
+            return logical_type
+        return None
+
     # utility functions to manipulate properties dict
     def get_prop(self, key):
         return self._props.get(key)
 
     def set_prop(self, key, value):
+        global json_generation
         self._props[key] = value
+        self._json = None
+        json_generation += 1
 
     def __str__(self):
         return json.dumps(self.to_json())
@@ -165,6 +221,7 @@ class Schema(object):
 
 class Name(object):
     """Class to describe Avro name."""
+    __slots__ = ('_full',)
 
     def __init__(self, name_attr, space_attr, default_space):
         """
@@ -232,6 +289,8 @@ class Name(object):
 
 class Names(object):
     """Track name set and default namespace during parsing."""
+    __slots__ = ('names', 'default_namespace')
+
     def __init__(self, default_namespace=None):
             self.names = {}
             self.default_namespace = default_namespace
@@ -287,6 +346,8 @@ class Names(object):
 
 class NamedSchema(Schema):
     """Named Schemas specified in NAMED_TYPES."""
+    __slots__ = ('_fullname',)
+
     def __init__(self, type, name, namespace=None, names=None, other_props=None):
         # Ensure valid ctor args
         if not name:
@@ -326,6 +387,8 @@ class NamedSchema(Schema):
 
 
 class Field(object):
+    __slots__ = ('_props', '_has_default', 'type', 'name')
+
     def __init__(self, type, name, has_default, default=None,
                              order=None, names=None, doc=None, other_props=None):
         # Ensure valid ctor args
@@ -381,7 +444,9 @@ class Field(object):
         return self._props.get(key)
 
     def set_prop(self, key, value):
+        global json_generation
         self._props[key] = value
+        json_generation += 1
 
     def __str__(self):
         return json.dumps(self.to_json())
@@ -404,6 +469,8 @@ class Field(object):
 
 class PrimitiveSchema(Schema):
     """Valid primitive types are in PRIMITIVE_TYPES."""
+    __slots__ = ('fullname',)
+
     def __init__(self, type, other_props=None):
         # Ensure valid ctor args
         if type not in PRIMITIVE_TYPES:
@@ -414,6 +481,7 @@ class PrimitiveSchema(Schema):
 
         self.fullname = type
 
+    @memoize_json
     def to_json(self, names=None):
         if len(self.props) == 1:
             return self.fullname
@@ -429,6 +497,8 @@ class PrimitiveSchema(Schema):
 
 
 class FixedSchema(NamedSchema):
+    __slots__ = ()
+
     def __init__(self, name, namespace, size, names=None, other_props=None):
         # Ensure valid ctor args
         if not isinstance(size, int):
@@ -444,6 +514,7 @@ class FixedSchema(NamedSchema):
     # read-only properties
     size = property(lambda self: self.get_prop('size'))
 
+    @memoize_json
     def to_json(self, names=None):
         if names is None:
             names = Names()
@@ -458,6 +529,8 @@ class FixedSchema(NamedSchema):
 
 
 class EnumSchema(NamedSchema):
+    __slots__ = ()
+
     def __init__(self, name, namespace, symbols, names=None, doc=None, other_props=None):
         # Ensure valid ctor args
         if not isinstance(symbols, list):
@@ -482,6 +555,7 @@ class EnumSchema(NamedSchema):
     symbols = property(lambda self: self.get_prop('symbols'))
     doc = property(lambda self: self.get_prop('doc'))
 
+    @memoize_json
     def to_json(self, names=None):
         if names is None:
             names = Names()
@@ -500,6 +574,8 @@ class EnumSchema(NamedSchema):
 
 
 class ArraySchema(Schema):
+    __slots__ = ()
+
     def __init__(self, items, names=None, other_props=None):
         # Call parent ctor
         Schema.__init__(self, 'array', other_props)
@@ -519,6 +595,7 @@ class ArraySchema(Schema):
     # read-only properties
     items = property(lambda self: self.get_prop('items'))
 
+    @memoize_json
     def to_json(self, names=None):
         if names is None:
             names = Names()
@@ -533,6 +610,8 @@ class ArraySchema(Schema):
 
 
 class MapSchema(Schema):
+    __slots__ = ()
+
     def __init__(self, values, names=None, other_props=None):
         # Call parent ctor
         Schema.__init__(self, 'map', other_props)
@@ -552,6 +631,7 @@ class MapSchema(Schema):
     # read-only properties
     values = property(lambda self: self.get_prop('values'))
 
+    @memoize_json
     def to_json(self, names=None):
         if names is None:
             names = Names()
@@ -568,6 +648,8 @@ class UnionSchema(Schema):
     """
     names is a dictionary of schema objects
     """
+    __slots__ = ('_schemas',)
+
     def __init__(self, schemas, names=None):
         # Ensure valid ctor args
         if not isinstance(schemas, list):
@@ -600,6 +682,7 @@ class UnionSchema(Schema):
     # read-only properties
     schemas = property(lambda self: self._schemas)
 
+    @memoize_json
     def to_json(self, names=None):
         if names is None:
             names = Names()
@@ -614,10 +697,13 @@ class UnionSchema(Schema):
 
 
 class ErrorUnionSchema(UnionSchema):
+    __slots__ = ()
+
     def __init__(self, schemas, names=None):
         # Prepend "string" to handle system errors
         UnionSchema.__init__(self, ['string'] + schemas, names)
 
+    @memoize_json
     def to_json(self, names=None):
         if names is None:
             names = Names()
@@ -630,6 +716,8 @@ class ErrorUnionSchema(UnionSchema):
 
 
 class RecordSchema(NamedSchema):
+    __slots__ = ()
+
     @staticmethod
     def make_field_objects(field_data, names):
         """We're going to need to make message parameters too."""
@@ -704,6 +792,7 @@ class RecordSchema(NamedSchema):
             fields_dict[field.name] = field
         return fields_dict
 
+    @memoize_json
     def to_json(self, names=None):
         if names is None:
             names = Names()
@@ -798,9 +887,31 @@ def make_avsc_object(json_data, names=None):
         raise SchemaParseException(fail_msg)
 
 
+# parsed schemas by JSON text, cleared when it grows past PARSE_CACHE_SIZE
+parse_cache = {}
+PARSE_CACHE_SIZE = 1024
+
+
 # TODO(hammer): make method for reading from a file?
 def parse(json_string):
-    """Constructs the Schema from the JSON text."""
+    """Constructs the Schema from the JSON text. Parsing the same text again
+    returns the same (cached) Schema object, so parsed schemas shouldn't be
+    modified with set_prop(), use parse_uncached() for a schema of your
+    own."""
+    try:
+        return parse_cache[json_string]
+    except (KeyError, TypeError):
+        pass
+    parsed_schema = parse_uncached(json_string)
+    if isinstance(json_string, (six.string_types, bytes)):
+        if len(parse_cache) >= PARSE_CACHE_SIZE:
+            parse_cache.clear()
+        parse_cache[json_string] = parsed_schema
+    return parsed_schema
+
+
+def parse_uncached(json_string):
+    """Constructs a new Schema from the JSON text."""
     # parse the JSON
     try:
         json_data = json.loads(json_string)
@@ -814,3 +925,42 @@ def parse(json_string):
 
     # construct the Avro Schema object
     return make_avsc_object(json_data, names)
+
+
+class LazyConstant(object):
+    """A module constant that is made on first use, so importing the module
+    doesn't parse or compile it. It stands in for the value: attributes,
+    comparisons and isinstance go to the value made by calling make()."""
+    __slots__ = ('_make', '_value')
+
+    def __init__(self, make):
+        self._make = make
+        self._value = None
+
+    def _get(self):
+        if self._make is not None:
+            self._value = self._make()
+            self._make = None
+        return self._value
+
+    @property
+    def __class__(self):
+        return type(self._get())
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __eq__(self, other):
+        return self._get() == other
+
+    def __ne__(self, other):
+        return self._get() != other
+
+    def __hash__(self):
+        return hash(self._get())
+
+    def __str__(self):
+        return str(self._get())
+
+    def __repr__(self):
+        return repr(self._get())
@@ -1,7 +1,13 @@
 # Copyright (C) 2017 Pluralsight LLC
 
 # resolve schemas
-from spavro.fast_binary import get_type
+import json
+from collections import namedtuple
+
+try:
+    from spavro.fast_binary import get_type
+except ImportError:
+    from spavro.py_binary import get_type
 from spavro.exceptions import SchemaResolutionException
 
 
@@ -12,39 +18,88 @@ def get_field_by_name(fields, name):
     return fields[field_names.index(name)]
 
 
+def has_logical_types(schema):
+    '''Does the schema (without following named references) have logical
+    type annotations'''
+    if isinstance(schema, list):
+        return any(has_logical_types(branch) for branch in schema)
+    if not isinstance(schema, dict):
+        return False
+    if 'logicalType' in schema:
+        return True
+    if 'fields' in schema:
+        return any(has_logical_types(field['type']) for field in schema['fields'])
+    return has_logical_types(schema.get('items')) or has_logical_types(schema.get('values'))
+
+
+def names_match(writer, reader):
+    '''Do the names of a writer and reader named schema match, either
+    directly or through one of the reader's aliases'''
+    if writer['name'] == reader['name']:
+        return True
+    aliases = reader.get('aliases')
+    if not aliases:
+        return False
+    namespace = writer.get('namespace')
+    fullname = '.'.join([namespace, writer['name']]) if namespace and '.' not in writer['name'] else writer['name']
+    return writer['name'] in aliases or fullname in aliases
+
+
+def match_fields(writer_fields, reader_fields):
+    '''Return the reader field each writer field is read into, None for the
+    writer fields that are skipped. Following the spec a reader field of the
+    same name is matched first, across all the writer fields, so a reader
+    field is only matched by one of its aliases when no writer field has its
+    name.'''
+    by_name = {field['name']: field for field in reader_fields}
+    matches = [by_name.get(field['name']) for field in writer_fields]
+    matched = set(field['name'] for field in matches if field is not None)
+    by_alias = {}
+    for field in reader_fields:
+        if field['name'] not in matched:
+            for alias in field.get('aliases', ()):
+                by_alias.setdefault(alias, field)
+    for index, field in enumerate(writer_fields):
+        reader_field = by_alias.get(field['name'])
+        if matches[index] is None and reader_field is not None and reader_field['name'] not in matched:
+            matched.add(reader_field['name'])
+            matches[index] = reader_field
+    return matches
+
+
 def resolve_record(writer, reader):
     '''Take a writer and reader schema and return a 'meta' schema that allows
     transforming a previously written record into a new read structure.'''
     fields = []
-    if writer['name'] != reader['name']:
+    if not names_match(writer, reader):
         raise SchemaResolutionException("Schemas not compatible record names don't match")
     record_name = reader['name']
     optional = {}
     if "namespace" in writer and "namespace" in reader:
         optional["namespace"] = reader["namespace"]
 
-    writer_fields = [field['name'] for field in writer['fields']]
-    reader_fields = [field['name'] for field in reader['fields']]
-    # check for defaults for records that are in reader
-    # but not in writer and vice versa
-    reader_but_not_writer = (set(reader_fields) - set(writer_fields))
-    writer_but_not_reader = (set(writer_fields) - set(reader_fields))
-    both_reader_and_writer = (set(writer_fields) & set(reader_fields))
-    # run through the fields in writer order
-    for field in writer['fields']:
-        if field['name'] in both_reader_and_writer:
-            fields.append({"name": field['name'], "type": resolve(field['type'],
-                get_field_by_name(reader['fields'], field['name'])['type'])})
-        elif field['name'] in writer_but_not_reader:
+    matches = match_fields(writer['fields'], reader['fields'])
+    matched = set(reader_field['name'] for reader_field in matches if reader_field is not None)
+    # run through the fields in writer order, the reader's name is used for
+    # fields matched by an alias
+    for field, reader_field in zip(writer['fields'], matches):
+        if reader_field is not None:
+            fields.append({"name": reader_field['name'], "type": resolve_schema(field['type'], reader_field['type'])})
+        else:
             ### special skip type record
             fields.append({"name": field['name'], "type": {"type": "skip", "value": field['type']}})
 
+    # fields that are in the reader but not in the writer take their defaults,
+    # the field's schema is kept for converting logical types
     for field in reader['fields']:
-        if field['name'] in reader_but_not_writer:
+        if field['name'] not in matched:
             try:
-                fields.append({"name": field['name'], "type": {"type": "default", "value": field['default']}})
+                default = {"type": "default", "value": field['default']}
             except KeyError:
                 raise SchemaResolutionException("Schemas not compatible, no default value for field in reader's record that's not present in writer's record")
+            if has_logical_types(field['type']):
+                default['schema'] = field['type']
+            fields.append({"name": field['name'], "type": default})
     schema = {"type": "record", "fields": fields, "name": record_name}
     schema.update(optional)
     return schema
@@ -56,18 +111,18 @@ primitive_types = ('null', 'boolean', 'int', 'long', 'float', 'double', 'bytes',
 def resolve_array(writer, reader):
     '''Resolve a writer and reader array schema and recursively resolve the
     type for each array item schema'''
-    return {'type': 'array', 'items': resolve(writer['items'], reader['items'])}
+    return {'type': 'array', 'items': resolve_schema(writer['items'], reader['items'])}
 
 
 def resolve_map(writer, reader):
     '''Resolve a writer and reader map schema and resolve the type for the
     map's value schema'''
-    return {'type': 'map', 'values': resolve(writer['values'], reader['values'])}
+    return {'type': 'map', 'values': resolve_schema(writer['values'], reader['values'])}
 
 
 def resolve_enum(writer, reader):
     '''Compare a writer and reader enum and return a compatible enum'''
-    if writer['name'] != reader['name']:
+    if not names_match(writer, reader):
         raise SchemaResolutionException("Schemas not compatible, enum names don't match")
     if set(writer['symbols']) - set(reader['symbols']):
         raise SchemaResolutionException("Schemas not compatible, symbol in writer's enum not present in reader's enum")
@@ -77,11 +132,37 @@ def resolve_enum(writer, reader):
 def resolve_fixed(writer, reader):
     '''Take a fixed writer and reader schema and return the writers size value.
     '''
-    if writer['name'] != reader['name'] or writer['size'] != reader['size']:
+    if not names_match(writer, reader) or writer['size'] != reader['size']:
         raise SchemaResolutionException("Schemas not compatible, fixed names or sizes don't match")
     return {key: value for key, value in writer.items()}
 
 
+named_types = ('record', 'error', 'enum', 'fixed')
+
+
+def branch_candidates(writer, reader_union):
+    '''The reader union branches a writer schema could resolve against, in
+    the order they're tried: same type (and name for named types) first,
+    then the types the writer's type promotes to'''
+    writer_type = get_type(writer)
+    exact = []
+    promoted = []
+    for branch in reader_union:
+        branch_type = get_type(branch)
+        if branch_type == writer_type:
+            if (writer_type not in named_types or not isinstance(branch, dict) or
+                    not isinstance(writer, dict) or names_match(writer, branch)):
+                exact.append(branch)
+        elif writer_type in promotable and branch_type in promotable:
+            if promotable.index(writer_type) < promotable.index(branch_type):
+                promoted.append(branch)
+        elif isinstance(writer, dict) and writer_type in named_types and branch_type not in primitive_types:
+            # a reference by name to the named type
+            if branch_type == writer['name'] or branch_type in writer.get('aliases', ()):
+                exact.append(branch)
+    return exact + promoted
+
+
 def resolve_union(writer, reader):
     '''Take a writer union and a reader union, compare their types and return
     a read/write compatible union.
@@ -89,24 +170,33 @@ def resolve_union(writer, reader):
     A compatible read/write union has all of the writer's union schemas in the
     reader's schema.
     '''
-    union = []
-    for w_type in writer:
-        for r_type in reader:
-            try:
-                merged = resolve(w_type, r_type)
-                union.append(merged)
-                break
-            except SchemaResolutionException:
-                # keep trying until we iterate through all read types
-                continue
-        else:
-            # none of the read types matched the write type, this is an error
-            raise SchemaResolutionException("Schema in writer's union not present in reader's union.")
-    return union
+    return [resolve_branch(w_type, reader) for w_type in writer]
+
+
+def resolve_branch(writer, reader_union):
+    '''Resolve a writer schema against the first matching reader branch'''
+    for r_type in branch_candidates(writer, reader_union):
+        try:
+            return resolve_schema(writer, r_type)
+        except SchemaResolutionException:
+            # keep trying until we iterate through all candidate read types
+            continue
+    # none of the read types matched the write type, this is an error
+    raise SchemaResolutionException("Schema in writer's union not present in reader's union.")
 
 
 promotable = ['int', 'long', 'float', 'double']
 
+# resolved schemas by the (writer, reader) fingerprints of the schemas given
+# to resolve, cleared when it grows past RESOLUTION_CACHE_SIZE. The resolved
+# schemas are shared so they mustn't be modified
+resolution_cache = {}
+RESOLUTION_CACHE_SIZE = 1024
+
+
+def fingerprint(schema):
+    return json.dumps(schema, sort_keys=True)
+
 
 def resolve(writer, reader):
     '''Take a writer and a reader schema and return a meta schema that
@@ -115,7 +205,27 @@ def resolve(writer, reader):
     This handles skipping missing fields and default fills by creating
     non-standard 'types' for reader creation. These non-standard types are
     never surfaced out since they're not standard avro types but just used
-    as an implementation detail for generating a write-compantible reader.'''
+    as an implementation detail for generating a write-compantible reader.
+
+    Resolved schemas are memoized by the fingerprints of the writer and
+    reader schemas, so the returned schema must not be modified.'''
+    if writer == reader:
+        # nothing to resolve, the writer's schema reads as is
+        return reader
+    key = (fingerprint(writer), fingerprint(reader))
+    try:
+        return resolution_cache[key]
+    except KeyError:
+        pass
+    resolved = resolve_schema(writer, reader)
+    if len(resolution_cache) >= RESOLUTION_CACHE_SIZE:
+        resolution_cache.clear()
+    resolution_cache[key] = resolved
+    return resolved
+
+
+def resolve_schema(writer, reader):
+    '''Resolve a writer and reader (sub) schema, see resolve'''
     writer_type = get_type(writer)
     reader_type = get_type(reader)
 
@@ -142,11 +252,158 @@ def resolve(writer, reader):
         if reader_type == 'union':
             # if the writer type is in the reader's union
             # then just return the writer's schema
-            if writer_type in [get_type(r) for r in reader]:
-                type_index = [get_type(r) for r in reader].index(writer_type)
-                return resolve(writer, reader[type_index])
-            else:
+            try:
+                return resolve_branch(writer, reader)
+            except SchemaResolutionException:
                 raise SchemaResolutionException("Writer schema not present in reader union")
         if writer_type in promotable and reader_type in promotable and promotable.index(writer_type) < promotable.index(reader_type):
             return writer
         raise SchemaResolutionException("Reader and Writer schemas are incompatible")
+
+
+# ======================================================================
+# compatibility checks answer whether a writer's data can be read with a
+# reader's schema, by the same rules as resolve, without building the
+# resolved schema
+
+Incompatibility = namedtuple('Incompatibility', ['path', 'message'])
+
+
+def join_path(segments):
+    '''Join path segments into e.g. 'payload.items[2].price', union branches
+    are '[index]' segments'''
+    path = u''
+    for segment in segments:
+        if segment.startswith(u'[') or not path:
+            path += segment
+        else:
+            path += u'.' + segment
+    return path
+
+
+def schema_json(schema):
+    '''Accept parsed schema objects as well as their JSON (dict) form'''
+    return schema.to_json() if hasattr(schema, 'to_json') else schema
+
+
+class CompatibilityChecker(object):
+    '''Checks writer/reader schema compatibility without resolving them. The
+    result for each pair of named types is remembered by the schema
+    fingerprints, so checking many writer schemas (e.g. every version of a
+    subject in a registry) against a reader doesn't repeat the work for the
+    named types they share.'''
+    def __init__(self):
+        self.named_results = {}
+        # fingerprints by id, only kept for the duration of a check since
+        # ids are reused once the schema dicts are freed
+        self.fingerprints = {}
+
+    def report(self, writer, reader):
+        '''Return the list of Incompatibility, empty when the reader's schema
+        can read data written with the writer's'''
+        return self.report_many([writer], reader)[0]
+
+    def report_many(self, writers, reader):
+        '''Return the report for each writer against one reader'''
+        reader = schema_json(reader)
+        try:
+            return [[Incompatibility(join_path(path), message)
+                     for path, message in self.check(schema_json(writer), reader, [])]
+                    for writer in writers]
+        finally:
+            self.fingerprints.clear()
+
+    def fingerprint(self, schema):
+        try:
+            cached_schema, schema_fingerprint = self.fingerprints[id(schema)]
+            if cached_schema is schema:
+                return schema_fingerprint
+        except KeyError:
+            pass
+        schema_fingerprint = fingerprint(schema)
+        self.fingerprints[id(schema)] = schema, schema_fingerprint
+        return schema_fingerprint
+
+    def check(self, writer, reader, path):
+        '''Return the (path segments, message) of each incompatibility'''
+        if writer == reader:
+            return []
+        writer_type = get_type(writer)
+        reader_type = get_type(reader)
+        if writer_type == reader_type:
+            if reader_type == 'array':
+                return self.check(writer['items'], reader['items'], path + [u'items'])
+            if reader_type == 'map':
+                return self.check(writer['values'], reader['values'], path + [u'values'])
+            if reader_type == 'union':
+                errors = []
+                for index, branch in enumerate(writer):
+                    errors.extend(self.check_branch(branch, reader, path + [u'[{}]'.format(index)]))
+                return errors
+            if reader_type in ('record', 'enum', 'fixed'):
+                return self.check_named(writer, reader, path)
+            # primitives and references to named types
+            return []
+        if reader_type == 'union':
+            return self.check_branch(writer, reader, path)
+        if writer_type in promotable and reader_type in promotable and promotable.index(writer_type) < promotable.index(reader_type):
+            return []
+        return [(path, u"Writer's {} can't be read as {}".format(writer_type, reader_type))]
+
+    def check_branch(self, writer, reader_union, path):
+        for candidate in branch_candidates(writer, reader_union):
+            if not self.check(writer, candidate, path):
+                return []
+        return [(path, u"Writer's {} isn't in the reader's union".format(get_type(writer)))]
+
+    def check_named(self, writer, reader, path):
+        key = (self.fingerprint(writer), self.fingerprint(reader))
+        try:
+            errors = self.named_results[key]
+        except KeyError:
+            errors = self.named_results[key] = self.check_named_schemas(writer, reader)
+        return [(path + error_path, message) for error_path, message in errors]
+
+    def check_named_schemas(self, writer, reader):
+        schema_type = get_type(reader)
+        if not names_match(writer, reader):
+            return [([], u"Names don't match, writer's {} and reader's {}".format(writer['name'], reader['name']))]
+        if schema_type == 'enum':
+            missing = [symbol for symbol in writer['symbols'] if symbol not in reader['symbols']]
+            if missing:
+                return [([], u"Symbols {} of the writer's enum are missing from the reader's".format(missing))]
+            return []
+        if schema_type == 'fixed':
+            if writer['size'] != reader['size']:
+                return [([], u"Fixed sizes don't match, writer's {} and reader's {}".format(writer['size'], reader['size']))]
+            return []
+        errors = []
+        matched = set()
+        for field, reader_field in zip(writer['fields'], match_fields(writer['fields'], reader['fields'])):
+            if reader_field is not None:
+                matched.add(reader_field['name'])
+                errors.extend(self.check(field['type'], reader_field['type'], [reader_field['name']]))
+        for field in reader['fields']:
+            if field['name'] not in matched and 'default' not in field:
+                errors.append(([field['name']], u"Reader's field isn't in the writer's record and has no default"))
+        return errors
+
+
+checker = CompatibilityChecker()
+
+
+def can_read(writer, reader):
+    '''Can data written with the writer's schema be read with the reader's'''
+    return not checker.report(writer, reader)
+
+
+def compatibility_report(writer, reader):
+    '''Return the list of Incompatibility(path, message) between a writer
+    and reader schema, an empty list when they're compatible'''
+    return checker.report(writer, reader)
+
+
+def can_read_many(writers, reader):
+    '''Check one reader's schema against many writer schemas, returns a bool
+    per writer schema'''
+    return [not report for report in checker.report_many(writers, reader)]
@@ -23,11 +23,13 @@ Command-line tool
 NOTE: The API for the command-line tool is experimental.
 """
 import sys
+import json
 from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
 import urlparse
 from spavro import io
 from spavro import datafile
 from spavro import protocol
+from spavro import schema
 from spavro import ipc
 
 class GenericResponder(ipc.Responder):
@@ -98,6 +100,20 @@ def send_message(uri, proto, msg, datum):
   requestor = ipc.Requestor(protocol.parse(proto_json), client)
   print(requestor.request(msg, datum))
 
+def read_json_datum(proto, msg, data, part):
+  """Decode the Avro JSON encoded request or response of a message"""
+  proto_json = file(proto, 'r').read()
+  message = protocol.parse(proto_json).messages.get(msg)
+  if message is None:
+    raise Exception("No message named %s" % msg)
+  if part == 'request':
+    # the request is a bare list of fields
+    message_schema = {"type": "record", "name": "request",
+                      "fields": message.request.to_json()}
+  else:
+    message_schema = message.response.to_json()
+  return io.JsonDatumReader(schema.parse(json.dumps(message_schema))).read(data)
+
 def file_or_stdin(f):
   if f == "-":
     return sys.stdin
@@ -110,11 +126,17 @@ def main(args=sys.argv):
     return 1
 
   if args[1] == "dump":
-    if len(args) != 3:
-      print("Usage: %s dump input_file" % args[0])
+    if len(args) == 4 and args[2] in ("--json", "--avro-json"):
+      # transcode each record straight to a line of JSON text
+      datum_reader = io.JsonTranscodingReader(avro_json=args[2] == "--avro-json")
+      for line in datafile.DataFileReader(file_or_stdin(args[3]), datum_reader):
+        sys.stdout.write(line + "\n")
+    elif len(args) != 3:
+      print("Usage: %s dump [--json | --avro-json] input_file" % args[0])
       return 1
-    for d in datafile.DataFileReader(file_or_stdin(args[2]), io.DatumReader()):
-      print(repr(d))
+    else:
+      for d in datafile.DataFileReader(file_or_stdin(args[2]), io.DatumReader()):
+        print(repr(d))
   elif args[1] == "rpcreceive":
     usage_str = "Usage: %s rpcreceive uri protocol_file " % args[0]
     usage_str += "message_name (-data d | -file f)"
@@ -130,8 +152,7 @@ def main(args=sys.argv):
         dfr = datafile.DataFileReader(reader, datum_reader)
         datum = dfr.next()
       elif args[5] == "-data":
-        print("JSON Decoder not yet implemented.")
-        return 1
+        datum = read_json_datum(proto, msg, args[6], 'response')
       else:
         print(usage_str)
         return 1
@@ -151,8 +172,7 @@ def main(args=sys.argv):
         dfr = datafile.DataFileReader(reader, datum_reader)
         datum = dfr.next()
       elif args[5] == "-data":
-        print("JSON Decoder not yet implemented.")
-        return 1
+        datum = read_json_datum(proto, msg, args[6], 'request')
       else:
         print(usage_str)
         return 1
@@ -0,0 +1,191 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import json
+import datetime
+import pickle
+from six import BytesIO
+
+import spavro.schema
+import spavro.io
+import spavro.datafile
+from spavro.io import FastDatumReader, FastDatumWriter
+from spavro.fast_binary import compile_program, load_program, opcode_info
+
+opcodes = dict((name, index) for index, (name, _) in enumerate(opcode_info))
+
+
+tree_schema = {"type": "record", "name": "tree", "fields": [
+    {"name": "id", "type": "long"},
+    {"name": "label", "type": ["null", "string"]},
+    {"name": "kind", "type": {"type": "enum", "name": "kind", "symbols": ["LEAF", "BRANCH"]}},
+    {"name": "hash", "type": {"type": "fixed", "name": "hash", "size": 2}},
+    {"name": "weights", "type": {"type": "map", "values": ["float", "double"]}},
+    {"name": "children", "type": {"type": "array", "items": "tree"}},
+    {"name": "flags", "type": {"type": "array", "items": "boolean"}},
+    {"name": "raw", "type": "bytes"},
+    {"name": "same_kind", "type": ["null", "kind"]}]}
+
+tree_datum = {"id": -1 << 40, "label": u"r\xf6\xf6t", "kind": u"BRANCH", "hash": b"ab", "weights": {u"x": 0.5, u"y": 1e300},
+              "flags": [True, False], "raw": b"\x00\xff", "same_kind": u"LEAF",
+              "children": [{"id": 2, "label": None, "kind": u"LEAF", "hash": b"cd", "weights": {}, "flags": [],
+                            "raw": b"", "children": [], "same_kind": None}]}
+
+# name, writer schema, datum, reader schema
+bytecode_cases = (
+("null", "null", None, None),
+("string", "string", u"caf\xe9", None),
+("long_promoted_to_double", "long", 12, "double"),
+("recursive_record", tree_schema, tree_datum, None),
+("resolved_record", {"type": "record", "name": "r", "fields": [
+    {"name": "dropped", "type": {"type": "array", "items": {"type": "record", "name": "gone", "fields": [
+        {"name": "f", "type": "float"}, {"name": "s", "type": "string"}]}}},
+    {"name": "dropped_enum", "type": {"type": "enum", "name": "e", "symbols": ["A"]}},
+    {"name": "kept", "type": "int"}]},
+    {"dropped": [{"f": 1.0, "s": u"x"}], "dropped_enum": u"A", "kept": 3},
+    {"type": "record", "name": "r", "fields": [
+        {"name": "kept", "type": "long"}, {"name": "added", "type": "string", "default": "new"}]}),
+("union_of_records", ["null", {"type": "record", "name": "a", "fields": [{"name": "x", "type": "int"}]}, "string"],
+    {"x": 5}, None),
+("nested_defined_record", {"type": "record", "name": "outer", "fields": [
+    {"name": "a", "type": {"type": "record", "name": "inner", "fields": [
+        {"name": "b", "type": {"type": "record", "name": "innermost", "fields": [{"name": "c", "type": "int"}]}}]}},
+    {"name": "d", "type": "innermost"}]},
+    {"a": {"b": {"c": 1}}, "d": {"c": 2}}, None),
+)
+
+
+def write_datum(schema, datum):
+    buff = BytesIO()
+    FastDatumWriter(spavro.schema.parse(json.dumps(schema))).write(datum, spavro.io.FastBinaryEncoder(buff))
+    return buff.getvalue()
+
+
+def read_datum(data, schema, reader_schema=None, **options):
+    readers_schema = spavro.schema.parse(json.dumps(reader_schema)) if reader_schema else None
+    reader = FastDatumReader(spavro.schema.parse(json.dumps(schema)), readers_schema, **options)
+    return reader.read(spavro.io.FastBinaryDecoder(BytesIO(data)))
+
+
+class TestBytecode(unittest.TestCase):
+    def test_records_are_compiled_once(self):
+        program = compile_program(tree_schema)
+        names = [name for _, name, _ in program.disassemble()]
+        self.assertEqual(names.count('RETURN'), 1)
+        self.assertEqual(names[-1], 'END')
+
+    def test_tuple_and_namedtuple_records(self):
+        data = write_datum(tree_schema, tree_datum)
+        for record_type in ('tuple', 'namedtuple'):
+            record = read_datum(data, tree_schema, engine='bytecode', record_type=record_type)
+            self.assertEqual(record, read_datum(data, tree_schema, record_type=record_type))
+
+    def test_unsupported_record_type(self):
+        with self.assertRaises(ValueError):
+            compile_program(tree_schema, record_type='lazy')
+
+    def test_logical_types_use_the_closure_readers(self):
+        schema = {"type": "record", "name": "day", "fields": [
+            {"name": "d", "type": {"type": "int", "logicalType": "date"}}, {"name": "n", "type": "int"}]}
+        data = write_datum(schema, {"d": 17609, "n": 4})
+        self.assertEqual(read_datum(data, schema, engine='bytecode', logical_types=True),
+                         {"d": datetime.date(2018, 3, 19), "n": 4})
+
+    def test_reads_consecutive_datums(self):
+        program = compile_program("string")
+        fo = BytesIO(write_datum("string", u"a") + write_datum("string", u"bc"))
+        self.assertEqual([program(fo), program(fo)], [u"a", u"bc"])
+        # the buffer is released, the file can still be written
+        fo.write(b"\x00")
+
+    def test_other_file_objects_use_the_closure_reader(self):
+        class Reader(object):
+            def __init__(self, data):
+                self.data = BytesIO(data)
+
+            def read(self, size):
+                return self.data.read(size)
+        data = write_datum(tree_schema, tree_datum)
+        self.assertEqual(compile_program(tree_schema)(Reader(data)), tree_datum)
+
+    def test_truncated_data(self):
+        data = write_datum(tree_schema, tree_datum)
+        for size in (0, 5, len(data) - 1):
+            with self.assertRaises(EOFError):
+                compile_program(tree_schema)(BytesIO(data[:size]))
+
+    def test_invalid_union_index(self):
+        with self.assertRaises(TypeError):
+            compile_program(["null", "string"])(BytesIO(b"\x04"))
+
+    def test_load_program(self):
+        program = compile_program(tree_schema)
+        loaded = load_program(tree_schema, program.opcodes, program.constants)
+        self.assertEqual(loaded(BytesIO(write_datum(tree_schema, tree_datum))), tree_datum)
+
+    def test_load_invalid_programs(self):
+        op = opcodes
+        invalid = (
+            ([99, op['END']], []),
+            ([op['JUMP']], []),
+            ([op['JUMP'], 1, op['END']], []),
+            ([op['UNION'], 2, 4, 100, op['NULL'], op['END']], []),
+            ([op['UNION'], -1, op['END']], []),
+            ([op['NULL']], []),
+            ([], []),
+            ([op['ENUM'], 0, op['END']], []),
+            ([op['ENUM'], 0, op['END']], ["A"]),
+            ([op['DICT'], 0, op['END']], [["a"]]),
+            ([op['FIXED'], -1, op['END']], []),
+            ([op['MAKE'], 0, 0, op['END']], [tuple]),
+            ([op['READER'], 0, op['END']], [len]),
+            (["x", op['END']], []),
+            ([op['SKIP'], 1 << 40, op['END']], []),
+            ((op['END'],), []),
+        )
+        for program_opcodes, constants in invalid:
+            with self.assertRaises(ValueError):
+                load_program("null", program_opcodes, constants)
+
+    def test_run_invalid_programs(self):
+        # valid offsets, but opcodes used out of place fail rather than
+        # reading outside of the program
+        op = opcodes
+        for program_opcodes, data in (([op['RETURN'], op['END']], b""),
+                                      ([op['NULL'], op['ARRAY_NEXT'], 0, op['END']], b""),
+                                      ([op['MAP_START'], 5, op['NULL'], op['ARRAY_NEXT'], 2, op['END']], b"\x02\x00")):
+            with self.assertRaises((ValueError, TypeError)):
+                load_program("null", program_opcodes, [])(BytesIO(data))
+
+    def test_pickle(self):
+        program = pickle.loads(pickle.dumps(compile_program(tree_schema)))
+        self.assertEqual(program(BytesIO(write_datum(tree_schema, tree_datum))), tree_datum)
+
+    def test_data_file(self):
+        schema = spavro.schema.parse(json.dumps(tree_schema))
+        buff = BytesIO()
+        writer = spavro.datafile.DataFileWriter(buff, spavro.io.DatumWriter(), schema, codec='deflate')
+        for _ in range(3):
+            writer.append(tree_datum)
+        writer.flush()
+        buff.seek(0)
+        records = list(spavro.datafile.DataFileReader(buff, FastDatumReader(engine='bytecode')))
+        self.assertEqual(records, [tree_datum] * 3)
+
+
+def create_case(schema, datum, reader_schema):
+    def test_bytecode(self):
+        data = write_datum(schema, datum)
+        self.assertEqual(read_datum(data, schema, reader_schema, engine='bytecode'),
+                         read_datum(data, schema, reader_schema))
+    return test_bytecode
+
+
+def make_cases(cases):
+    for name, schema, datum, reader_schema in cases:
+        test_method = create_case(schema, datum, reader_schema)
+        test_method.__name__ = 'test_bytecode_{}'.format(name)
+        setattr(TestBytecode, test_method.__name__, test_method)
+
+
+make_cases(bytecode_cases)
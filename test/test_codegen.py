@@ -0,0 +1,165 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import json
+import datetime
+import os
+import shutil
+import tempfile
+from six import BytesIO
+
+import spavro.schema
+import spavro.io
+from spavro.io import FastDatumReader, FastDatumWriter
+from spavro.codegen import ReaderSource, compile_reader
+
+try:
+    import pyximport
+    has_cython = True
+except ImportError:
+    has_cython = False
+
+
+node_schema = {"type": "record", "name": "node", "fields": [
+    {"name": "id", "type": "long"},
+    {"name": "label", "type": ["null", "string"]},
+    {"name": "kind", "type": {"type": "enum", "name": "kind", "symbols": ["LEAF", "BRANCH"]}},
+    {"name": "hash", "type": {"type": "fixed", "name": "hash", "size": 2}},
+    {"name": "weights", "type": {"type": "map", "values": "double"}},
+    {"name": "children", "type": {"type": "array", "items": "node"}},
+    {"name": "same_kind", "type": ["null", "kind"]}]}
+
+node_datum = {"id": 1, "label": u"root", "kind": u"BRANCH", "hash": b"ab", "weights": {u"x": 0.5},
+              "same_kind": u"LEAF",
+              "children": [{"id": 2, "label": None, "kind": u"LEAF", "hash": b"cd", "weights": {},
+                            "children": [], "same_kind": None}]}
+
+# name, writer schema, datum, reader schema
+codegen_cases = (
+("primitive", "long", 12, None),
+("flat_record", {"type": "record", "name": "flat", "fields": [
+    {"name": "a", "type": "int"}, {"name": "b", "type": "string"}, {"name": "c", "type": "boolean"}]},
+    {"a": 1, "b": u"two", "c": True}, None),
+("recursive_record", node_schema, node_datum, None),
+("resolved_record", {"type": "record", "name": "r", "fields": [
+    {"name": "dropped", "type": {"type": "array", "items": "string"}}, {"name": "kept", "type": "int"}]},
+    {"dropped": [u"x"], "kept": 3},
+    {"type": "record", "name": "r", "fields": [
+        {"name": "kept", "type": "long"}, {"name": "added", "type": "string", "default": "new"}]}),
+("union_of_records", ["null", {"type": "record", "name": "a", "fields": [{"name": "x", "type": "int"}]}, "string"],
+    {"x": 5}, None),
+)
+
+
+def write_datum(schema, datum):
+    buff = BytesIO()
+    FastDatumWriter(spavro.schema.parse(json.dumps(schema))).write(datum, spavro.io.FastBinaryEncoder(buff))
+    return buff.getvalue()
+
+
+def read_datum(data, schema, reader_schema=None, **options):
+    readers_schema = spavro.schema.parse(json.dumps(reader_schema)) if reader_schema else None
+    reader = FastDatumReader(spavro.schema.parse(json.dumps(schema)), readers_schema, **options)
+    return reader.read(spavro.io.FastBinaryDecoder(BytesIO(data)))
+
+
+class FileWithoutBuffer(object):
+    def __init__(self, data):
+        self.data = BytesIO(data)
+
+    def read(self, size=-1):
+        return self.data.read(size)
+
+
+class TestCodegen(unittest.TestCase):
+    def test_source_reads_the_buffer(self):
+        source = ReaderSource(node_schema).source
+        self.assertEqual(source.count('cdef read_record'), 1)
+        self.assertNotIn('ReadField', source)
+        # the primitives are the C helpers, not python readers on the file
+        self.assertNotIn('(fo)', source.split('cdef read_record')[1])
+        self.assertIn('read_long(buf, length, pos)', source)
+
+    def test_unsupported_record_type(self):
+        with self.assertRaises(ValueError):
+            ReaderSource(node_schema, record_type='lazy')
+
+    def test_logical_types_use_the_closure_readers(self):
+        schema = {"type": "record", "name": "day", "fields": [{"name": "d", "type": {"type": "int", "logicalType": "date"}}]}
+        generated = ReaderSource(schema, logical_types=True)
+        self.assertIn('read_with(self.logical_', generated.source)
+
+    def test_unknown_engine(self):
+        for engine in ('jit', 'codegen'):
+            with self.assertRaises(ValueError):
+                FastDatumReader(engine=engine)
+
+
+@unittest.skipUnless(has_cython, "Cython isn't installed")
+class TestCythonEngine(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # the engine builds into $SPAVRO_CACHE_DIR
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.saved_cache_dir = os.environ.get('SPAVRO_CACHE_DIR')
+        os.environ['SPAVRO_CACHE_DIR'] = cls.cache_dir
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.saved_cache_dir is None:
+            del os.environ['SPAVRO_CACHE_DIR']
+        else:
+            os.environ['SPAVRO_CACHE_DIR'] = cls.saved_cache_dir
+        shutil.rmtree(cls.cache_dir)
+
+    def test_build_is_cached(self):
+        data = write_datum(node_schema, node_datum)
+        for _ in range(2):
+            reader = compile_reader(node_schema, cache_dir=self.cache_dir)
+            self.assertEqual(reader(BytesIO(data)), node_datum)
+
+    def test_tuple_records(self):
+        data = write_datum(node_schema, node_datum)
+        record = read_datum(data, node_schema, engine='cython', record_type='tuple')
+        self.assertEqual(record, read_datum(data, node_schema, record_type='tuple'))
+
+    def test_logical_types_and_defaults(self):
+        schema = {"type": "record", "name": "day", "fields": [{"name": "d", "type": {"type": "int", "logicalType": "date"}}]}
+        reader_schema = {"type": "record", "name": "day", "fields": [
+            {"name": "d", "type": {"type": "int", "logicalType": "date"}},
+            {"name": "until", "type": {"type": "int", "logicalType": "date"}, "default": 0}]}
+        data = write_datum(schema, {"d": 17609})
+        self.assertEqual(read_datum(data, schema, reader_schema, engine='cython', logical_types=True),
+                         {"d": datetime.date(2018, 3, 19), "until": datetime.date(1970, 1, 1)})
+
+    def test_stream_position_and_other_files(self):
+        data = write_datum(node_schema, node_datum)
+        reader = compile_reader(node_schema, cache_dir=self.cache_dir)
+        fo = BytesIO(data + data)
+        self.assertEqual([reader(fo), reader(fo)], [node_datum, node_datum])
+        self.assertEqual(fo.tell(), len(data) * 2)
+        self.assertEqual(reader(FileWithoutBuffer(data)), node_datum)
+
+    def test_truncated_data(self):
+        data = write_datum(node_schema, node_datum)
+        reader = compile_reader(node_schema, cache_dir=self.cache_dir)
+        with self.assertRaises(EOFError):
+            reader(BytesIO(data[:-4]))
+
+
+def create_cython_case(schema, datum, reader_schema):
+    def test_cython(self):
+        data = write_datum(schema, datum)
+        self.assertEqual(read_datum(data, schema, reader_schema, engine='cython'),
+                         read_datum(data, schema, reader_schema))
+    return test_cython
+
+
+def make_cases(cases):
+    for name, schema, datum, reader_schema in cases:
+        test_method = create_cython_case(schema, datum, reader_schema)
+        test_method.__name__ = 'test_cython_{}'.format(name)
+        setattr(TestCythonEngine, test_method.__name__, test_method)
+
+
+make_cases(codegen_cases)
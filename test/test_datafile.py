@@ -16,8 +16,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import os
+import subprocess
+import sys
 import unittest
 
+import six
+
 from spavro import schema
 from spavro import io
 from spavro import datafile
@@ -222,6 +226,65 @@ class TestDataFile(unittest.TestCase):
         with self.assertRaises(datafile.DataFileException) as context:
             datafile.DataFileWriter(writer, io.DatumWriter())
 
+    def test_reuse_records(self):
+        record_schema = schema.parse(SCHEMAS_TO_VALIDATE[-1][0])
+        data = [{'value': {'car': {'value': u'head'}, 'cdr': {'value': None}}},
+                {'value': {'car': {'value': None}, 'cdr': {'value': u'tail'}}},
+                {'value': u'atom'}]
+        buff = six.BytesIO()
+        with datafile.DataFileWriter(buff, io.DatumWriter(), record_schema) as dfw:
+            for datum in data:
+                dfw.append(datum)
+            dfw.flush()
+            written = buff.getvalue()
+        dfr = datafile.DataFileReader(six.BytesIO(written), io.DatumReader(), reuse_records=True)
+        records = [(id(record), dict(record)) for record in dfr]
+        self.assertEqual([record for _, record in records], data)
+        self.assertEqual(len(set(record_id for record_id, _ in records)), 1)
+        with self.assertRaises(datafile.DataFileException):
+            datafile.DataFileReader(six.BytesIO(written), object(), reuse_records=True)
+        with self.assertRaises(datafile.DataFileException):
+            datafile.DataFileReader(six.BytesIO(written), io.FastDatumReader(record_type='tuple'), reuse_records=True)
+        buff = six.BytesIO()
+        with datafile.DataFileWriter(buff, io.DatumWriter(), schema.parse('"long"')) as dfw:
+            dfw.append(1)
+            dfw.flush()
+            written = buff.getvalue()
+        with self.assertRaises(datafile.DataFileException):
+            datafile.DataFileReader(six.BytesIO(written), io.DatumReader(), reuse_records=True)
+
+    def test_import_is_lazy(self):
+        # importing doesn't parse the constant schemas or import the modules
+        # only some features need
+        lazy_modules = ('logging', 'uuid', 'http.client', 'datetime', 'decimal',
+                        'spavro.new_schema', 'spavro.records', 'spavro.py_binary')
+        if not six.PY2:
+            lazy_modules += ('threading',)
+        script = '\n'.join([
+            "import sys",
+            "lazy_modules = {!r}".format(lazy_modules),
+            "import spavro.datafile, spavro.ipc, spavro.schema",
+            "assert not spavro.schema.parse_cache, spavro.schema.parse_cache",
+            "assert not [name for name in lazy_modules if name in sys.modules]",
+            "assert spavro.datafile.get_meta_schema() is spavro.datafile.get_meta_schema()",
+            "assert spavro.ipc.constant('META_SCHEMA').type == 'map'",
+            # the module attributes stand in for the constants
+            "from six import BytesIO",
+            "import spavro.io",
+            "assert not [name for name in lazy_modules if name in sys.modules]",
+            "assert isinstance(spavro.datafile.META_SCHEMA, spavro.schema.RecordSchema)",
+            "assert spavro.datafile.META_SCHEMA.fullname == 'org.apache.avro.file.Header'",
+            "assert spavro.datafile.META_SCHEMA == spavro.datafile.get_meta_schema()",
+            "assert spavro.ipc.META_SCHEMA.type == 'map'",
+            "assert isinstance(spavro.ipc.SYSTEM_ERROR_SCHEMA, spavro.schema.UnionSchema)",
+            "buff = BytesIO()",
+            "spavro.ipc.META_WRITER.write({'a': b'b'}, spavro.io.BinaryEncoder(buff))",
+            "buff.seek(0)",
+            "assert spavro.ipc.META_READER.read(spavro.io.BinaryDecoder(buff)) == {'a': b'b'}",
+        ])
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.check_call([sys.executable, '-c', script], env=env)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -351,5 +351,53 @@ class TestIO(unittest.TestCase):
         write_datum(datum_to_write, writers_schema)
     # self.assertRaises(io.AvroTypeException, write_datum, datum_to_write, writers_schema)
 
+  def test_unchecked_writer(self):
+    print_name('TEST UNCHECKED WRITER')
+    writers_schema = schema.parse("""\
+      {"type": "record", "name": "Test",
+       "fields": [{"name": "A", "type": "int"},
+                  {"name": "B", "type": ["null", "string"]},
+                  {"name": "C", "type": {"type": "fixed", "name": "two", "size": 2}},
+                  {"name": "D", "type": "boolean"}]}""")
+    datum = {'A': -3, 'B': u'b', 'C': b'cc', 'D': True}
+    checked, _, _ = write_datum(datum, writers_schema)
+    unchecked = StringIO()
+    io.FastDatumWriter(writers_schema, validate=False).write(datum, io.FastBinaryEncoder(unchecked))
+    self.assertEqual(checked.getvalue(), unchecked.getvalue())
+
+  def test_unchecked_writer_conversion_errors(self):
+    print_name('TEST UNCHECKED WRITER CONVERSION ERRORS')
+    writers_schema = schema.parse('{"type": "record", "name": "Test", "fields": [{"name": "A", "type": "long"}]}')
+    datum_writer = io.FastDatumWriter(writers_schema, validate=False)
+    with self.assertRaises(OverflowError):
+      datum_writer.write({'A': 1 << 64}, io.FastBinaryEncoder(StringIO()))
+
+  def test_named_type_references(self):
+    print_name('TEST NAMED TYPE REFERENCES')
+    # a shared record and enum referenced after their definition and a
+    # recursive reference from inside the record being defined
+    writers_schema = schema.parse("""\
+      {"type": "record", "name": "Shape",
+       "fields": [{"name": "origin", "type": {"type": "record", "name": "Point",
+                                              "fields": [{"name": "x", "type": "double"},
+                                                         {"name": "color", "type": {"type": "enum", "name": "Color", "symbols": ["RED", "BLUE"]}}]}},
+                  {"name": "corner", "type": "Point"},
+                  {"name": "fill", "type": ["null", "Color"]},
+                  {"name": "inner", "type": ["null", "Shape"]}]}""")
+    datum = {'origin': {'x': 1.5, 'color': u'RED'}, 'corner': {'x': -2.0, 'color': u'BLUE'}, 'fill': u'BLUE',
+             'inner': {'origin': {'x': 0.0, 'color': u'RED'}, 'corner': {'x': 0.5, 'color': u'RED'},
+                       'fill': None, 'inner': None}}
+    writer, encoder, datum_writer = write_datum(datum, writers_schema)
+    self.assertEqual(read_datum(writer, writers_schema), datum)
+    self.assertTrue(io.DatumValidator(writers_schema).validate(datum))
+    json_writer = io.JsonDatumWriter(writers_schema)
+    self.assertEqual(io.JsonDatumReader(writers_schema).read(json_writer.write(datum)), datum)
+    transcoded = io.JsonTranscodingReader(writers_schema, avro_json=True).read(
+      io.FastBinaryDecoder(StringIO(writer.getvalue())))
+    self.assertEqual(io.JsonDatumReader(writers_schema).read(transcoded), datum)
+    rewritten = StringIO()
+    io.FastDatumWriter(writers_schema).write_json(transcoded, io.FastBinaryEncoder(rewritten), avro_json=True)
+    self.assertEqual(rewritten.getvalue(), writer.getvalue())
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,203 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import json
+from six import BytesIO
+
+import spavro.schema
+import spavro.io
+import spavro.datafile
+from spavro.io import JsonDatumReader, JsonDatumWriter, JsonTranscodingReader
+
+
+# name, schema, python datum, avro json encoding
+json_cases = (
+("null", "null", None, 'null'),
+("boolean", "boolean", True, 'true'),
+("int", "int", 12, '12'),
+("long", "long", 1 << 40, '1099511627776'),
+("double", "double", 1.5, '1.5'),
+("string", "string", u"hello", '"hello"'),
+("bytes", "bytes", b'\x00\xff\x7f', '"\\u0000\\u00ff\\u007f"'),
+("fixed", {"type": "fixed", "name": "four", "size": 4}, b'\x01\x02\x03\x04', '"\\u0001\\u0002\\u0003\\u0004"'),
+("enum", {"type": "enum", "name": "suit", "symbols": ["HEARTS", "SPADES"]}, u"SPADES", '"SPADES"'),
+("array", {"type": "array", "items": "bytes"}, [b'a', b'\xe9'], '["a", "\\u00e9"]'),
+("map", {"type": "map", "values": "long"}, {u"a": 1}, '{"a": 1}'),
+("nullable_null", ["null", "string"], None, 'null'),
+("nullable_string", ["null", "string"], u"a", '{"string": "a"}'),
+("union_int_long_float", ["int", "long", "float"], 1 << 40, '{"long": 1099511627776}'),
+("union_record", ["null", {"type": "record", "name": "ns.point", "fields": [
+    {"name": "x", "type": "int"}, {"name": "y", "type": ["null", "int"]}]}],
+    {"x": 1, "y": 2}, '{"ns.point": {"x": 1, "y": {"int": 2}}}'),
+("union_enum_string", [{"type": "enum", "name": "color", "symbols": ["RED"]}, "string"],
+    u"RED", '{"color": "RED"}'),
+)
+
+
+class TestJsonEncoding(unittest.TestCase):
+    def test_short_name_union_branch(self):
+        schema = spavro.schema.parse(json.dumps(["null", {"type": "record", "name": "ns.point", "fields": [
+            {"name": "x", "type": "int"}]}]))
+        self.assertEqual(JsonDatumReader(schema).read('{"point": {"x": 3}}'), {"x": 3})
+
+    def test_missing_fields_use_defaults(self):
+        schema = spavro.schema.parse(json.dumps({"type": "record", "name": "defaults", "fields": [
+            {"name": "a", "type": "int"},
+            {"name": "b", "type": "bytes", "default": "ÿ"},
+            {"name": "c", "type": ["null", "string"], "default": None}]}))
+        self.assertEqual(JsonDatumReader(schema).read('{"a": 1}'), {"a": 1, "b": b'\xff', "c": None})
+
+    def test_recursive_schema(self):
+        schema = spavro.schema.parse(json.dumps({"type": "record", "name": "node", "fields": [
+            {"name": "value", "type": "int"},
+            {"name": "next", "type": ["null", "node"]}]}))
+        datum = {"value": 1, "next": {"value": 2, "next": None}}
+        encoded = JsonDatumWriter(schema).write(datum)
+        self.assertEqual(json.loads(encoded), {"value": 1, "next": {"node": {"value": 2, "next": None}}})
+        self.assertEqual(JsonDatumReader(schema).read(encoded), datum)
+
+    def test_invalid_union_value(self):
+        schema = spavro.schema.parse('["null", "string"]')
+        with self.assertRaises(spavro.io.AvroTypeException):
+            JsonDatumReader(schema).read('{"int": 1}')
+        with self.assertRaises(spavro.io.AvroTypeException):
+            JsonDatumWriter(schema).write(1)
+
+    def test_missing_required_field(self):
+        schema = spavro.schema.parse('{"type": "record", "name": "req", "fields": [{"name": "a", "type": "int"}]}')
+        with self.assertRaises(spavro.io.AvroTypeException):
+            JsonDatumReader(schema).read('{}')
+
+
+def write_datum(parsed_schema, datum):
+    buff = BytesIO()
+    spavro.io.FastDatumWriter(parsed_schema).write(datum, spavro.io.FastBinaryEncoder(buff))
+    return buff.getvalue()
+
+
+def transcode(parsed_schema, data, avro_json):
+    reader = JsonTranscodingReader(parsed_schema, avro_json=avro_json)
+    return reader.read(spavro.io.FastBinaryDecoder(BytesIO(data)))
+
+
+class TestJsonTranscoding(unittest.TestCase):
+    def test_plain_json_matches_json_dumps(self):
+        schema = spavro.schema.parse(json.dumps({"type": "record", "name": "event", "fields": [
+            {"name": "id", "type": "long"},
+            {"name": "name", "type": ["null", "string"]},
+            {"name": "score", "type": "float"},
+            {"name": "tags", "type": {"type": "array", "items": "string"}},
+            {"name": "attrs", "type": {"type": "map", "values": ["null", "double"]}},
+            {"name": "empty", "type": {"type": "record", "name": "nothing", "fields": []}}]}))
+        datum = {"id": -5, "name": u"caf\xe9 \"quoted\"", "score": 1.1, "tags": [],
+                 "attrs": {u"a": None, u"b": float('nan')}, "empty": {}}
+        data = write_datum(schema, datum)
+        read_back = spavro.io.FastDatumReader(schema).read(spavro.io.FastBinaryDecoder(BytesIO(data)))
+        self.assertEqual(transcode(schema, data, False), json.dumps(read_back))
+
+    def test_data_file_to_json_lines(self):
+        schema = spavro.schema.parse('{"type": "record", "name": "row", "fields": [{"name": "v", "type": ["null", "int"]}]}')
+        buff = BytesIO()
+        writer = spavro.datafile.DataFileWriter(buff, spavro.io.DatumWriter(), schema)
+        for value in (1, None, 3):
+            writer.append({"v": value})
+        writer.flush()
+        buff.seek(0)
+        lines = list(spavro.datafile.DataFileReader(buff, JsonTranscodingReader(avro_json=True)))
+        self.assertEqual(lines, ['{"v": {"int": 1}}', '{"v": null}', '{"v": {"int": 3}}'])
+
+
+def write_json(parsed_schema, json_text, avro_json=False):
+    buff = BytesIO()
+    spavro.io.FastDatumWriter(parsed_schema).write_json(json_text, spavro.io.FastBinaryEncoder(buff), avro_json)
+    return buff.getvalue()
+
+
+class TestJsonToBinary(unittest.TestCase):
+    schema = spavro.schema.parse(json.dumps({"type": "record", "name": "event", "fields": [
+        {"name": "id", "type": "long"},
+        {"name": "value", "type": ["null", "int", "long", "double", {"type": "enum", "name": "level", "symbols": ["LOW"]}, "string"]},
+        {"name": "tags", "type": {"type": "array", "items": "string"}, "default": []},
+        {"name": "extra", "type": ["null", {"type": "record", "name": "extra", "fields": [{"name": "a", "type": "int"}]},
+                                   {"type": "map", "values": "string"}], "default": None}]}))
+
+    def assertTranscodes(self, json_text, datum):
+        self.assertEqual(write_json(self.schema, json_text), write_datum(self.schema, datum))
+
+    def test_fields_in_any_order(self):
+        self.assertTranscodes('{"tags": ["a", "b"], "value": 1, "id": 7}',
+                              {"id": 7, "value": 1, "tags": [u"a", u"b"], "extra": None})
+
+    def test_unknown_keys_are_skipped(self):
+        self.assertTranscodes('{"id": 7, "other": {"x": [1, 2]}, "value": null}',
+                              {"id": 7, "value": None, "tags": [], "extra": None})
+
+    def test_union_branch_from_the_value(self):
+        cases = ((u'12', 12), (u'1.5', 1.5), (u'"LOW"', u"LOW"), (u'"HIGH"', u"HIGH"))
+        for text, value in cases:
+            self.assertTranscodes(u'{"id": 1, "value": %s}' % text,
+                                  {"id": 1, "value": value, "tags": [], "extra": None})
+        # too big for an int, so the long branch
+        encoder = spavro.io.FastBinaryEncoder(BytesIO())
+        for value in (1, 2, 1 << 32, 0, 0):
+            encoder.write_long(value)
+        self.assertEqual(write_json(self.schema, '{"id": 1, "value": 4294967296}'), encoder.writer.getvalue())
+        self.assertTranscodes('{"id": 1, "value": null, "extra": {"a": 3}}',
+                              {"id": 1, "value": None, "tags": [], "extra": {"a": 3}})
+        self.assertTranscodes('{"id": 1, "value": null, "extra": {"b": "3"}}',
+                              {"id": 1, "value": None, "tags": [], "extra": {"b": u"3"}})
+
+    def test_invalid_json(self):
+        for text in ('{"value": 1}', '{"id": 1.5}', '{"id": 1, "value": true}', '{"id": 1} trailing'):
+            with self.assertRaises(spavro.io.AvroTypeException):
+                write_json(self.schema, text)
+
+    def test_append_json_lines(self):
+        buff = BytesIO()
+        writer = spavro.datafile.DataFileWriter(buff, spavro.io.DatumWriter(), self.schema)
+        writer.append_json_lines([b'{"id": 1, "value": "x"}\n', b'\n', b'{"id": 2, "value": null}\n'])
+        with self.assertRaises(spavro.io.AvroTypeException):
+            writer.append_json_lines(['{"id": 3, "value": "y", "tags": [1]}'])
+        writer.flush()
+        buff.seek(0)
+        records = list(spavro.datafile.DataFileReader(buff, spavro.io.DatumReader()))
+        self.assertEqual([(record["id"], record["value"]) for record in records], [(1, u"x"), (2, None)])
+
+
+def create_case(schema, datum, encoded):
+    def test_json_encoding(self):
+        parsed_schema = spavro.schema.parse(json.dumps(schema))
+        self.assertEqual(JsonDatumWriter(parsed_schema).write_json(datum), json.loads(encoded))
+        self.assertEqual(JsonDatumReader(parsed_schema).read(encoded), datum)
+    return test_json_encoding
+
+
+def create_transcoding_case(schema, datum, encoded):
+    def test_json_transcoding(self):
+        parsed_schema = spavro.schema.parse(json.dumps(schema))
+        data = write_datum(parsed_schema, datum)
+        self.assertEqual(json.loads(transcode(parsed_schema, data, True)), json.loads(encoded))
+    return test_json_transcoding
+
+
+def create_binary_case(schema, datum, encoded):
+    def test_json_to_binary(self):
+        parsed_schema = spavro.schema.parse(json.dumps(schema))
+        self.assertEqual(write_json(parsed_schema, encoded, avro_json=True), write_datum(parsed_schema, datum))
+    return test_json_to_binary
+
+
+def make_cases(cases):
+    for name, schema, datum, encoded in cases:
+        test_method = create_case(schema, datum, encoded)
+        test_method.__name__ = 'test_json_encoding_{}'.format(name)
+        setattr(TestJsonEncoding, test_method.__name__, test_method)
+        test_method = create_transcoding_case(schema, datum, encoded)
+        test_method.__name__ = 'test_json_transcoding_{}'.format(name)
+        setattr(TestJsonTranscoding, test_method.__name__, test_method)
+        test_method = create_binary_case(schema, datum, encoded)
+        test_method.__name__ = 'test_json_to_binary_{}'.format(name)
+        setattr(TestJsonToBinary, test_method.__name__, test_method)
+
+
+make_cases(json_cases)
@@ -0,0 +1,134 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import json
+import datetime
+import uuid
+from decimal import Decimal
+from six import BytesIO
+
+import spavro.schema
+import spavro.io
+from spavro.io import FastDatumReader, FastDatumWriter
+from spavro.fast_binary import utc_timezone
+
+utc = utc_timezone()
+
+
+# name, schema, python datum, raw (underlying avro type) datum
+logical_cases = (
+("date", {"type": "int", "logicalType": "date"},
+    datetime.date(2018, 3, 19), 17609),
+("date_before_epoch", {"type": "int", "logicalType": "date"},
+    datetime.date(1969, 12, 31), -1),
+("time_millis", {"type": "int", "logicalType": "time-millis"},
+    datetime.time(13, 45, 10, 123000), 49510123),
+("time_micros", {"type": "long", "logicalType": "time-micros"},
+    datetime.time(13, 45, 10, 123456), 49510123456),
+("timestamp_millis", {"type": "long", "logicalType": "timestamp-millis"},
+    datetime.datetime(2018, 3, 19, 13, 45, 10, 123000, tzinfo=utc), 1521467110123),
+("timestamp_micros", {"type": "long", "logicalType": "timestamp-micros"},
+    datetime.datetime(2018, 3, 19, 13, 45, 10, 123456, tzinfo=utc), 1521467110123456),
+("timestamp_before_epoch", {"type": "long", "logicalType": "timestamp-millis"},
+    datetime.datetime(1969, 12, 31, 23, 59, 59, 999000, tzinfo=utc), -1),
+("local_timestamp_millis", {"type": "long", "logicalType": "local-timestamp-millis"},
+    datetime.datetime(2018, 3, 19, 13, 45, 10, 123000), 1521467110123),
+("uuid", {"type": "string", "logicalType": "uuid"},
+    uuid.UUID('b7dc07d6-8eaa-4e51-9d13-62aa4ba1e3a4'), u'b7dc07d6-8eaa-4e51-9d13-62aa4ba1e3a4'),
+("decimal_bytes", {"type": "bytes", "logicalType": "decimal", "precision": 6, "scale": 2},
+    Decimal('-1234.56'), b'\xfe\x1d\xc0'),
+("decimal_bytes_big", {"type": "bytes", "logicalType": "decimal", "precision": 38, "scale": 4},
+    Decimal('12345678901234567890123.4567'), b'f\x1e\xfd\xf1X\xf2\xa8,\x9fK\x87'),
+("decimal_fixed", {"type": "fixed", "name": "money", "size": 8, "logicalType": "decimal", "precision": 10, "scale": 3},
+    Decimal('12.345'), b'\x00\x00\x00\x00\x00\x00\x30\x39'),
+("nullable_timestamp", ["null", {"type": "long", "logicalType": "timestamp-millis"}],
+    datetime.datetime(2018, 3, 19, 13, 45, 10, 123000, tzinfo=utc), 1521467110123),
+)
+
+
+def write_datum(schema, datum, **options):
+    buff = BytesIO()
+    writer = FastDatumWriter(spavro.schema.parse(json.dumps(schema)), **options)
+    writer.write(datum, spavro.io.FastBinaryEncoder(buff))
+    return buff.getvalue()
+
+
+def read_datum(schema, data, **options):
+    reader = FastDatumReader(spavro.schema.parse(json.dumps(schema)), **options)
+    return reader.read(spavro.io.FastBinaryDecoder(BytesIO(data)))
+
+
+class TestLogicalTypes(unittest.TestCase):
+    def test_conversion_is_opt_in(self):
+        schema = {"type": "record", "name": "event", "fields": [
+            {"name": "day", "type": {"type": "int", "logicalType": "date"}},
+            {"name": "at", "type": {"type": "long", "logicalType": "timestamp-millis"}}]}
+        data = write_datum(schema, {"day": 17609, "at": 1521467110123})
+        self.assertEqual(read_datum(schema, data), {"day": 17609, "at": 1521467110123})
+        self.assertEqual(read_datum(schema, data, logical_types=['date']),
+                         {"day": datetime.date(2018, 3, 19), "at": 1521467110123})
+
+    def test_naive_datetimes_are_utc(self):
+        schema = {"type": "long", "logicalType": "timestamp-millis"}
+        data = write_datum(schema, datetime.datetime(1970, 1, 1, 0, 0, 1), logical_types=True)
+        self.assertEqual(read_datum(schema, data), 1000)
+
+    def test_invalid_decimal_is_ignored(self):
+        schema = {"type": "bytes", "logicalType": "decimal", "precision": 2, "scale": 3}
+        data = write_datum(schema, b'\x01')
+        self.assertEqual(read_datum(schema, data, logical_types=True), b'\x01')
+
+    def test_decimal_with_too_many_digits(self):
+        schema = {"type": "bytes", "logicalType": "decimal", "precision": 6, "scale": 2}
+        with self.assertRaises(spavro.io.AvroTypeException):
+            write_datum(schema, Decimal('1.234'), logical_types=True)
+
+    def test_defaults_are_converted(self):
+        writer_schema = {"type": "record", "name": "event", "fields": [{"name": "id", "type": "long"}]}
+        reader_schema = {"type": "record", "name": "event", "fields": [
+            {"name": "id", "type": "long"},
+            {"name": "day", "type": {"type": "int", "logicalType": "date"}, "default": 17609},
+            {"name": "price", "type": {"type": "bytes", "logicalType": "decimal", "precision": 6, "scale": 2},
+             "default": u"\u00fe\u001d\u00c0"},
+            {"name": "cost", "type": {"type": "fixed", "name": "cost", "size": 2, "logicalType": "decimal",
+                                      "precision": 4, "scale": 1}, "default": u"\u0000\u000c"},
+            {"name": "seen", "type": {"type": "array", "items": {"type": "long", "logicalType": "timestamp-millis"}},
+             "default": [1521467110123]},
+            {"name": "until", "type": [{"type": "int", "logicalType": "date"}, "null"], "default": -1},
+            {"name": "deleted", "type": ["null", {"type": "int", "logicalType": "date"}], "default": None}]}
+        data = write_datum(writer_schema, {"id": 1})
+        raw = {"id": 1, "day": 17609, "price": u"\u00fe\u001d\u00c0", "cost": u"\u0000\u000c",
+               "seen": [1521467110123], "until": -1, "deleted": None}
+        expected = {"id": 1, "day": datetime.date(2018, 3, 19), "price": Decimal('-1234.56'), "cost": Decimal('1.2'),
+                    "seen": [datetime.datetime(2018, 3, 19, 13, 45, 10, 123000, tzinfo=utc)],
+                    "until": datetime.date(1969, 12, 31), "deleted": None}
+        writer = spavro.schema.parse(json.dumps(writer_schema))
+        reader = spavro.schema.parse(json.dumps(reader_schema))
+        for engine in ('closure', 'bytecode'):
+            for options, datum in (({}, raw), ({'logical_types': True}, expected)):
+                datum_reader = FastDatumReader(writer, reader, engine=engine, **options)
+                self.assertEqual(datum_reader.read(spavro.io.FastBinaryDecoder(BytesIO(data))), datum)
+
+    def test_schema_logical_type_property(self):
+        self.assertEqual(spavro.schema.parse('{"type": "int", "logicalType": "date"}').logical_type, 'date')
+        self.assertIsNone(spavro.schema.parse('{"type": "string", "logicalType": "date"}').logical_type)
+        self.assertIsNone(spavro.schema.parse('"int"').logical_type)
+
+
+def create_case(schema, datum, raw):
+    def test_logical_type(self):
+        data = write_datum(schema, datum, logical_types=True)
+        self.assertEqual(data, write_datum(schema, raw))
+        self.assertEqual(read_datum(schema, data, logical_types=True), datum)
+        self.assertEqual(read_datum(schema, data), raw)
+    return test_logical_type
+
+
+def make_cases(cases):
+    for name, schema, datum, raw in cases:
+        test_method = create_case(schema, datum, raw)
+        test_method.__name__ = 'test_logical_type_{}'.format(name)
+        setattr(TestLogicalTypes, test_method.__name__, test_method)
+
+
+make_cases(logical_cases)
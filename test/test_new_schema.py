@@ -0,0 +1,119 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import json
+import pickle
+from six import BytesIO
+
+import spavro.schema
+from spavro.new_schema import parse_schema, primitive_schemas
+from spavro.fast_binary import get_reader, get_writer
+from spavro.schema import SchemaParseException
+
+
+node_schema = {"type": "record", "name": "node", "namespace": "ns", "fields": [
+    {"name": "value", "type": "long"},
+    {"name": "kind", "type": {"type": "enum", "name": "kind", "symbols": ["LEAF", "BRANCH"]}},
+    {"name": "children", "type": {"type": "array", "items": "node"}, "default": []},
+    {"name": "parent_kind", "type": ["null", "ns.kind"]}]}
+
+
+# name, schema, python datum
+graph_cases = (
+("null", "null", None),
+("long", "long", 1 << 40),
+("string", {"type": "string", "doc": "annotated"}, u"caf\xe9"),
+("fixed", {"type": "fixed", "name": "four", "size": 4}, b'\x01\x02\x03\x04'),
+("enum", {"type": "enum", "name": "suit", "symbols": ["HEARTS", "SPADES"]}, u"SPADES"),
+("array", {"type": "array", "items": "double"}, [1.5, -2.0]),
+("map", {"type": "map", "values": ["null", "int"]}, {u"a": 1, u"b": None}),
+("union_records", ["null", {"type": "record", "name": "a", "fields": [{"name": "x", "type": "int"}]},
+                   {"type": "record", "name": "b", "fields": [{"name": "y", "type": "a"}]}],
+    {"y": {"x": 3}}),
+("error", {"type": "error", "name": "failure", "fields": [{"name": "message", "type": "string"}]},
+    {"message": u"broken"}),
+("recursive", node_schema,
+    {"value": 1, "kind": u"BRANCH", "parent_kind": None, "children": [
+        {"value": 2, "kind": u"LEAF", "parent_kind": u"BRANCH", "children": []}]}),
+)
+
+
+def write_datum(schema, datum, **options):
+    buff = BytesIO()
+    get_writer(schema, **options)(buff, datum)
+    return buff.getvalue()
+
+
+class TestNewSchema(unittest.TestCase):
+    def test_named_references_are_linked(self):
+        node = parse_schema(node_schema)
+        self.assertIs(node.fields[2].type.items, node)
+        self.assertIs(node.fields[3].type[1], node.fields[1].type)
+        self.assertEqual(node.fullname, "ns.node")
+        self.assertIs(node['fields'][0]['type'], primitive_schemas['long'])
+        self.assertEqual(node.fields_dict['children'].default, [])
+
+    def test_immutable(self):
+        node = parse_schema(node_schema)
+        with self.assertRaises(AttributeError):
+            node.fields = ()
+        with self.assertRaises(AttributeError):
+            node.fields[0].name = "other"
+        self.assertFalse(hasattr(node, '__dict__'))
+
+    def test_to_json_round_trip(self):
+        node = parse_schema(node_schema)
+        self.assertEqual(node.to_json()["fields"][2]["type"], {"type": "array", "items": "ns.node"})
+        self.assertEqual(parse_schema(node.to_json()).to_json(), node.to_json())
+        self.assertEqual(spavro.schema.parse(json.dumps(node.to_json())).fullname, "ns.node")
+        self.assertEqual(pickle.loads(pickle.dumps(node)).to_json(), node.to_json())
+
+    def test_aliases(self):
+        schema = {"type": "record", "name": "node", "namespace": "ns", "aliases": ["old_node", "other.node"],
+                  "fields": [{"name": "kind", "type": {"type": "enum", "name": "kind", "aliases": ["sort"],
+                                                       "symbols": ["A"]}, "aliases": ["type"]},
+                             {"name": "id", "type": {"type": "fixed", "name": "id", "size": 1}}]}
+        node = parse_schema(schema)
+        self.assertEqual(node.aliases, ("ns.old_node", "other.node"))
+        self.assertEqual(node['aliases'], node.aliases)
+        as_json = node.to_json()
+        self.assertEqual(as_json["aliases"], ["ns.old_node", "other.node"])
+        self.assertEqual(as_json["fields"][0]["type"]["aliases"], ["ns.sort"])
+        self.assertEqual(as_json["fields"][0]["aliases"], ["type"])
+        # no aliases, none in the JSON
+        self.assertNotIn("aliases", as_json["fields"][1]["type"])
+        self.assertEqual(parse_schema(as_json).to_json(), as_json)
+
+    def test_logical_types(self):
+        schema = parse_schema({"type": "int", "logicalType": "date"})
+        self.assertEqual(schema.get("logicalType"), "date")
+        reader = get_reader(schema, logical_types=True)
+        self.assertEqual(str(reader(BytesIO(write_datum(schema, 17609)))), "2018-03-19")
+
+    def test_invalid_schemas(self):
+        for schema in ("unknown",
+                       {"type": "record", "name": "r", "fields": [{"name": "a", "type": "r2"}]},
+                       [{"type": "enum", "name": "e", "symbols": ["A"]}, {"type": "fixed", "name": "e", "size": 1}],
+                       {"type": "record", "name": "r", "fields": [{"name": "a", "type": "int"}, {"name": "a", "type": "int"}]},
+                       {"type": "array"}):
+            with self.assertRaises(SchemaParseException):
+                parse_schema(schema)
+
+
+def create_case(schema, datum):
+    def test_graph_reader_writer(self):
+        graph = parse_schema(schema)
+        expected = write_datum(spavro.schema.parse(json.dumps(schema)).to_json(), datum)
+        self.assertEqual(write_datum(graph, datum), expected)
+        self.assertEqual(get_reader(graph)(BytesIO(expected)), datum)
+    return test_graph_reader_writer
+
+
+def make_cases(cases):
+    for name, schema, datum in cases:
+        test_method = create_case(schema, datum)
+        test_method.__name__ = 'test_graph_reader_writer_{}'.format(name)
+        setattr(TestNewSchema, test_method.__name__, test_method)
+
+
+make_cases(graph_cases)
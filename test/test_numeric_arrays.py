@@ -0,0 +1,197 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import array
+import datetime
+import json
+from six import BytesIO
+
+import spavro.schema
+import spavro.io
+from spavro import py_binary
+from spavro.io import FastDatumReader, FastDatumWriter
+from spavro.fast_binary import get_reader, get_writer, get_json_writer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+numeric_cases = (
+    ("int", 'i', [0, 1, -1, 300, -(1 << 31), (1 << 31) - 1]),
+    ("long", 'q', [0, 1, -1, 1 << 40, -(1 << 63), (1 << 63) - 1]),
+    ("float", 'f', [0.0, 1.5, -2.25, 1e10]),
+    ("double", 'd', [0.0, 1.5, -2.25, 1e300]),
+    ("boolean", 'b', [True, False, False, True]),
+)
+
+
+def write(schema, datum, **options):
+    buff = BytesIO()
+    get_writer(schema, **options)(buff, datum)
+    return buff.getvalue()
+
+
+class FileWithoutBuffer(object):
+    '''A file object that can't hand out its buffer, read item by item'''
+    def __init__(self, data):
+        self.data = BytesIO(data)
+
+    def read(self, size=-1):
+        return self.data.read(size)
+
+
+class TestNumericArrays(unittest.TestCase):
+    def test_blocks(self):
+        schema = {"type": "array", "items": "long"}
+        # a block with a negative count (followed by its size in bytes),
+        # then a plain block
+        data = bytes(bytearray([3, 4, 2, 4, 2, 6, 0]))
+        buff = BytesIO(data + write("int", 5))
+        reader = get_reader(schema, array_type='array')
+        self.assertEqual(reader(buff), array.array('q', [1, 2, 3]))
+        # the position is after the array
+        self.assertEqual(get_reader("int")(buff), 5)
+        self.assertEqual(reader(FileWithoutBuffer(data)), array.array('q', [1, 2, 3]))
+        self.assertEqual(py_binary.get_reader(schema, array_type='array')(BytesIO(data)), array.array('q', [1, 2, 3]))
+
+    def test_empty_array(self):
+        reader = get_reader({"type": "array", "items": "double"}, array_type='array')
+        self.assertEqual(reader(BytesIO(write({"type": "array", "items": "double"}, []))), array.array('d'))
+
+    def test_truncated_data(self):
+        schema = {"type": "array", "items": "double"}
+        data = write(schema, [1.0, 2.0])
+        for truncated in (data[:-3], bytes(bytearray([100, 2]))):
+            with self.assertRaises(EOFError):
+                get_reader(schema, array_type='array')(BytesIO(truncated))
+
+    def test_other_arrays_are_lists(self):
+        schema = {"type": "array", "items": "string"}
+        self.assertEqual(get_reader(schema, array_type='array')(BytesIO(write(schema, [u"a"]))), [u"a"])
+        # converted logical types
+        schema = {"type": "array", "items": {"type": "int", "logicalType": "date"}}
+        reader = get_reader(schema, array_type='array', logical_types=True)
+        self.assertEqual(reader(BytesIO(write(schema, [1]))), [datetime.date(1970, 1, 2)])
+
+    def test_unknown_array_type(self):
+        with self.assertRaises(ValueError):
+            get_reader({"type": "array", "items": "int"}, array_type='tuple')
+        with self.assertRaises(ValueError):
+            py_binary.get_reader({"type": "array", "items": "int"}, array_type='tuple')
+        schema = spavro.schema.parse(json.dumps({"type": "array", "items": "int"}))
+        with self.assertRaises(ValueError):
+            FastDatumReader(schema, engine='bytecode', array_type='array')
+
+    def test_write_other_buffer_types(self):
+        schema = {"type": "array", "items": "long"}
+        expected = write(schema, [1, -2, 3])
+        for typecode in ('b', 'h', 'i', 'l', 'q', 'B', 'H', 'I'):
+            datum = array.array(typecode, [1, 2 if typecode.isupper() else -2, 3])
+            if typecode.isupper():
+                self.assertEqual(write(schema, datum), write(schema, [1, 2, 3]))
+            else:
+                self.assertEqual(write(schema, datum), expected)
+        # converted to a list first
+        self.assertEqual(write({"type": "array", "items": "double"}, array.array('f', [1.5])),
+                         write({"type": "array", "items": "double"}, [1.5]))
+        self.assertEqual(write(schema, array.array('Q', [7])), write(schema, [7]))
+        self.assertEqual(write({"type": "array", "items": "boolean"}, array.array('B', [1, 0])),
+                         write({"type": "array", "items": "boolean"}, [True, False]))
+
+    def test_write_invalid_arrays(self):
+        with self.assertRaises(TypeError):
+            write({"type": "array", "items": "int"}, array.array('q', [1 << 40]))
+        with self.assertRaises(TypeError):
+            write({"type": "array", "items": "int"}, (1, 2))
+        with self.assertRaises(TypeError):
+            write({"type": "array", "items": "string"}, b"ab")
+
+    def test_arrays_in_unions(self):
+        schema = ["null", {"type": "array", "items": "int"}]
+        self.assertEqual(write(schema, array.array('i', [1, 2])), write(schema, [1, 2]))
+        schema = ["string", {"type": "array", "items": "double"}, {"type": "map", "values": "int"}]
+        self.assertEqual(write(schema, array.array('d', [1.5])), write(schema, [1.5]))
+
+    def test_datum_reader(self):
+        schema = spavro.schema.parse(json.dumps({"type": "record", "name": "sample", "fields": [
+            {"name": "values", "type": {"type": "array", "items": "float"}},
+            {"name": "names", "type": {"type": "array", "items": "string"}}]}))
+        buff = BytesIO()
+        FastDatumWriter(schema).write({"values": array.array('f', [0.5, 1.5]), "names": [u"a", u"b"]},
+                                      spavro.io.BinaryEncoder(buff))
+        buff.seek(0)
+        datum = FastDatumReader(schema, array_type='array').read(spavro.io.BinaryDecoder(buff))
+        self.assertEqual(datum, {"values": array.array('f', [0.5, 1.5]), "names": [u"a", u"b"]})
+
+    def test_validate(self):
+        cases = (
+            ("int", array.array('i', [1, 2]), True),
+            ("long", array.array('Q', [1 << 40]), True),
+            ("int", array.array('q', [1 << 40]), False),
+            ("int", array.array('d', [1.5]), False),
+            ("double", array.array('f', [1.5]), True),
+            ("boolean", array.array('B', [1, 0]), True),
+            ("boolean", array.array('i', [1, 0]), False),
+            ("string", array.array('b', [1]), False),
+            ("int", b"ab", False),
+        )
+        for item_type, datum, valid in cases:
+            schema = spavro.schema.parse(json.dumps({"type": "array", "items": item_type}))
+            self.assertEqual(spavro.io.DatumValidator(schema).validate(datum), valid, (item_type, datum))
+            self.assertEqual(spavro.io.validate(schema, datum), valid, (item_type, datum))
+        schema = spavro.schema.parse(json.dumps({"type": "record", "name": "sample", "fields": [
+            {"name": "values", "type": {"type": "array", "items": "int"}}]}))
+        error = spavro.io.DatumValidator(schema).first_error({"values": array.array('d', [1.0, 2.5])})
+        self.assertEqual(error.path, "values[0]")
+
+    def test_json_writer(self):
+        schema = spavro.schema.parse(json.dumps({"type": "record", "name": "sample", "fields": [
+            {"name": "values", "type": {"type": "array", "items": "double"}},
+            {"name": "flags", "type": {"type": "array", "items": "boolean"}},
+            {"name": "ids", "type": {"type": "array", "items": "long"}}]}))
+        datum = {"values": array.array('d', [0.5, 1.5]), "flags": array.array('B', [1, 0]),
+                 "ids": array.array('q', [7])}
+        self.assertEqual(json.loads(json.dumps(get_json_writer(schema.to_json())(datum))),
+                         {"values": [0.5, 1.5], "flags": [True, False], "ids": [7]})
+
+    @unittest.skipIf(numpy is None, "numpy isn't installed")
+    def test_numpy_arrays(self):
+        schema = {"type": "array", "items": "double"}
+        data = write(schema, numpy.arange(5, dtype='float64'))
+        self.assertEqual(data, write(schema, [0.0, 1.0, 2.0, 3.0, 4.0]))
+        for reader in (get_reader(schema, array_type='numpy'), py_binary.get_reader(schema, array_type='numpy')):
+            datum = reader(BytesIO(data))
+            self.assertEqual(datum.dtype, numpy.dtype('float64'))
+            self.assertEqual(datum.tolist(), [0.0, 1.0, 2.0, 3.0, 4.0])
+
+
+def create_case(item_type, typecode, values):
+    def test_numeric_array(self):
+        schema = {"type": "array", "items": item_type}
+        expected = array.array(typecode, values)
+        data = write(schema, values)
+        # array.array is written exactly like a list
+        self.assertEqual(write(schema, expected), data)
+        py_buff = BytesIO()
+        py_binary.get_writer(schema)(py_buff, expected)
+        self.assertEqual(py_buff.getvalue(), data)
+        # one item per block
+        blocks = b''.join(write(schema, [value])[:-1] for value in values) + b'\x00'
+        for encoded in (data, blocks):
+            self.assertEqual(get_reader(schema, array_type='array')(BytesIO(encoded)), expected)
+            self.assertEqual(get_reader(schema, array_type='array')(FileWithoutBuffer(encoded)), expected)
+            self.assertEqual(py_binary.get_reader(schema, array_type='array')(BytesIO(encoded)), expected)
+            self.assertEqual(get_reader(schema)(BytesIO(encoded)), values)
+    return test_numeric_array
+
+
+def make_cases(cases):
+    for item_type, typecode, values in cases:
+        test_method = create_case(item_type, typecode, values)
+        test_method.__name__ = 'test_numeric_array_{}'.format(item_type)
+        setattr(TestNumericArrays, test_method.__name__, test_method)
+
+
+make_cases(numeric_cases)
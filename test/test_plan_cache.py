@@ -0,0 +1,138 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import hashlib
+import json
+import marshal
+import os
+import shutil
+import tempfile
+from six import BytesIO
+
+import spavro.schema
+import spavro.io
+import spavro.plan_cache
+from spavro.io import FastDatumReader, FastDatumWriter
+from spavro.plan_cache import PlanCache
+from spavro.schema_resolve import resolve
+
+
+writer_schema = {"type": "record", "name": "event", "fields": [
+    {"name": "id", "type": "long"},
+    {"name": "kind", "type": {"type": "enum", "name": "kind", "symbols": ["CLICK", "VIEW"]}},
+    {"name": "tags", "type": {"type": "map", "values": "string"}},
+    {"name": "parent", "type": ["null", "event"]}]}
+
+reader_schema = {"type": "record", "name": "event", "fields": [
+    {"name": "id", "type": "long"},
+    {"name": "kind", "type": {"type": "enum", "name": "kind", "symbols": ["CLICK", "VIEW"]}},
+    {"name": "parent", "type": ["null", "event"]},
+    {"name": "score", "type": "double", "default": 0.5}]}
+
+datum = {"id": 7, "kind": u"VIEW", "tags": {u"a": u"b"},
+         "parent": {"id": 1, "kind": u"CLICK", "tags": {}, "parent": None}}
+
+expected = {"id": 7, "kind": u"VIEW", "score": 0.5,
+            "parent": {"id": 1, "kind": u"CLICK", "score": 0.5, "parent": None}}
+
+
+def read_with(cache, engine, **options):
+    writer = spavro.schema.parse(json.dumps(writer_schema))
+    reader = spavro.schema.parse(json.dumps(reader_schema))
+    buff = BytesIO()
+    FastDatumWriter(writer).write(datum, spavro.io.BinaryEncoder(buff))
+    buff.seek(0)
+    datum_reader = FastDatumReader(writer, reader, engine=engine, plan_cache=cache, **options)
+    return datum_reader.read(spavro.io.BinaryDecoder(buff))
+
+
+class TestPlanCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def plan_files(self, cache):
+        if not os.path.isdir(cache.cache_dir):
+            return []
+        return sorted(os.listdir(cache.cache_dir))
+
+    def test_plans_are_stored(self):
+        cache = PlanCache(self.cache_dir)
+        plan = cache.plan(writer_schema, reader_schema, 'bytecode')
+        self.assertEqual(plan.schema, resolve(writer_schema, reader_schema))
+        self.assertEqual(len(self.plan_files(cache)), 1)
+        self.assertIs(cache.plan(writer_schema, reader_schema, 'bytecode'), plan)
+        # a new cache (as in another process) loads the program from disk
+        loaded = PlanCache(self.cache_dir).plan(writer_schema, reader_schema, 'bytecode')
+        self.assertEqual(loaded.schema, plan.schema)
+        self.assertEqual(loaded.program.opcodes, plan.program.opcodes)
+        self.assertEqual(loaded.program.constants, plan.program.constants)
+
+    def test_plans_depend_on_engine_and_options(self):
+        cache = PlanCache(self.cache_dir)
+        cache.plan(writer_schema, reader_schema, 'bytecode')
+        cache.plan(writer_schema, reader_schema, 'bytecode', record_type='tuple')
+        cache.plan(writer_schema, reader_schema, 'closure')
+        cache.plan(writer_schema, None, 'closure')
+        self.assertEqual(len(self.plan_files(cache)), 4)
+        self.assertIsNone(cache.plan(writer_schema, None, 'closure').program)
+
+    def test_options_that_cant_be_stored(self):
+        cache = PlanCache(self.cache_dir)
+        plan = cache.plan(writer_schema, reader_schema, 'bytecode', logical_types=set(['date']))
+        self.assertEqual(plan.schema, resolve(writer_schema, reader_schema))
+        self.assertEqual(self.plan_files(cache), [])
+
+    def test_plans_depend_on_program_format(self):
+        cache_dir = PlanCache(self.cache_dir).cache_dir
+        original = spavro.plan_cache.PROGRAM_FORMAT
+        try:
+            # as if the opcodes of the extension changed
+            spavro.plan_cache.PROGRAM_FORMAT = original + 1
+            self.assertNotEqual(PlanCache(self.cache_dir).cache_dir, cache_dir)
+        finally:
+            spavro.plan_cache.PROGRAM_FORMAT = original
+
+    def test_damaged_plans_are_ignored(self):
+        cache = PlanCache(self.cache_dir)
+        cache.plan(writer_schema, reader_schema, 'bytecode')
+        path = os.path.join(cache.cache_dir, self.plan_files(cache)[0])
+        with open(path, 'rb') as plan_file:
+            data = plan_file.read()
+        with open(path, 'wb') as plan_file:
+            plan_file.write(data[:-3] + b'xyz')
+        self.assertEqual(read_with(PlanCache(self.cache_dir), 'bytecode'), expected)
+        with open(path, 'wb') as plan_file:
+            plan_file.write(b'')
+        self.assertEqual(read_with(PlanCache(self.cache_dir), 'bytecode'), expected)
+
+        # a well formed plan file holding an invalid program is compiled again
+        resolved = resolve(writer_schema, reader_schema)
+        for stored in ((resolved, [99], []), (resolved, None), 'plan'):
+            payload = marshal.dumps(stored)
+            with open(path, 'wb') as plan_file:
+                plan_file.write(hashlib.sha1(payload).digest() + payload)
+            self.assertEqual(read_with(PlanCache(self.cache_dir), 'bytecode'), expected)
+
+
+def create_case(engine, record_type):
+    def test_cached_reader(self):
+        options = {'record_type': record_type}
+        uncached = read_with(None, engine, **options)
+        # the first read stores the plan, the second one loads it
+        self.assertEqual(read_with(PlanCache(self.cache_dir), engine, **options), uncached)
+        self.assertEqual(read_with(PlanCache(self.cache_dir), engine, **options), uncached)
+    return test_cached_reader
+
+
+def make_cases():
+    for engine in ('closure', 'bytecode'):
+        for record_type in ('dict', 'tuple', 'namedtuple'):
+            test_method = create_case(engine, record_type)
+            test_method.__name__ = 'test_cached_reader_{}_{}'.format(engine, record_type)
+            setattr(TestPlanCache, test_method.__name__, test_method)
+
+
+make_cases()
@@ -0,0 +1,240 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import json
+import os
+import subprocess
+import sys
+import six
+from six import BytesIO
+
+import spavro.schema
+import spavro.io
+from spavro import py_binary
+from spavro.schema_resolve import resolve
+
+
+record_schema = {"type": "record", "name": "node", "namespace": "test", "fields": [
+    {"name": "id", "type": "long"},
+    {"name": "small", "type": "int"},
+    {"name": "label", "type": ["null", "string"]},
+    {"name": "kind", "type": {"type": "enum", "name": "kind", "symbols": ["LEAF", "BRANCH"]}},
+    {"name": "hash", "type": {"type": "fixed", "name": "hash", "size": 2}},
+    {"name": "weights", "type": {"type": "map", "values": ["long", "double"]}},
+    {"name": "children", "type": {"type": "array", "items": "node"}},
+    {"name": "flag", "type": "boolean"},
+    {"name": "raw", "type": "bytes"},
+    {"name": "score", "type": "double"}]}
+
+record_datum = {"id": -1 << 40, "small": 300, "label": u"caf\xe9", "kind": u"BRANCH", "hash": b"ab",
+                "weights": {u"x": 0.5}, "flag": True, "raw": b"\x00\xff", "score": -2.5,
+                "children": [{"id": 2, "small": -1, "label": None, "kind": u"LEAF", "hash": b"cd", "weights": {},
+                              "children": [], "flag": False, "raw": b"", "score": 0.0}]}
+
+# a record referenced through a union inside itself
+lisp_schema = {"type": "record", "name": "Lisp", "fields": [
+    {"name": "value", "type": ["null", "string", {"type": "record", "name": "Cons", "fields": [
+        {"name": "car", "type": "Lisp"}, {"name": "cdr", "type": "Lisp"}]}]}]}
+
+lisp_datum = {"value": {"car": {"value": u"head"}, "cdr": {"value": {"car": {"value": None},
+                                                                       "cdr": {"value": u"x" * 10000}}}}}
+
+# name, schema, datum
+py_binary_cases = (
+("null", "null", None),
+("boolean", "boolean", True),
+("int", "int", -123456),
+("long", "long", (1 << 62) + 5),
+("float", "float", 1.5),
+("double", "double", 1e300),
+("string", "string", u"☃ snow"),
+("bytes", "bytes", b"\x00\x01" * 100),
+("record", record_schema, record_datum),
+("union_of_records", ["null", {"type": "record", "name": "a", "fields": [{"name": "x", "type": "int"}]},
+                      {"type": "record", "name": "b", "fields": [{"name": "y", "type": "string"}]}],
+    {"y": u"why"}),
+("union_int_float", ["string", "float"], 12.0),
+("error_union", ["string", {"type": "error", "name": "failure", "fields": [{"name": "message", "type": "string"}]}],
+    {"message": u"broken"}),
+("array_of_maps", {"type": "array", "items": {"type": "map", "values": "long"}}, [{u"a": 1}, {}, {u"b": 1 << 40}]),
+)
+
+
+def parse(schema):
+    # named types are referenced by their full name in the parsed schema
+    return spavro.schema.parse(json.dumps(schema)).to_json()
+
+
+def fast_write(schema, datum):
+    buff = BytesIO()
+    spavro.io.FastDatumWriter(spavro.schema.parse(json.dumps(schema))).write(datum, spavro.io.FastBinaryEncoder(buff))
+    return buff.getvalue()
+
+
+def py_write(schema, datum, **options):
+    buff = BytesIO()
+    py_binary.get_writer(parse(schema), **options)(buff, datum)
+    return buff.getvalue()
+
+
+class FileWithoutGetvalue(object):
+    def __init__(self, data):
+        self.data = BytesIO(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return self.data.read(size)
+
+    def seek(self, offset, whence=0):
+        return self.data.seek(offset, whence)
+
+
+class TestPyBinary(unittest.TestCase):
+    def test_resolved_schema(self):
+        writer_schema = {"type": "record", "name": "r", "fields": [
+            {"name": "dropped", "type": {"type": "array", "items": "string"}}, {"name": "kept", "type": "int"}]}
+        reader_schema = {"type": "record", "name": "r", "fields": [
+            {"name": "kept", "type": "long"}, {"name": "added", "type": "string", "default": "new"}]}
+        reader = py_binary.get_reader(resolve(writer_schema, reader_schema))
+        data = fast_write(writer_schema, {"dropped": [u"a", u"b"], "kept": 3})
+        self.assertEqual(reader(BytesIO(data)), {"kept": 3, "added": u"new"})
+
+    def test_tuple_records(self):
+        data = fast_write(record_schema, record_datum)
+        for record_type in ('tuple', 'namedtuple'):
+            reader = spavro.io.FastDatumReader(spavro.schema.parse(json.dumps(record_schema)), record_type=record_type)
+            expected = reader.read(spavro.io.FastBinaryDecoder(BytesIO(data)))
+            self.assertEqual(py_binary.get_reader(parse(record_schema), record_type=record_type)(BytesIO(data)), expected)
+
+    def test_reads_from_files_without_getvalue(self):
+        fo = FileWithoutGetvalue(py_write("string", u"a") + py_write("string", u"bc"))
+        reader = py_binary.get_reader("string")
+        self.assertEqual([reader(fo), reader(fo)], [u"a", u"bc"])
+        # a datum is read in chunks, not the whole rest of the file
+        fo = FileWithoutGetvalue(py_write("long", 1) * 1000)
+        long_reader = py_binary.get_reader("long")
+        for _ in range(3):
+            self.assertEqual(long_reader(fo), 1)
+        self.assertEqual(fo.reads, 3)
+        self.assertEqual(fo.data.tell(), 3)
+        # a datum longer than a chunk
+        fo = FileWithoutGetvalue(py_write(lisp_schema, lisp_datum) + py_write("int", 7))
+        self.assertEqual(py_binary.get_reader(parse(lisp_schema))(fo), lisp_datum)
+        self.assertEqual(py_binary.get_reader("int")(fo), 7)
+        with self.assertRaises(EOFError):
+            py_binary.get_reader("int")(fo)
+
+    @unittest.skipIf(six.PY2, "python 2 BytesIO has no getbuffer")
+    def test_reads_bytes_io_without_copying(self):
+        class NoCopyBytesIO(BytesIO):
+            def getvalue(self):
+                raise AssertionError("getvalue copies the file on PyPy")
+        fo = NoCopyBytesIO(py_write(record_schema, record_datum) * 2)
+        reader = py_binary.get_reader(parse(record_schema))
+        self.assertEqual([reader(fo), reader(fo)], [record_datum, record_datum])
+        # the view of the buffer is released, the file can still be written
+        fo.write(py_write("string", u"more"))
+        fo.seek(-5, 1)
+        self.assertEqual(py_binary.get_reader("string")(fo), u"more")
+
+    def test_recursive_union(self):
+        # only the python writer and reader, the extension isn't needed
+        data = py_write(lisp_schema, lisp_datum)
+        self.assertEqual(py_binary.get_reader(parse(lisp_schema))(BytesIO(data)), lisp_datum)
+        with self.assertRaises(TypeError):
+            py_write(lisp_schema, {"value": {"car": {"value": 1}, "cdr": {"value": None}}})
+
+    def test_truncated_data(self):
+        data = fast_write(record_schema, record_datum)
+        with self.assertRaises(EOFError):
+            py_binary.get_reader(parse(record_schema))(BytesIO(data[:-3]))
+
+    def test_invalid_data(self):
+        for schema, datum in (("int", 1 << 31), ("long", u"1"), ("string", 1), (["null", "int"], u"x"),
+                              ({"type": "enum", "name": "e", "symbols": ["A"]}, u"B")):
+            with self.assertRaises(TypeError):
+                py_write(schema, datum)
+
+    def test_unsupported_options(self):
+        with self.assertRaises(ValueError):
+            py_binary.get_reader("int", logical_types=True)
+        with self.assertRaises(ValueError):
+            py_binary.get_reader(record_schema, record_type='lazy')
+
+    def test_io_without_the_extension(self):
+        # a fresh interpreter where importing fast_binary fails
+        script = '\n'.join([
+            "import sys, json",
+            "sys.modules['spavro.fast_binary'] = None",
+            "from six import BytesIO",
+            "import spavro.io, spavro.schema, spavro.datafile",
+            "assert spavro.io.DatumWriter is spavro.io.FastDatumWriter and not spavro.io.use_fast",
+            "schema = spavro.schema.parse({!r})".format(json.dumps(record_schema)),
+            "buff = BytesIO()",
+            "writer = spavro.datafile.DataFileWriter(buff, spavro.io.DatumWriter(), schema)",
+            "writer.append({!r})".format(record_datum),
+            "writer.flush()",
+            "buff.seek(0)",
+            "assert list(spavro.datafile.DataFileReader(buff, spavro.io.DatumReader())) == [{!r}]".format(record_datum),
+        ])
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.check_call([sys.executable, '-c', script], env=env)
+
+    def test_errors_without_the_extension(self):
+        # IPC protocols write and read error unions
+        schema = ["string", {"type": "error", "name": "failure", "fields": [{"name": "message", "type": "string"}]}]
+        script = '\n'.join([
+            "import sys, json",
+            "sys.modules['spavro.fast_binary'] = None",
+            "from six import BytesIO",
+            "import spavro.io, spavro.schema",
+            "schema = spavro.schema.parse({!r})".format(json.dumps(schema)),
+            "buff = BytesIO()",
+            "spavro.io.DatumWriter(schema).write({'message': u'broken'}, spavro.io.BinaryEncoder(buff))",
+            "buff.seek(0)",
+            "assert spavro.io.DatumReader(schema).read(spavro.io.BinaryDecoder(buff)) == {'message': u'broken'}",
+        ])
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.check_call([sys.executable, '-c', script], env=env)
+
+
+    def test_extension_only_apis(self):
+        script = '\n'.join([
+            "import sys",
+            "sys.modules['spavro.fast_binary'] = None",
+            "from six import BytesIO",
+            "import spavro.io, spavro.schema",
+            "schema = spavro.schema.parse('\"long\"')",
+            "calls = [lambda: spavro.io.DatumValidator(schema), lambda: spavro.io.JsonDatumWriter(schema),",
+            "         lambda: spavro.io.JsonDatumReader(schema), lambda: spavro.io.JsonTranscodingReader(schema),",
+            "         lambda: spavro.io.DatumWriter(schema).write_json('1', spavro.io.BinaryEncoder(BytesIO()))]",
+            "for call in calls:",
+            "    try:",
+            "        call()",
+            "    except ImportError as ex:",
+            "        assert 'C extension' in str(ex)",
+            "    else:",
+            "        raise AssertionError(call)",
+        ])
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.check_call([sys.executable, '-c', script], env=env)
+
+
+def create_case(schema, datum):
+    def test_py_binary(self):
+        data = fast_write(schema, datum)
+        self.assertEqual(py_write(schema, datum), data)
+        self.assertEqual(py_write(schema, datum, validate=False), data)
+        self.assertEqual(py_binary.get_reader(parse(schema))(BytesIO(data)), datum)
+    return test_py_binary
+
+
+def make_cases(cases):
+    for name, schema, datum in cases:
+        test_method = create_case(schema, datum)
+        test_method.__name__ = 'test_py_binary_{}'.format(name)
+        setattr(TestPyBinary, test_method.__name__, test_method)
+
+
+make_cases(py_binary_cases)
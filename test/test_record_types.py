@@ -0,0 +1,338 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import json
+from collections import namedtuple
+from six import BytesIO
+
+import spavro.schema
+import spavro.io
+from spavro import py_binary
+from spavro.io import FastDatumReader, FastDatumWriter
+from spavro.fast_binary import get_writer, get_validator, get_json_writer
+
+
+record_schema = {"type": "record", "name": "test.Person", "fields": [
+    {"name": "name", "type": "string"},
+    {"name": "age", "type": ["null", "int"]},
+    {"name": "address", "type": {"type": "record", "name": "Address", "fields": [
+        {"name": "street", "type": "string"},
+        {"name": "zip", "type": "long"}]}}]}
+
+record_datum = {"name": u"Bugs", "age": 78,
+                "address": {"street": u"Carrot Lane", "zip": 12345}}
+
+# the reader drops "age" so the resolved record has a skip field
+reader_schema = {"type": "record", "name": "test.Person", "fields": [
+    {"name": "name", "type": "string"},
+    {"name": "address", "type": {"type": "record", "name": "Address", "fields": [
+        {"name": "street", "type": "string"},
+        {"name": "zip", "type": "long"}]}}]}
+
+
+def write_datum(schema, datum):
+    buff = BytesIO()
+    FastDatumWriter(spavro.schema.parse(json.dumps(schema))).write(datum, spavro.io.FastBinaryEncoder(buff))
+    return buff.getvalue()
+
+
+def read_datum(data, writer_schema, reader_schema=None, record_type='dict', **options):
+    readers_schema = spavro.schema.parse(json.dumps(reader_schema)) if reader_schema else None
+    reader = FastDatumReader(spavro.schema.parse(json.dumps(writer_schema)), readers_schema, record_type=record_type,
+                             **options)
+    return reader.read(spavro.io.FastBinaryDecoder(BytesIO(data)))
+
+
+class TestRecordTypes(unittest.TestCase):
+    def setUp(self):
+        self.data = write_datum(record_schema, record_datum)
+
+    def test_dict_is_default(self):
+        self.assertEqual(read_datum(self.data, record_schema), record_datum)
+
+    def test_tuple(self):
+        record = read_datum(self.data, record_schema, record_type='tuple')
+        self.assertEqual(record, (u"Bugs", 78, (u"Carrot Lane", 12345)))
+
+    def test_namedtuple(self):
+        record = read_datum(self.data, record_schema, record_type='namedtuple')
+        self.assertEqual(type(record).__name__, 'Person')
+        self.assertEqual(record.name, u"Bugs")
+        self.assertEqual(record.age, 78)
+        self.assertEqual(record.address.zip, 12345)
+
+    def test_slots(self):
+        record = read_datum(self.data, record_schema, record_type='slots')
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(record.name, u"Bugs")
+        self.assertEqual(record.address.street, u"Carrot Lane")
+        self.assertEqual(record._asdict()['age'], 78)
+
+    def test_one_class_per_record_schema(self):
+        first = read_datum(self.data, record_schema, record_type='slots')
+        second = read_datum(self.data, record_schema, record_type='slots')
+        self.assertIs(type(first), type(second))
+        self.assertEqual(first, second)
+
+    def test_skipped_fields_are_not_in_the_record(self):
+        record = read_datum(self.data, record_schema, reader_schema, record_type='namedtuple')
+        self.assertEqual(record._fields, ('name', 'address'))
+        record = read_datum(self.data, record_schema, reader_schema, record_type='tuple')
+        self.assertEqual(record, (u"Bugs", (u"Carrot Lane", 12345)))
+
+    def test_read_into(self):
+        reader = FastDatumReader(spavro.schema.parse(json.dumps(record_schema)))
+        other = dict(record_datum, name=u"Daffy", address={"street": u"Pond", "zip": 1})
+        fo = BytesIO(self.data + write_datum(record_schema, other))
+        decoder = spavro.io.FastBinaryDecoder(fo)
+        record = {'extra': 1}
+        self.assertIs(reader.read_into(decoder, record), record)
+        self.assertEqual(record, dict(record_datum, extra=1))
+        address = record['address']
+        reader.read_into(decoder, record)
+        self.assertEqual(record, dict(other, extra=1))
+        # the nested record was refilled as well
+        self.assertIs(record['address'], address)
+
+    def test_read_into_other_record_types(self):
+        reader = FastDatumReader(spavro.schema.parse(json.dumps(record_schema)), record_type='lazy')
+        record = reader.read_into(spavro.io.FastBinaryDecoder(BytesIO(self.data)), {})
+        self.assertEqual(record['name'], u"Bugs")
+        reader = FastDatumReader(spavro.schema.parse(json.dumps(record_schema)), engine='bytecode')
+        record = {'extra': 1}
+        self.assertIs(reader.read_into(spavro.io.FastBinaryDecoder(BytesIO(self.data)), record), record)
+        self.assertEqual(record, dict(record_datum, extra=1))
+
+    def test_read_into_rejects_other_records(self):
+        readers = [FastDatumReader(spavro.schema.parse(json.dumps(record_schema)), record_type=record_type)
+                   for record_type in ('tuple', 'namedtuple', 'slots')]
+        readers.append(FastDatumReader(spavro.schema.parse(json.dumps(record_schema)),
+                                       record_factory={'test.Person': Person}))
+        readers.append(FastDatumReader(spavro.schema.parse('"long"')))
+        for reader in readers:
+            fo = BytesIO(self.data)
+            record = {}
+            with self.assertRaises(ValueError):
+                reader.read_into(spavro.io.FastBinaryDecoder(fo), record)
+            # nothing was read
+            self.assertEqual((fo.tell(), record), (0, {}))
+
+    def test_unknown_record_type(self):
+        with self.assertRaises(ValueError):
+            read_datum(self.data, record_schema, record_type='frozenset')
+
+
+class Address(object):
+    def __init__(self, street, zip):
+        self.street = street
+        self.zip = zip
+
+
+class Person(object):
+    # the parameters in another order than the fields
+    def __init__(self, address, name, age=None):
+        self.name = name
+        self.age = age
+        self.address = address
+
+
+def person_from_fields(**fields):
+    return ('person', fields)
+
+
+class TestRecordFactories(unittest.TestCase):
+    def setUp(self):
+        self.data = write_datum(record_schema, record_datum)
+
+    def test_classes(self):
+        record = read_datum(self.data, record_schema, record_factory={'test.Person': Person, 'test.Address': Address})
+        self.assertIsInstance(record, Person)
+        self.assertEqual((record.name, record.age), (u"Bugs", 78))
+        self.assertIsInstance(record.address, Address)
+        self.assertEqual((record.address.street, record.address.zip), (u"Carrot Lane", 12345))
+
+    def test_keyword_factory(self):
+        record = read_datum(self.data, record_schema, record_factory={'test.Person': person_from_fields})
+        self.assertEqual(record, ('person', record_datum))
+
+    def test_other_records_use_the_record_type(self):
+        record = read_datum(self.data, record_schema, record_type='tuple', record_factory={'test.Address': Address})
+        self.assertEqual(record[:2], (u"Bugs", 78))
+        self.assertEqual(record[2].zip, 12345)
+
+    def test_skipped_fields_are_not_passed(self):
+        record = read_datum(self.data, record_schema, reader_schema, record_factory={'test.Person': Person})
+        self.assertEqual((record.name, record.age), (u"Bugs", None))
+        self.assertEqual(record.address, record_datum['address'])
+
+    def test_only_the_closure_engine(self):
+        with self.assertRaises(ValueError):
+            read_datum(self.data, record_schema, engine='bytecode', record_factory={'test.Person': Person})
+
+
+class SlotsAddress(object):
+    __slots__ = ('zip', 'street')
+
+    def __init__(self, street, zip):
+        self.street = street
+        self.zip = zip
+
+
+PersonTuple = namedtuple('Person', ['address', 'age', 'name'])
+
+union_schema = {"type": "record", "name": "Holder", "fields": [
+    {"name": "person", "type": ["null", record_schema]},
+    {"name": "thing", "type": ["null", "string",
+                               {"type": "record", "name": "Other", "fields": [{"name": "zip", "type": "string"}]},
+                               {"type": "record", "name": "SlotsAddress", "fields": [
+                                   {"name": "street", "type": "string"}, {"name": "zip", "type": "long"}]}]}]}
+
+# name, schema, datum, the same datum as dicts
+object_cases = (
+("objects", record_schema, Person(Address(u"Carrot Lane", 12345), u"Bugs", 78), record_datum),
+("slots", record_schema, Person(SlotsAddress(u"Carrot Lane", 12345), u"Bugs", 78), record_datum),
+("namedtuple", record_schema, PersonTuple((u"Carrot Lane", 12345), 78, u"Bugs"), record_datum),
+("tuples", record_schema, (u"Bugs", 78, (u"Carrot Lane", 12345)), record_datum),
+("missing_nullable_attribute", record_schema, Person(Address(u"Carrot Lane", 12345), u"Bugs", None),
+    dict(record_datum, age=None)),
+("union_branches", union_schema,
+    {"person": Person(Address(u"a", 1), u"Bugs", None), "thing": SlotsAddress(u"b", 2)},
+    {"person": dict(record_datum, age=None, address={"street": u"a", "zip": 1}),
+     "thing": {"street": u"b", "zip": 2}}),
+)
+
+
+class TestRecordObjects(unittest.TestCase):
+    def test_tuples_need_every_field(self):
+        with self.assertRaises(TypeError):
+            get_writer(record_schema)(BytesIO(), (u"Bugs", 78))
+
+    def test_ambiguous_union_objects(self):
+        schema = ["null", {"type": "record", "name": "a", "fields": []}, {"type": "record", "name": "b", "fields": []}]
+        with self.assertRaises(TypeError):
+            get_writer(schema)(BytesIO(), Address(u"a", 1))
+
+    def test_invalid_records(self):
+        class Unrelated(object):
+            def __init__(self):
+                self.color = u"red"
+
+        writers = (get_writer(record_schema), get_writer(record_schema, validate=False),
+                   py_binary.get_writer(record_schema))
+        for datum in (42, u"hello", object(), Unrelated()):
+            for writer in writers:
+                with self.assertRaises(TypeError):
+                    writer(BytesIO(), datum)
+            with self.assertRaises(TypeError):
+                get_json_writer(record_schema)(datum)
+            self.assertIsNotNone(get_validator(record_schema)(datum))
+        # a tuple with too few values and one with an invalid value
+        self.assertIsNotNone(get_validator(record_schema)((u"Bugs", 78)))
+        self.assertEqual(get_validator(record_schema)((u"Bugs", u"old", None))[-1], 'age')
+
+    def test_invalid_union_objects(self):
+        schema = ["null", {"type": "record", "name": "Other", "fields": [{"name": "zip", "type": ["null", "string"]}]}]
+        for make_writer in (get_writer, py_binary.get_writer):
+            writer = make_writer(schema)
+            for datum in (42, object(), Person(None, u"Bugs", 78)):
+                with self.assertRaises(TypeError):
+                    writer(BytesIO(), datum)
+            # an object with the field
+            written = BytesIO()
+            writer(written, Address(u"a", u"1"))
+            self.assertEqual(written.getvalue(), b'\x02\x02\x021')
+
+
+def create_object_case(schema, datum, dict_datum, make_writer, options):
+    def test_write_objects(self):
+        expected = BytesIO()
+        get_writer(schema)(expected, dict_datum)
+        written = BytesIO()
+        make_writer(schema, **options)(written, datum)
+        self.assertEqual(written.getvalue(), expected.getvalue())
+    return test_write_objects
+
+
+def create_validate_case(schema, datum):
+    def test_validate_objects(self):
+        self.assertIsNone(get_validator(schema)(datum))
+    return test_validate_objects
+
+
+def create_json_case(schema, datum, dict_datum):
+    def test_write_json_objects(self):
+        self.assertEqual(get_json_writer(schema)(datum), get_json_writer(schema)(dict_datum))
+    return test_write_json_objects
+
+
+def make_object_cases():
+    for name, schema, datum, dict_datum in object_cases:
+        # whatever the writers take is valid and written the same as json
+        test_method = create_validate_case(schema, datum)
+        test_method.__name__ = 'test_validate_{}'.format(name)
+        setattr(TestRecordObjects, test_method.__name__, test_method)
+        test_method = create_json_case(schema, datum, dict_datum)
+        test_method.__name__ = 'test_write_json_{}'.format(name)
+        setattr(TestRecordObjects, test_method.__name__, test_method)
+        for kind, make_writer, options in (('fast', get_writer, {}), ('unchecked', get_writer, {'validate': False}),
+                                           ('py_binary', py_binary.get_writer, {})):
+            test_method = create_object_case(schema, datum, dict_datum, make_writer, options)
+            test_method.__name__ = 'test_write_{}_{}'.format(kind, name)
+            setattr(TestRecordObjects, test_method.__name__, test_method)
+
+
+make_object_cases()
+
+
+class TestLazyRecords(unittest.TestCase):
+    def setUp(self):
+        self.data = write_datum(record_schema, record_datum)
+
+    def test_fields_are_decoded_on_access(self):
+        record = read_datum(self.data, record_schema, record_type='lazy')
+        self.assertEqual(record._values, {})
+        self.assertEqual(record['age'], 78)
+        self.assertEqual(list(record._values), ['age'])
+        self.assertEqual(record['address']['zip'], 12345)
+
+    def test_mapping_interface(self):
+        record = read_datum(self.data, record_schema, record_type='lazy')
+        self.assertEqual(len(record), 3)
+        self.assertEqual(list(record), ['name', 'age', 'address'])
+        self.assertIn('name', record)
+        self.assertIsNone(record.get('missing'))
+        self.assertEqual(record['address'].to_dict(), record_datum['address'])
+
+    def test_raw_bytes_and_stream_position(self):
+        fo = BytesIO(self.data + self.data)
+        reader = FastDatumReader(spavro.schema.parse(json.dumps(record_schema)), record_type='lazy')
+        decoder = spavro.io.FastBinaryDecoder(fo)
+        first = reader.read(decoder)
+        second = reader.read(decoder)
+        self.assertEqual(first.raw, self.data)
+        self.assertEqual(second['name'], u"Bugs")
+        self.assertEqual(fo.tell(), len(self.data) * 2)
+
+    def test_skipped_fields_are_not_in_the_view(self):
+        schema = {"type": "record", "name": "Skippy", "fields": [
+            {"name": "tags", "type": {"type": "array", "items": "string"}},
+            {"name": "counts", "type": {"type": "map", "values": "double"}},
+            {"name": "id", "type": "long"}]}
+        reader = {"type": "record", "name": "Skippy", "fields": [
+            {"name": "id", "type": "long"},
+            {"name": "flag", "type": "boolean", "default": True}]}
+        data = write_datum(schema, {"tags": [u"a", u"b"], "counts": {u"x": 1.5}, "id": 99})
+        record = read_datum(data, schema, reader, record_type='lazy')
+        self.assertEqual(record, {"id": 99, "flag": True})
+
+    def test_truncated_data(self):
+        schema = {"type": "record", "name": "Truncated", "fields": [
+            {"name": "name", "type": "string"},
+            {"name": "flag", "type": "boolean"},
+            {"name": "score", "type": "double"},
+            {"name": "id", "type": "long"}]}
+        data = write_datum(schema, {"name": u"abc", "flag": True, "score": 1.5, "id": 1 << 40})
+        # cut in the string, the boolean, the double and the long
+        for size in (2, 4, 8, len(data) - 1):
+            with self.assertRaises(EOFError):
+                read_datum(data[:size], schema, record_type='lazy')
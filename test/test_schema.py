@@ -19,6 +19,7 @@
 Test the schema parsing logic.
 """
 import unittest
+import json
 from spavro import schema
 
 
@@ -481,5 +482,49 @@ class TestSchema(unittest.TestCase):
         with self.assertRaises(schema.SchemaParseException) as context:
                 schema.parse('/not/a/real/file')
 
+    def test_parse_is_cached(self):
+        text = '{"type": "record", "name": "cached", "fields": [{"name": "a", "type": "int"}]}'
+        self.assertIs(schema.parse(text), schema.parse(text))
+        self.assertIsNot(schema.parse_uncached(text), schema.parse(text))
+        self.assertEqual(schema.parse_uncached(text), schema.parse(text))
+        # invalid schemas aren't cached, they fail every time
+        for _ in range(2):
+            with self.assertRaises(schema.SchemaParseException):
+                schema.parse('{"type": "record", "name": "bad"}')
+
+    def test_to_json_is_memoized(self):
+        parsed = schema.parse_uncached('{"type": "record", "name": "ns.memo", "fields": ['
+                                       '{"name": "a", "type": {"type": "enum", "name": "e", "symbols": ["A"]}},'
+                                       '{"name": "b", "type": ["null", "e"]}]}')
+        self.assertEqual(parsed.to_json(), parsed.to_json())
+        self.assertEqual(parsed.to_json()['fields'][1]['type'], ['null', 'ns.e'])
+        # nested calls depend on the enclosing names, they aren't cached
+        union = parsed.fields[1].type
+        self.assertEqual(union.to_json()[1]['symbols'], ['A'])
+        names = schema.Names()
+        names.names['ns.e'] = union.schemas[1]
+        self.assertEqual(union.to_json(names), ['null', 'ns.e'])
+        parsed.set_prop('doc', 'changed')
+        self.assertEqual(parsed.to_json()['doc'], 'changed')
+        # a change to a nested schema or field shows in the enclosing JSON
+        parsed.fields[0].type.set_prop('doc', 'nested')
+        self.assertEqual(parsed.to_json()['fields'][0]['type']['doc'], 'nested')
+        parsed.fields[1].set_prop('doc', 'field')
+        self.assertEqual(parsed.to_json()['fields'][1]['doc'], 'field')
+
+    def test_to_json_returns_copies(self):
+        text = '{"type": "record", "name": "copied", "fields": [{"name": "a", "type": "int"}]}'
+        as_json = schema.parse(text).to_json()
+        as_json['name'] = 'X'
+        as_json['fields'][0]['name'] = 'b'
+        self.assertEqual(schema.parse(text).to_json()['name'], 'copied')
+        self.assertEqual(json.loads(str(schema.parse(text))), json.loads(text))
+
+    def test_schema_objects_have_slots(self):
+        parsed = schema.parse('{"type": "record", "name": "slotted", "fields": ['
+                              '{"name": "a", "type": {"type": "array", "items": "int"}}]}')
+        for obj in (parsed, parsed.fields[0], parsed.fields[0].type, parsed.fields[0].type.items):
+            self.assertFalse(hasattr(obj, '__dict__'), obj)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,10 +1,15 @@
 # Copyright (C) 2018 Pluralsight LLC
 
+import threading
+import time
 import unittest
 from six import BytesIO
 
 import spavro.io
+from spavro import py_binary
 from spavro.io import FastDatumWriter
+from spavro.fast_binary import get_reader, get_writer
+from spavro.records import Branch
 # from spavro.io import SlowDatumWriter as FastDatumWriter
 # from spavro.exceptions import AvroTypeException
 
@@ -18,31 +23,206 @@ simple_write_cases = (
     ("promote_int_to_double", 314159, '["null", "double"]', b"\x02\x00\x00\x00\x00\xbc,\x13A"),
     ("dont_promte_int_to_double", 314159, '["null", "double", "int"]', b"\x04\xde\xac&"),
     ("promote_string_to_bytes", u"testing123", '["null", "bytes"]', b"\x02\x14testing123"),
-    ("dont_promote_string_to_bytes", u"testing123", '["null", "bytes", "string"]', b"\x04\x14testing123")
+    ("dont_promote_string_to_bytes", u"testing123", '["null", "bytes", "string"]', b"\x04\x14testing123"),
+    ("null_second", u"a", '["string", "null"]', b"\x00\x02a"),
+    ("null_second_with_null", None, '["string", "null"]', b"\x02"),
+    ("nullable_boolean", True, '["null", "boolean"]', b"\x02\x01"),
+    ("nullable_record", {"a": 1}, '["null", {"type": "record", "name": "r", "fields": [{"name": "a", "type": "int"}]}]', b"\x02\x02"),
+)
+
+# two record branches only told apart by their fields, along with a map
+record_union = ('[{"type": "record", "name": "ns.cat", "fields": [{"name": "lives", "type": "int"}]},'
+                ' {"type": "record", "name": "ns.dog", "fields": [{"name": "tricks", "type": "int"},'
+                ' {"name": "good", "type": ["null", "boolean"]}]},'
+                ' {"type": "map", "values": "int"}]')
+
+complex_write_cases = (
+    ("first_record", {"lives": 9}, record_union, b"\x00\x12"),
+    ("second_record", {"tricks": 2, "good": False}, record_union, b"\x02\x04\x02\x00"),
+    ("record_without_nullable_field", {"tricks": 2}, record_union, b"\x02\x04\x00"),
+    ("map", {"lives": 9, "tricks": 2}, record_union, b"\x04\x04\nlives\x12\x0ctricks\x04\x00"),
+    ("branch_hint", Branch("map", {"lives": 1}), record_union, b"\x04\x02\nlives\x02\x00"),
+    ("short_name_branch_hint", Branch("cat", {"lives": 1}), record_union, b"\x00\x02"),
+    ("simple_union_branch_hint", Branch("long", 1), '["null", "long"]', b"\x02\x02"),
 )
 
 
 class TestUnionWriter(unittest.TestCase):
-    pass
+    def test_dispatch_is_cached_by_keys(self):
+        fdw = FastDatumWriter(spavro.schema.parse(record_union))
+        for datum, expected in (({"lives": 1}, b"\x00\x02"), ({"lives": 2}, b"\x00\x04")):
+            fastbuff = BytesIO()
+            fdw.write(datum, spavro.io.FastBinaryEncoder(fastbuff))
+            self.assertEqual(fastbuff.getvalue(), expected)
+
+    def test_type_key_is_opt_in(self):
+        datum = {"__type": "ns.dog", "tricks": 1, "good": True}
+        hinted = BytesIO()
+        writer = FastDatumWriter(spavro.schema.parse(record_union), union_type_key='__type')
+        writer.write(datum, spavro.io.FastBinaryEncoder(hinted))
+        self.assertEqual(hinted.getvalue(), b"\x02\x02\x02\x01")
+        with self.assertRaises(spavro.io.AvroTypeException):
+            writer.write({"__type": "ns.bird"}, spavro.io.FastBinaryEncoder(BytesIO()))
+        # without it the key is map data
+        schema = '[{"type": "map", "values": "string"}, {"type": "record", "name": "r", "fields": []}]'
+        plain = BytesIO()
+        FastDatumWriter(spavro.schema.parse(schema)).write({"__type": u"r"}, spavro.io.FastBinaryEncoder(plain))
+        self.assertEqual(plain.getvalue(), b"\x00\x02\x0c__type\x02r\x00")
+
+    def test_keys_keep_union_order(self):
+        cat = '{"type": "record", "name": "cat", "fields": [{"name": "lives", "type": "int"}]}'
+        for schema, datum, expected in (('[{"type": "map", "values": "int"}, ' + cat + ']',
+                                         {"lives": 9}, b"\x00\x02\nlives\x12\x00"),
+                                        ('[' + cat + ', {"type": "map", "values": "string"}]',
+                                         {"lives": u"nine"}, b"\x02\x02\nlives\x08nine\x00")):
+            fastbuff = BytesIO()
+            FastDatumWriter(spavro.schema.parse(schema)).write(datum, spavro.io.FastBinaryEncoder(fastbuff))
+            self.assertEqual(fastbuff.getvalue(), expected)
+        # a record whose keys fit is only taken when its check passes
+        schema = ('[{"type": "record", "name": "cat", "fields": [{"name": "lives", "type": "int"}]},'
+                  ' {"type": "record", "name": "tag", "fields": [{"name": "lives", "type": "string"},'
+                  ' {"name": "note", "type": ["null", "string"]}]}]')
+        fastbuff = BytesIO()
+        FastDatumWriter(spavro.schema.parse(schema)).write({"lives": u"nine"}, spavro.io.FastBinaryEncoder(fastbuff))
+        self.assertEqual(fastbuff.getvalue(), b"\x02\x08nine\x00")
+
+    def test_nullable_round_trip(self):
+        for schema, datum in (('["null", "string"]', u"caf\xe9"), ('["double", "null"]', 2.5),
+                              ('["null", "float"]', 0.5), ('["null", "bytes"]', b"\x00"),
+                              ('["null", "long"]', -1), ('["boolean", "null"]', None)):
+            parsed = spavro.schema.parse(schema)
+            fastbuff = BytesIO()
+            FastDatumWriter(parsed).write(datum, spavro.io.FastBinaryEncoder(fastbuff))
+            fastbuff.seek(0)
+            self.assertEqual(spavro.io.FastDatumReader(parsed).read(spavro.io.FastBinaryDecoder(fastbuff)), datum)
+
+    def test_invalid_nullable_value(self):
+        fdw = FastDatumWriter(spavro.schema.parse('["null", "int"]'))
+        with self.assertRaises(spavro.io.AvroTypeException):
+            fdw.write(u"1", spavro.io.FastBinaryEncoder(BytesIO()))
+
+    def test_unknown_hint(self):
+        fdw = FastDatumWriter(spavro.schema.parse(record_union))
+        with self.assertRaises(spavro.io.AvroTypeException):
+            fdw.write(Branch("bird", {"wings": 2}), spavro.io.FastBinaryEncoder(BytesIO()))
+        with self.assertRaises(TypeError):
+            py_binary.get_writer(spavro.schema.parse(record_union).to_json())(BytesIO(), Branch("bird", {}))
+
+    def test_tuple_records_are_not_hints(self):
+        # a record of two fields whose first value names a branch
+        schema = ["null", "string", {"type": "record", "name": "pair", "fields": [
+            {"name": "kind", "type": "string"}, {"name": "value", "type": "string"}]}]
+        for make_writer in (get_writer, py_binary.get_writer):
+            writer = make_writer(schema)
+            written = BytesIO()
+            writer(written, (u"string", u"x"))
+            self.assertEqual(written.getvalue(), b"\x04\x0cstring\x02x")
+            hinted = BytesIO()
+            writer(hinted, Branch("string", u"x"))
+            self.assertEqual(hinted.getvalue(), b"\x02\x02x")
+
+
+# a union of records defining named types that are used after the union
+lazy_schema = {"type": "record", "name": "envelope", "fields": [
+    {"name": "body", "type": [
+        "null",
+        {"type": "record", "name": "click", "fields": [
+            {"name": "target", "type": {"type": "enum", "name": "target", "symbols": ["LINK", "BUTTON"]}},
+            {"name": "parent", "type": ["null", "click"]}]},
+        {"type": "record", "name": "view", "fields": [
+            {"name": "pages", "type": {"type": "array", "items": "string"}}]}]},
+    {"name": "last_target", "type": ["null", "target"]},
+    {"name": "last_view", "type": ["null", "view"]}]}
+
+lazy_datum = {"body": {"target": u"BUTTON", "parent": {"target": u"LINK", "parent": None}},
+              "last_target": u"LINK", "last_view": {"pages": [u"a", u"b"]}}
+
+
+class TestLazyUnions(unittest.TestCase):
+    def test_lazy_round_trip(self):
+        expected = BytesIO()
+        get_writer(lazy_schema)(expected, lazy_datum)
+        fastbuff = BytesIO()
+        get_writer(lazy_schema, lazy=True)(fastbuff, lazy_datum)
+        self.assertEqual(fastbuff.getvalue(), expected.getvalue())
+        reader = get_reader(lazy_schema, lazy=True)
+        self.assertEqual(reader(BytesIO(expected.getvalue())), lazy_datum)
+        # the second read goes through the compiled branches
+        self.assertEqual(reader(BytesIO(expected.getvalue())), lazy_datum)
+
+    def test_names_are_bound_when_deferred(self):
+        reader = get_reader(lazy_schema, lazy=True)
+        # redefine the names the deferred branches use before reading
+        get_reader({"type": "record", "name": "target", "fields": [{"name": "x", "type": "int"}]})
+        get_reader({"type": "record", "name": "view", "fields": [{"name": "x", "type": "int"}]})
+        fastbuff = BytesIO()
+        get_writer(lazy_schema)(fastbuff, lazy_datum)
+        self.assertEqual(reader(BytesIO(fastbuff.getvalue())), lazy_datum)
+
+    def test_threads(self):
+        # a deferred branch compiles in one thread while another thread
+        # compiles a schema using a name the branch refers to
+        schema = {"type": "record", "name": "outer", "fields": [
+            {"name": "kind", "type": {"type": "enum", "name": "kind", "symbols": ["A", "B"]}},
+            {"name": "body", "type": ["null", {"type": "record", "name": "inner", "fields": [
+                {"name": "pad", "type": {"type": "record", "name": "pad", "fields": []}},
+                {"name": "k", "type": "kind"}]}]}]}
+        datum = {"kind": u"A", "body": {"pad": {}, "k": u"B"}}
+        fastbuff = BytesIO()
+        get_writer(schema)(fastbuff, datum)
+        compiling = threading.Event()
+
+        class SlowFactories(dict):
+            # looked up while compiling each record reader
+            def get(self, key, default=None):
+                compiling.set()
+                time.sleep(0.05)
+                return dict.get(self, key, default)
+        reader = get_reader(schema, lazy=True, record_factory=SlowFactories(unused=None))
+        results = []
+
+        def read():
+            results.append(reader(BytesIO(fastbuff.getvalue())))
+        thread = threading.Thread(target=read)
+        compiling.clear()
+        thread.start()
+        compiling.wait()
+        get_reader({"type": "record", "name": "kind", "fields": [{"name": "x", "type": "int"}]})
+        thread.join()
+        self.assertEqual(results, [datum])
+
+    def test_branches_compile_on_first_use(self):
+        schema = ["null", {"type": "record", "name": "broken", "fields": [{"name": "a", "type": "undefined"}]}]
+        reader = get_reader(schema, lazy=True)
+        writer = get_writer(schema, lazy=True)
+        self.assertIsNone(reader(BytesIO(b"\x00")))
+        writer(BytesIO(), None)
+        with self.assertRaises(KeyError):
+            reader(BytesIO(b"\x02\x00"))
 
 
-def create_write_case(schema, datum, expected):
+def create_write_case(schema, datum, expected, lazy):
     write_schema = spavro.schema.parse(schema)
 
     def test_write_good_data(self):
         fastbuff = BytesIO()
-        fastencoder = spavro.io.FastBinaryEncoder(fastbuff)
-        fdw = FastDatumWriter(write_schema)
-        fdw.write(datum, fastencoder)
+        if lazy:
+            get_writer(write_schema.to_json(), lazy=True)(fastbuff, datum)
+        else:
+            fastencoder = spavro.io.FastBinaryEncoder(fastbuff)
+            fdw = FastDatumWriter(write_schema)
+            fdw.write(datum, fastencoder)
         self.assertEqual(fastbuff.getvalue(), expected)
     return test_write_good_data
 
 
-def make_write_cases(cases):
+def make_write_cases(cases, kind):
     for name, datum, schema, expected in cases:
-        test_method = create_write_case(schema, datum, expected)
-        test_method.__name__ = 'test_simple_union_write_{}'.format(name)
-        setattr(TestUnionWriter, test_method.__name__, test_method)
+        for lazy in (False, True):
+            test_method = create_write_case(schema, datum, expected, lazy)
+            test_method.__name__ = 'test_{}_{}union_write_{}'.format(kind, 'lazy_' if lazy else '', name)
+            setattr(TestUnionWriter, test_method.__name__, test_method)
 
 
-make_write_cases(simple_write_cases)
+make_write_cases(simple_write_cases, 'simple')
+make_write_cases(complex_write_cases, 'complex')
@@ -0,0 +1,82 @@
+# Copyright (C) 2018 Pluralsight LLC
+
+import unittest
+import json
+import datetime
+
+import spavro.schema
+from spavro.io import DatumValidator
+
+
+order_schema = {"type": "record", "name": "order", "fields": [
+    {"name": "id", "type": "long"},
+    {"name": "payload", "type": {"type": "record", "name": "payload", "fields": [
+        {"name": "items", "type": {"type": "array", "items": {"type": "record", "name": "item", "fields": [
+            {"name": "sku", "type": "string"},
+            {"name": "price", "type": "double"}]}}},
+        {"name": "tags", "type": {"type": "map", "values": ["null", "int"]}},
+        {"name": "next", "type": ["null", "payload"]}]}}]}
+
+
+def order(**payload):
+    datum = {"items": [{"sku": u"a", "price": 1.5}], "tags": {}, "next": None}
+    datum.update(payload)
+    return {"id": 1, "payload": datum}
+
+
+# name, datum, failing path, or None for valid data
+validator_cases = (
+("valid", order(), None),
+("wrong_type_in_array", order(items=[{"sku": u"a", "price": 1.0}] * 3 + [{"sku": u"b", "price": u"x"}]),
+    "payload.items[3].price"),
+("missing_field", order(items=[{"price": 1.0}]), "payload.items[0].sku"),
+("not_a_record", {"id": 1, "payload": [1]}, "payload"),
+("map_value", order(tags={u"a": 1, u"b": u"2"}), 'payload.tags["b"]'),
+("long_overflow", {"id": 1 << 63, "payload": order()["payload"]}, "id"),
+("nested_union_branch", order(next=order(items=[{"sku": 5, "price": 1.0}])["payload"]),
+    "payload.next.items[0].sku"),
+("root", [], ""),
+)
+
+
+class TestValidator(unittest.TestCase):
+    def setUp(self):
+        self.validator = DatumValidator(spavro.schema.parse(json.dumps(order_schema)))
+
+    def test_validate_many(self):
+        records = [order(), order(items=[{"sku": None, "price": 1.0}]), order(), {"id": u"x"}]
+        errors = self.validator.validate_many(records)
+        self.assertEqual([(index, error.path) for index, error in errors], [(1, "payload.items[0].sku"), (3, "id")])
+        self.assertEqual(self.validator.validate_many([order()]), [])
+
+    def test_error_message(self):
+        error = self.validator.first_error({"id": u"x"})
+        self.assertEqual(error.message, "'x' is not an example of long")
+
+    def test_logical_types(self):
+        schema = spavro.schema.parse('{"type": "int", "logicalType": "date"}')
+        self.assertFalse(DatumValidator(schema).validate(datetime.date(2018, 1, 1)))
+        self.assertTrue(DatumValidator(schema, logical_types=True).validate(datetime.date(2018, 1, 1)))
+        self.assertTrue(DatumValidator(schema, logical_types=True).validate(17000))
+
+
+def create_case(datum, path):
+    def test_validator(self):
+        error = self.validator.first_error(datum)
+        if path is None:
+            self.assertIsNone(error)
+            self.assertTrue(self.validator.validate(datum))
+        else:
+            self.assertEqual(error.path, path)
+            self.assertFalse(self.validator.validate(datum))
+    return test_validator
+
+
+def make_cases(cases):
+    for name, datum, path in cases:
+        test_method = create_case(datum, path)
+        test_method.__name__ = 'test_validator_{}'.format(name)
+        setattr(TestValidator, test_method.__name__, test_method)
+
+
+make_cases(validator_cases)
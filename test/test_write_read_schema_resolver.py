@@ -1,12 +1,58 @@
 # Copyright (C) 2017 Pluralsight LLC
 
 import unittest
-from spavro.schema_resolve import resolve
+import json
+import spavro.schema
+from spavro import schema_resolve
+from spavro.schema_resolve import resolve, can_read, can_read_many, compatibility_report, Incompatibility
 from spavro.exceptions import SchemaResolutionException
 
 
 class TestResolver(unittest.TestCase):
-    pass
+    def test_identical_schemas_are_not_resolved(self):
+        schema = {"type": "record", "name": "r", "fields": [{"type": {"type": "enum", "name": "e", "symbols": ["A"]}, "name": "a"}]}
+        self.assertIs(resolve(schema, schema), schema)
+
+    def test_resolved_records_are_memoized(self):
+        writer = {"type": "record", "name": "big", "fields": [{"type": "int", "name": "f{}".format(idx)} for idx in range(500)]}
+        reader = {"type": "record", "name": "big", "fields": [{"type": "long", "name": "f{}".format(idx)} for idx in reversed(range(500))]}
+        resolved = resolve(writer, reader)
+        self.assertEqual([field['name'] for field in resolved['fields']], ["f{}".format(idx) for idx in range(500)])
+        self.assertIs(resolve(json.loads(json.dumps(writer)), json.loads(json.dumps(reader))), resolved)
+
+    def test_resolution_cache_is_bounded(self):
+        original = schema_resolve.RESOLUTION_CACHE_SIZE
+        schema_resolve.RESOLUTION_CACHE_SIZE = 4
+        try:
+            for idx in range(10):
+                resolve({"type": "record", "name": "r", "fields": [{"type": "int", "name": "f{}".format(idx)}]},
+                        {"type": "record", "name": "r", "fields": [{"type": "long", "name": "f{}".format(idx)}]})
+                self.assertLessEqual(len(schema_resolve.resolution_cache), 4)
+        finally:
+            schema_resolve.RESOLUTION_CACHE_SIZE = original
+
+    def test_compatibility_report_paths(self):
+        writer = {"type": "record", "name": "order", "fields": [
+            {"name": "items", "type": {"type": "array", "items": {"type": "record", "name": "item", "fields": [
+                {"name": "price", "type": "double"}]}}},
+            {"name": "status", "type": ["null", "string"]}]}
+        reader = {"type": "record", "name": "order", "fields": [
+            {"name": "items", "type": {"type": "array", "items": {"type": "record", "name": "item", "fields": [
+                {"name": "price", "type": "float"}]}}},
+            {"name": "status", "type": ["null", "int"]},
+            {"name": "created", "type": "long"}]}
+        self.assertEqual(compatibility_report(writer, reader), [
+            Incompatibility(u"items.items.price", u"Writer's double can't be read as float"),
+            Incompatibility(u"status[1]", u"Writer's string isn't in the reader's union"),
+            Incompatibility(u"created", u"Reader's field isn't in the writer's record and has no default")])
+
+    def test_one_reader_many_writers(self):
+        reader = spavro.schema.parse(json.dumps({"type": "record", "name": "r", "fields": [
+            {"name": "a", "type": "long"}, {"name": "b", "type": "string", "default": ""}]}))
+        writers = [{"type": "record", "name": "r", "fields": [{"name": "a", "type": "int"}]},
+                   {"type": "record", "name": "r", "fields": [{"name": "b", "type": "string"}]},
+                   {"type": "record", "name": "r", "fields": [{"name": "a", "type": "long"}, {"name": "b", "type": "string"}]}]
+        self.assertEqual(can_read_many(writers, reader), [True, False, True])
 
 
 pass_cases = (
@@ -55,7 +101,28 @@ pass_cases = (
 ("array_items_upgraded_to_union",
     {"type": "array", "items": "string"},
     {"type": "array", "items": ["int", "string"]},
-    {'items': 'string', 'type': 'array'})
+    {'items': 'string', 'type': 'array'}),
+("field_renamed_with_alias",
+    {"type": "record", "name": "r", "fields": [{"type": "int", "name": "old"}, {"type": "int", "name": "same"}]},
+    {"type": "record", "name": "r", "fields": [{"type": "long", "name": "same"},
+                                              {"type": "long", "name": "new", "aliases": ["old"]}]},
+    {"type": "record", "name": "r", "fields": [{"type": "int", "name": "new"}, {"type": "int", "name": "same"}]}),
+("exact_field_name_before_alias",
+    {"type": "record", "name": "r", "fields": [{"type": "int", "name": "old"}, {"type": "int", "name": "new"}]},
+    {"type": "record", "name": "r", "fields": [{"type": "long", "name": "new", "aliases": ["old"]}]},
+    {"type": "record", "name": "r", "fields": [{"type": {"type": "skip", "value": "int"}, "name": "old"},
+                                              {"type": "int", "name": "new"}]}),
+("record_renamed_with_alias",
+    {"type": "record", "name": "old", "fields": [{"type": "int", "name": "a"}]},
+    {"type": "record", "name": "new", "aliases": ["old"], "fields": [{"type": "long", "name": "a"}]},
+    {"type": "record", "name": "new", "fields": [{"type": "int", "name": "a"}]}),
+("union_branch_by_record_name",
+    ["null", {"type": "record", "name": "b", "fields": [{"type": "int", "name": "x"}]}],
+    [{"type": "record", "name": "a", "fields": [{"type": "int", "name": "x"}]},
+     {"type": "record", "name": "b", "fields": [{"type": "long", "name": "x"}]}, "null"],
+    ["null", {"type": "record", "name": "b", "fields": [{"type": "int", "name": "x"}]}]),
+("union_branch_promoted",
+    ["int", "string"], ["string", "double"], ["int", "string"]),
 )
 
 exception_cases = (
@@ -112,5 +179,22 @@ def make_exception_cases(cases):
         setattr(TestResolver, test_method.__name__, test_method)
 
 
+def create_compatibility_case(writer, reader, compatible):
+    def check_compatibility(self):
+        self.assertEqual(can_read(writer, reader), compatible)
+        self.assertEqual(not compatibility_report(writer, reader), compatible)
+    return check_compatibility
+
+
+def make_compatibility_cases(cases, compatible):
+    for case in cases:
+        name, writer, reader = case[:3]
+        test_method = create_compatibility_case(writer, reader, compatible)
+        test_method.__name__ = 'test_compatibility_{}'.format(name)
+        setattr(TestResolver, test_method.__name__, test_method)
+
+
 make_cases(pass_cases)
 make_exception_cases(exception_cases)
+make_compatibility_cases(pass_cases, True)
+make_compatibility_cases(exception_cases, False)